@@ -15,6 +15,7 @@ import logging
 
 from pytype import compat
 from pytype import function
+from pytype import memory_limit
 from pytype import utils
 from pytype.pyc import loadmarshal
 from pytype.pyc import opcodes
@@ -3164,6 +3165,11 @@ class InterpreterFunction(SignedFunction):
     yield
     self._store_call_records = old
 
+  def drop_call_records(self):
+    """Release the call records, see memory_limit.DROP_CALL_RECORDS."""
+    self._call_records = []
+    self.last_frame = None
+
   def _build_signature(self, name, annotations, late_annotations):
     """Build a function.Signature object representing this function."""
     vararg_name = None
@@ -3277,7 +3283,8 @@ class InterpreterFunction(SignedFunction):
       frame.allowed_returns = annotations.get(
           "return", self.vm.convert.unsolvable)
       frame.check_return = check_return
-    if self.vm.options.skip_repeat_calls:
+    reuse_calls = self.vm.memory_level_reached(memory_limit.REUSE_CALLS)
+    if self.vm.options.skip_repeat_calls or reuse_calls:
       callkey = self._hash_all(
           (callargs, None),
           (frame.f_globals.members, set(self.code.co_names)),
@@ -3294,7 +3301,8 @@ class InterpreterFunction(SignedFunction):
       # We would want to skip this optimization and reanalyze the call
       # if the all the possible types of the return value was unsolvable
       # and we can transverse the function deeper.
-      if (all(x == self.vm.convert.unsolvable for x in old_ret.data) and
+      if (not reuse_calls and
+          all(x == self.vm.convert.unsolvable for x in old_ret.data) and
           self.vm.remaining_depth() > old_remaining_depth):
         log.info("Reanalyzing %r because all of its call record's bindings are "
                  "Unsolvable; remaining_depth = %d,"
@@ -3,13 +3,14 @@
 import collections
 import logging
 import subprocess
-import sys
 
 
 from pytype import abstract
 from pytype import convert_structural
 from pytype import debug
+from pytype import errors
 from pytype import function
+from pytype import memory_limit
 from pytype import metrics
 from pytype import output
 from pytype import state as frame_state
@@ -330,6 +331,8 @@ class CallTracer(vm.VirtualMachine):
     return node
 
   def analyze_class(self, node, val):
+    if self.memory_level_reached(memory_limit.STOP_ANALYSIS):
+      return node
     self._analyzed_classes.add(val.data)
     node, clsvar, instance = self.init_class(node, val.data)
     good_instances = [b for b in instance.bindings
@@ -349,6 +352,8 @@ class CallTracer(vm.VirtualMachine):
     return node
 
   def analyze_function(self, node0, val):
+    if self.memory_level_reached(memory_limit.STOP_ANALYSIS):
+      return node0
     if val.data.is_attribute_of_class:
       # We'll analyze this function as part of a class.
       log.info("Analyze functions: Skipping class method %s", val.data.name)
@@ -387,11 +392,18 @@ class CallTracer(vm.VirtualMachine):
 
   def analyze(self, node, defs, maximum_depth):
     assert not self.frame
-    self.maximum_depth = sys.maxsize if maximum_depth is None else maximum_depth
+    self.set_maximum_depth(maximum_depth)
     self._analyzing = True
     node = node.ConnectNew(name="Analyze")
     return self.analyze_toplevel(node, defs)
 
+  def degrade(self, level):
+    super(CallTracer, self).degrade(level)
+    if level == memory_limit.DROP_CALL_RECORDS:
+      for f in self._interpreter_functions:
+        for value in f.bindings:
+          value.data.drop_call_records()
+
   def trace_module_member(self, module, name, member):
     if module is None or isinstance(module, typing.TypingOverlay):
       # TypingOverlay takes precedence over typing.pytd.
@@ -573,14 +585,49 @@ class CallTracer(vm.VirtualMachine):
             self.frames, combined, formal.get_instance_type(node))
 
 
+# A CallTracer that's ready to be rebound to the next run, see prepare_tracer.
+_template_tracer = None
+
+
+def prepare_tracer(options, loader):
+  """Set up the CallTracer of the next check_types or infer_types run.
+
+  Creating a VM converts the primitive classes and special builtins, and the
+  typing overlay is loaded by almost every file. For small files, that's a good
+  part of the analysis. The server and --batch call this before they fork their
+  workers, so that every worker starts with a VM that only needs to be rebound
+  to its own errorlog and options. The prepared tracer is used only once.
+
+  Args:
+    options: config.Options object.
+    loader: A load_pytd.Loader instance. The loader of the run has to share its
+      builtins, see load_pytd.share_precompiled_builtins.
+  """
+  global _template_tracer
+  _template_tracer = CallTracer(errorlog=errors.ErrorLog(), options=options,
+                                loader=loader)
+  _template_tracer.import_module("typing", "typing", 0)
+
+
+def _create_tracer(errorlog, options, loader, **kwargs):
+  """Create a CallTracer, or rebind the one from prepare_tracer."""
+  global _template_tracer
+  tracer, _template_tracer = _template_tracer, None
+  if (tracer and tracer.python_version == options.python_version and
+      tracer.loader.builtins is loader.builtins and
+      tracer.loader.typing is loader.typing):
+    tracer.rebind(errorlog, options, loader, **kwargs)
+    return tracer
+  return CallTracer(errorlog=errorlog, options=options,
+                    module_name=options.module_name, loader=loader, **kwargs)
+
+
 def check_types(src, filename, errorlog, options, loader,
                 deep=True, init_maximum_depth=INIT_MAXIMUM_DEPTH, **kwargs):
   """Verify a PyTD against the Python code."""
-  tracer = CallTracer(errorlog=errorlog, options=options,
-                      module_name=options.module_name,
-                      analyze_annotated=True,
-                      generate_unknowns=False,
-                      loader=loader, **kwargs)
+  tracer = _create_tracer(errorlog, options, loader,
+                          analyze_annotated=True,
+                          generate_unknowns=False, **kwargs)
   loc, defs = tracer.run_program(src, filename, init_maximum_depth)
   snapshotter = metrics.get_metric("memory", metrics.Snapshot)
   snapshotter.take_snapshot("analyze:check_types:tracer")
@@ -612,11 +659,9 @@ def infer_types(src, errorlog, options, loader,
   Raises:
     AssertionError: In case of a bad parameter combination.
   """
-  tracer = CallTracer(errorlog=errorlog, options=options,
-                      module_name=options.module_name,
-                      generate_unknowns=options.protocols,
-                      store_all_calls=not deep, loader=loader,
-                      **kwargs)
+  tracer = _create_tracer(errorlog, options, loader,
+                          generate_unknowns=options.protocols,
+                          store_all_calls=not deep, **kwargs)
   loc, defs = tracer.run_program(src, filename, init_maximum_depth)
   log.info("===Done running definitions and module-level code===")
   snapshotter = metrics.get_metric("memory", metrics.Snapshot)
@@ -657,6 +702,38 @@ def infer_types(src, errorlog, options, loader,
   return ast, builtins_pytd
 
 
+def check_and_infer_types(src, errorlog, options, loader, filename=None,
+                          deep=True, init_maximum_depth=INIT_MAXIMUM_DEPTH,
+                          **kwargs):
+  """Verify the Python code, and return its types, in one run of the VM.
+
+  This runs infer_types with the settings of check_types, so the errors are the
+  ones check_types would report: Functions with a return annotation are
+  analyzed, too, and the depth of the analysis is only limited with --quick.
+  The former doesn't change the types of annotated functions. The latter might
+  make the types of some functions more precise than with infer_types.
+
+  Args:
+    src: A string containing Python source code.
+    errorlog: Where error messages go. Instance of errors.ErrorLog.
+    options: config.Options object
+    loader: A load_pytd.Loader instance to load PYI information.
+    filename: Filename of the program we're parsing.
+    deep: If True, analyze all functions, even the ones not called by the main
+      execution flow.
+    init_maximum_depth: Depth of analysis during module loading.
+    **kwargs: Additional parameters to pass to vm.VirtualMachine
+  Returns:
+    Like infer_types, a tuple of a TypeDeclUnit and the builtins.
+  """
+  # check_types never generates unknowns, which would hide errors.
+  assert not options.protocols
+  return infer_types(src, errorlog, options, loader, filename=filename,
+                     deep=deep, init_maximum_depth=init_maximum_depth,
+                     maximum_depth=(2 if options.quick else None),
+                     analyze_annotated=True, **kwargs)
+
+
 def _maybe_output_debug(options, program):
   if options.output_cfg or options.output_typegraph:
     dot = debug.program_to_dot(program, set([]), bool(options.output_cfg))
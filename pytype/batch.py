@@ -0,0 +1,281 @@
+"""Analyze a set of Python files, generating .pyi files for dependencies first.
+
+This is what "pytype --batch=OUTPUT_DIR" runs. It scans the given files for
+imports, orders them so that every module is analyzed after the modules it
+imports, and generates a .pyi file for each of them in OUTPUT_DIR, which is put
+in front of the pythonpath. Files are analyzed in parallel, by a pool of
+workers forked from the main process (see server.WorkerPool), as soon as all
+their dependencies are done.
+
+Modules that import each other can't be ordered. For such a cycle, we first
+write a stub .pyi for each of its modules, in which every attribute is Any, and
+analyze all of them against the stubs. We then analyze them a second time,
+against the .pyi files from the first pass.
+
+Workers write a .pyi next to where it belongs, and it's only moved into place
+once every module of its cycle has finished the pass. So no module ever reads
+a .pyi that's still being written, or one from the pass that's running.
+"""
+
+import collections
+import logging
+import os
+import re
+import sys
+
+from pytype import load_pytd
+from pytype import server
+from pytype import utils
+
+
+log = logging.getLogger(__name__)
+
+
+# Stub for modules whose .pyi isn't available yet (or couldn't be generated).
+ANY_STUB = "from typing import Any\ndef __getattr__(name) -> Any: ...\n"
+
+
+_IMPORT_RE = re.compile(r"^[ \t]*import[ \t]+([^\n#;]+)", re.MULTILINE)
+_FROM_IMPORT_RE = re.compile(
+    r"^[ \t]*from[ \t]+(\.*)[ \t]*([\w.]*)[ \t]+import[ \t]+"
+    r"(\([^)]*\)|[^\n#;]*)", re.MULTILINE)
+
+
+def scan_imports(src):
+  """Find the imports in Python source code, without parsing it.
+
+  This is a quick, approximate scan: It doesn't understand strings or comments
+  spanning multiple lines, and it reports conditional imports and imports in
+  functions like any other. That's good enough for ordering files.
+
+  Args:
+    src: Python source code.
+
+  Returns:
+    A list of (level, module, names) tuples: "import a.b" gives (0, "a.b", ())
+    and "from ..a import b, c" gives (2, "a", ("b", "c")).
+  """
+  imports = []
+  for match in _IMPORT_RE.finditer(src):
+    for item in match.group(1).split(","):
+      name = item.split()[0] if item.split() else ""
+      if name:
+        imports.append((0, name, ()))
+  for match in _FROM_IMPORT_RE.finditer(src):
+    dots, module, names = match.groups()
+    names = tuple(item.split()[0] for item in names.strip("()").split(",")
+                  if item.split() and item.split()[0] != "*")
+    imports.append((len(dots), module, names))
+  return imports
+
+
+def imported_names(module_name, imports):
+  """All module names that the given imports might refer to.
+
+  Args:
+    module_name: The name of the importing module, for relative imports.
+    imports: A list as returned by scan_imports.
+
+  Yields:
+    Absolute module names. "from a import b" yields both "a" and "a.b", since
+    "b" might be a submodule.
+  """
+  for level, module, names in imports:
+    if level:
+      # Relative to the containing package. (For "a.b.__init__", that's "a.b".)
+      package = module_name.split(".")[:-1]
+      if level > 1:
+        package = package[:-(level - 1)]
+      base = ".".join(package + ([module] if module else []))
+    else:
+      base = module
+    if base:
+      yield base
+    for name in names:
+      yield base + "." + name if base else name
+
+
+class Module(object):
+  """A Python file to analyze.
+
+  Attributes:
+    filename: The name of the Python file.
+    name: The module name, e.g. "foo.bar" or "foo.__init__".
+    deps: The Modules (from the same batch) this module imports.
+  """
+
+  def __init__(self, filename, name):
+    self.filename = filename
+    self.name = name
+    self.deps = set()
+
+  def pyi_filename(self, output_dir):
+    return os.path.join(output_dir, *self.name.split(".")) + ".pyi"
+
+  def __repr__(self):
+    return "Module(%r)" % self.name
+
+
+def find_python_files(paths):
+  """Expand directories into the .py files they contain."""
+  for path in paths:
+    if os.path.isdir(path):
+      for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for f in sorted(files):
+          if f.endswith(".py"):
+            yield os.path.normpath(os.path.join(root, f))
+    else:
+      yield path
+
+
+def _module_name(filename, pythonpath):
+  # Compare absolute paths, so that e.g. "" matches files in the current
+  # directory however they are spelled.
+  name = load_pytd.get_module_name(
+      os.path.abspath(filename), [os.path.abspath(p) for p in pythonpath])
+  if not name or name.startswith("."):
+    # Not below any pythonpath entry.
+    name = os.path.splitext(os.path.basename(filename))[0]
+  return name
+
+
+def build_graph(paths, pythonpath):
+  """Create a Module for every Python file, and connect them by imports.
+
+  Args:
+    paths: Python files and directories containing Python files.
+    pythonpath: The pythonpath, to determine module names.
+
+  Returns:
+    A list of Module instances.
+
+  Raises:
+    IOError: If a file can't be read.
+  """
+  modules = []
+  by_name = {}
+  for filename in find_python_files(paths):
+    module = Module(filename, _module_name(filename, pythonpath))
+    modules.append(module)
+    if module.name.endswith(".__init__"):
+      by_name[module.name[:-len(".__init__")]] = module
+    by_name[module.name] = module
+  for module in modules:
+    with open(module.filename, "r") as f:
+      imports = scan_imports(f.read())
+    for name in imported_names(module.name, imports):
+      dep = by_name.get(name)
+      if dep is not None and dep is not module:
+        module.deps.add(dep)
+  return modules
+
+
+def _makedirs_for(filename):
+  dirname = os.path.dirname(filename)
+  if dirname and not os.path.isdir(dirname):
+    os.makedirs(dirname)
+
+
+def _write_file(filename, contents):
+  _makedirs_for(filename)
+  with open(filename, "w") as f:
+    f.write(contents)
+
+
+def _new_filename(pyi_filename):
+  """Where a worker writes a .pyi before it's moved into place."""
+  return pyi_filename + ".new"
+
+
+class _Component(object):
+  """State of an import cycle (or single module) during scheduling."""
+
+  def __init__(self, modules):
+    self.modules = modules
+    self.waiting_for = set()  # Components that need to be done first.
+    self.dependents = set()
+    self.passes = 2 if len(modules) > 1 else 1
+    self.running = 0
+
+
+def run(modules, process_file, output_dir, max_workers, stderr=None):
+  """Analyze modules in dependency order.
+
+  Args:
+    modules: A list of Module instances, e.g. from build_graph().
+    process_file: Runs in a worker. Called with a Module and a filename, should
+      write the module's .pyi to that file, and return an exit status.
+    output_dir: The directory for the .pyi files.
+    max_workers: How many files to analyze in parallel.
+    stderr: Where to write output of the workers. Defaults to sys.stderr.
+
+  Returns:
+    The number of modules whose analysis failed.
+  """
+  stderr = stderr or sys.stderr
+  components = [_Component(m)
+                for m in utils.strongly_connected_components(modules)]
+  component_of = {m: c for c in components for m in c.modules}
+  for c in components:
+    for m in c.modules:
+      for dep in m.deps:
+        if component_of[dep] is not c:
+          c.waiting_for.add(component_of[dep])
+          component_of[dep].dependents.add(c)
+  pool = server.WorkerPool(lambda args: process_file(*args), max_workers)
+  cwd = os.getcwd()
+  pending = collections.deque()  # (module, passes left) tuples.
+  failures = 0
+
+  def finish_pass(c):
+    for m in c.modules:
+      pyi_filename = m.pyi_filename(output_dir)
+      os.rename(_new_filename(pyi_filename), pyi_filename)
+
+  def schedule(c):
+    if c.passes > 1:
+      log.info("Import cycle: %s", ", ".join(m.name for m in c.modules))
+      for m in c.modules:
+        _write_file(m.pyi_filename(output_dir), ANY_STUB)
+    pending.extend((m, c.passes) for m in c.modules)
+    c.running = len(c.modules)
+
+  for c in components:
+    if not c.waiting_for:
+      schedule(c)
+  while pending or len(pool):
+    while pending and not pool.full():
+      module, passes_left = pending.popleft()
+      new_filename = _new_filename(module.pyi_filename(output_dir))
+      _makedirs_for(new_filename)
+      if os.path.exists(new_filename):
+        os.remove(new_filename)  # left behind by an earlier run
+      pool.start((module, passes_left), (module, new_filename), cwd)
+    finished, _ = pool.wait()
+    for (module, passes_left), (stdout, errors, returncode) in finished:
+      c = component_of[module]
+      final = passes_left == 1
+      if final:
+        stderr.write(stdout + errors)
+        if returncode:
+          failures += 1
+      new_filename = _new_filename(module.pyi_filename(output_dir))
+      if not os.path.exists(new_filename):
+        # The worker crashed before writing a .pyi. Let dependents at least
+        # import this module, and don't leave the output of an earlier pass or
+        # run behind.
+        _write_file(new_filename, ANY_STUB)
+      c.running -= 1
+      if c.running:
+        continue
+      finish_pass(c)
+      if not final:
+        pending.extend((m, passes_left - 1) for m in c.modules)
+        c.running = len(c.modules)
+        continue
+      for dependent in c.dependents:
+        dependent.waiting_for.remove(c)
+        if not dependent.waiting_for:
+          schedule(dependent)
+  return failures
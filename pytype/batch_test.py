@@ -0,0 +1,163 @@
+"""Tests for batch.py."""
+
+from __future__ import print_function
+
+import os
+import textwrap
+
+from pytype import batch
+from pytype import utils
+
+import six
+import unittest
+
+
+class ImportsTest(unittest.TestCase):
+  """Tests for scan_imports and imported_names."""
+
+  def testScanImports(self):
+    src = textwrap.dedent("""
+      import a
+      import b.c as d, e
+      from f import g
+      from .h import (i,
+                      j as k)
+      from .. import l  # comment
+      from m import *
+      def f():
+        import n
+    """)
+    self.assertEqual([(0, "a", ()),
+                      (0, "b.c", ()),
+                      (0, "e", ()),
+                      (0, "n", ()),
+                      (0, "f", ("g",)),
+                      (1, "h", ("i", "j")),
+                      (2, "", ("l",)),
+                      (0, "m", ())], batch.scan_imports(src))
+
+  def testImportedNames(self):
+    imports = [(0, "a.b", ()), (0, "c", ("d",)), (1, "", ("e",)),
+               (2, "f", ())]
+    self.assertEqual(["a.b", "c", "c.d", "x.y", "x.y.e", "x.f"],
+                     list(batch.imported_names("x.y.z", imports)))
+
+  def testImportedNamesFromInit(self):
+    self.assertEqual(["x.y", "x.y.e"],
+                     list(batch.imported_names("x.y.__init__",
+                                               [(1, "", ("e",))])))
+
+
+def _Modules(deps):
+  modules = {name: batch.Module(name + ".py", name) for name in deps}
+  for name, module in modules.items():
+    module.deps = {modules[d] for d in deps[name]}
+  return modules
+
+
+class GraphTest(unittest.TestCase):
+  """Tests for build_graph."""
+
+  def testBuildGraph(self):
+    with utils.Tempdir() as d:
+      d.create_file("foo/__init__.py", "from foo import bar")
+      d.create_file("foo/bar.py", "import os")
+      d.create_file("baz.py", "import foo\nimport qux")
+      modules = {m.name: m for m in batch.build_graph([d.path], [d.path])}
+      six.assertCountEqual(self, ["foo.__init__", "foo.bar", "baz"], modules)
+      self.assertEqual(os.path.join(d.path, "foo", "bar.py"),
+                       modules["foo.bar"].filename)
+      self.assertEqual({modules["foo.bar"]}, modules["foo.__init__"].deps)
+      self.assertEqual(set(), modules["foo.bar"].deps)
+      self.assertEqual({modules["foo.__init__"]}, modules["baz"].deps)
+
+  def testPyiFilename(self):
+    self.assertEqual(os.path.join("out", "foo", "__init__.pyi"),
+                     batch.Module("foo/__init__.py",
+                                  "foo.__init__").pyi_filename("out"))
+
+
+class RunTest(unittest.TestCase):
+  """Tests for batch.run."""
+
+  def _Run(self, modules, output_dir, max_workers=2):
+    log_file = os.path.join(output_dir, "log")
+    def ProcessFile(module, output_filename):
+      # Record which .pyi files of dependencies we saw.
+      seen = []
+      for dep in sorted(module.deps, key=lambda m: m.name):
+        with open(dep.pyi_filename(output_dir)) as f:
+          pyi = f.read()
+        seen.append(dep.name + ":" + ("stub" if pyi == batch.ANY_STUB else pyi))
+      with open(log_file, "a") as f:
+        f.write("%s %s\n" % (module.name, " ".join(seen)))
+      if module.name == "bad":
+        print("error in bad")
+        return 1
+      with open(output_filename, "w") as f:
+        f.write(module.name)
+      if module.name == "errors":
+        print("error in errors")
+        return 1
+    stderr = six.moves.StringIO()
+    failures = batch.run(list(modules.values()), ProcessFile, output_dir,
+                         max_workers, stderr=stderr)
+    with open(log_file) as f:
+      return failures, stderr.getvalue(), f.read().splitlines()
+
+  def testOrder(self):
+    modules = _Modules({"a": ["b", "c"], "b": ["c"], "c": [], "d": []})
+    with utils.Tempdir() as d:
+      failures, _, log = self._Run(modules, d.path)
+      self.assertEqual(0, failures)
+      six.assertCountEqual(self, ["a b:b c:c", "b c:c", "c ", "d "], log)
+      self.assertLess(log.index("c "), log.index("b c:c"))
+      self.assertLess(log.index("b c:c"), log.index("a b:b c:c"))
+      with open(os.path.join(d.path, "a.pyi")) as f:
+        self.assertEqual("a", f.read())
+
+  def testCycle(self):
+    modules = _Modules({"x": ["y"], "y": ["x"]})
+    with utils.Tempdir() as d:
+      failures, _, log = self._Run(modules, d.path, max_workers=1)
+      self.assertEqual(0, failures)
+      # First pass against stubs, second pass against the first pass.
+      self.assertEqual(["x y:stub", "y x:stub", "x y:y", "y x:x"],
+                       log)
+
+  def testFailure(self):
+    modules = _Modules({"bad": [], "user": ["bad"]})
+    with utils.Tempdir() as d:
+      failures, stderr, log = self._Run(modules, d.path)
+      self.assertEqual(1, failures)
+      self.assertEqual("error in bad\n", stderr)
+      self.assertEqual(["bad ", "user bad:stub"], log)
+
+  def testFailureOverwritesStaleOutput(self):
+    modules = _Modules({"bad": [], "user": ["bad"]})
+    with utils.Tempdir() as d:
+      d.create_file("bad.pyi", "stale = ...  # type: int")
+      failures, _, log = self._Run(modules, d.path)
+      self.assertEqual(1, failures)
+      self.assertEqual(["bad ", "user bad:stub"], log)
+      with open(os.path.join(d.path, "bad.pyi")) as f:
+        self.assertEqual(batch.ANY_STUB, f.read())
+
+  def testErrorsKeepOutput(self):
+    modules = _Modules({"errors": [], "user": ["errors"]})
+    with utils.Tempdir() as d:
+      failures, stderr, log = self._Run(modules, d.path)
+      self.assertEqual(1, failures)
+      self.assertEqual("error in errors\n", stderr)
+      self.assertEqual(["errors ", "user errors:errors"], log)
+
+  def testNested(self):
+    modules = {"foo.bar": batch.Module("foo/bar.py", "foo.bar")}
+    with utils.Tempdir() as d:
+      failures, _, _ = self._Run(modules, d.path)
+      self.assertEqual(0, failures)
+      self.assertTrue(os.path.exists(os.path.join(d.path, "foo", "bar.pyi")))
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -43,6 +43,12 @@ class Options(object):
     """
     o = self._options()
     self._options, arguments = o.parse_args(argv)
+    if self._options.batch:
+      # All arguments are inputs, see batch.py.
+      self.batch_inputs = arguments[1:]
+      arguments = arguments[:1]
+    else:
+      self.batch_inputs = []
     self._options.input, output = _parse_arguments(arguments[1:])
     if output:
       if self._options.output:
@@ -74,6 +80,16 @@ class Options(object):
         "-C", "--check", action="store_true",
         dest="check",
         help=("Don't do type inference. Only check for type errors."))
+    o.add_option(
+        "--check-and-infer", action="store_true",
+        dest="check_and_infer", default=False,
+        help=("With an output file (or --batch), check for type errors like "
+              "--check does, and infer the .pyi file, in one run. The .pyi is "
+              "inferred with the settings of --check: annotated functions "
+              "are analyzed too, and calls are followed to any depth (2 with "
+              "--quick) instead of 3 (1 with --quick). So the .pyi can differ "
+              "from the one inferred without --check-and-infer, and the run "
+              "can take longer."))
     o.add_option(
         "--check_preconditions", action="store_true",
         dest="check_preconditions", default=False,
@@ -92,6 +108,36 @@ class Options(object):
         help=("Saves the ast representation of the inferred pyi as a pickled "
               "file. The value of this parameter is the destination filename "
               "for the pickled data."))
+    o.add_option(
+        "--pyi-cache", type="string", action="store",
+        dest="pyi_cache", default=None,
+        help=("Directory for caching parsed pyi files of dependencies. Can be "
+              "shared between concurrent pytype processes."))
+    o.add_option(
+        "--pyi-cache-size", type="int", action="store",
+        dest="pyi_cache_size", default=256,
+        help=("With --pyi-cache: The maximum size of the cache, in "
+              "megabytes."))
+    o.add_option(
+        "--lazy-pyi", action="store_true",
+        dest="lazy_pyi", default=False,
+        help=("Load large pyi files one declaration at a time, as other "
+              "pyi files refer to them. Modules that the analyzed file "
+              "imports itself are still loaded in full; this only saves "
+              "time on the modules those depend on."))
+    o.add_option(
+        "--max-memory", type="int", action="store",
+        dest="max_memory", default=0,
+        help=("A soft limit on the memory use of pytype, in megabytes. When "
+              "getting close to it, pytype analyzes the code less deeply, "
+              "and reports that it did so. See pytype/memory_limit.py."))
+    o.add_option(
+        "--parse-processes", type="int", action="store",
+        dest="parse_processes", default=0,
+        help=("Parse the pyi files of dependencies (and with "
+              "--generate-builtins, resolve them) in up to this many "
+              "processes, forked from the main one. Defaults to the number "
+              "of CPUs with --generate-builtins, and to 1 otherwise."))
     o.add_option(
         "--parse-pyi", action="store_true",
         dest="parse_pyi", default=False,
@@ -99,7 +145,8 @@ class Options(object):
     o.add_option(
         "--imports_info", type="string", action="store",
         dest="imports_map", default=None,
-        help=("Information for mapping import .pytd to files. "
+        help=("Information for mapping import .pytd to files, as text or "
+              "compiled by pytype-imports-map. "
               "This options is incompatible with --pythonpath."))
     o.add_option(
         "-m", "--main", action="store_true",
@@ -231,6 +278,27 @@ class Options(object):
         dest="memory_snapshots",
         help=("Enable tracemalloc snapshot metrics. Currently requires "
               "a version of Python with tracemalloc patched in."))
+    o.add_option(
+        "--server", type="string", action="store",
+        dest="server", default=None,
+        help=("Run as a server, analyzing files for pytype-client on the "
+              "given Unix socket. The builtins are loaded once, and shared "
+              "between requests."))
+    o.add_option(
+        "--workers", type="int", action="store",
+        dest="workers", default=0,
+        help=("With --server: Process up to this many requests in parallel, "
+              "each in a fresh process forked from the warm server. "
+              "By default (0), requests are processed one at a time, in "
+              "the server process itself. "
+              "With --batch: Analyze up to this many files in parallel. "
+              "By default (0), as many as there are CPUs."))
+    o.add_option(
+        "--batch", type="string", action="store",
+        dest="batch", default=None,
+        help=("Analyze all the files (and directories of files) given as "
+              "arguments, dependencies first, writing a .pyi file for each "
+              "of them to the given output directory."))
     o.add_option(
         "--show-config", action="store_true",
         dest="show_config",
@@ -277,9 +345,14 @@ class Options(object):
                       for k, v in sorted(six.iteritems(self.__dict__))
                       if not k.startswith("_")])
 
-  @uses(["output"])
+  @uses(["output", "batch"])
   def _store_check(self, check):
-    if check is None:
+    if self.batch:
+      if check:
+        raise optparse.OptionConflictError("Not allowed with --batch", "check")
+      # Dependents need the .pyi files.
+      self.check = False
+    elif check is None:
       self.check = not self.output
     elif self.output:
       raise optparse.OptionConflictError("Not allowed with an output file",
@@ -287,6 +360,59 @@ class Options(object):
     else:
       self.check = check
 
+  @uses(["output", "batch", "protocols"])
+  def _store_check_and_infer(self, check_and_infer):
+    if check_and_infer:
+      if not self.output and not self.batch:
+        raise optparse.OptionConflictError(
+            "Can't use without --output or --batch", "check-and-infer")
+      if self.protocols:
+        raise optparse.OptionConflictError("Not allowed with --protocols",
+                                           "check-and-infer")
+    self.check_and_infer = check_and_infer
+
+  @uses(["input"])
+  def _store_server(self, server):
+    if server and self.input:
+      raise optparse.OptionConflictError("Not allowed with an input file",
+                                         "server")
+    self.server = server
+
+  @uses(["server", "batch"])
+  def _store_workers(self, workers):
+    if workers < 0:
+      raise optparse.OptParseError("--workers must not be negative")
+    if workers and not self.server and not self.batch:
+      raise optparse.OptionConflictError(
+          "Only allowed with --server or --batch", "workers")
+    self.workers = workers
+
+  def _store_max_memory(self, max_memory):
+    if max_memory < 0:
+      raise optparse.OptParseError("--max-memory must not be negative")
+    self.max_memory = max_memory
+
+  def _store_parse_processes(self, parse_processes):
+    if parse_processes < 0:
+      raise optparse.OptParseError("--parse-processes must not be negative")
+    self.parse_processes = parse_processes
+
+  @uses(["server", "output", "imports_map"])
+  def _store_batch(self, batch):
+    if batch:
+      if not self.batch_inputs:
+        raise optparse.OptParseError("Need files to analyze with --batch.")
+      if self.server:
+        raise optparse.OptionConflictError("Not allowed with --server",
+                                           "batch")
+      if self.output:
+        raise optparse.OptionConflictError("Not allowed with an output file",
+                                           "batch")
+      if self.imports_map:
+        raise optparse.OptionConflictError("Not allowed with --imports_info",
+                                           "batch")
+    self.batch = batch
+
   @uses(["output"])
   def _store_output_pickled(self, filename):
     if filename is not None and self.output is None:
@@ -294,7 +420,7 @@ class Options(object):
                                          "output_pickled")
     self.output_pickled = filename
 
-  @uses(["input", "show_config", "pythonpath"])
+  @uses(["input", "show_config", "pythonpath", "server", "batch"])
   def _store_generate_builtins(self, generate_builtins):
     """Store the generate-builtins option."""
     if generate_builtins:
@@ -306,7 +432,8 @@ class Options(object):
             "Not allowed with --pythonpath", "generate-builtins")
       # Set the default pythonpath to [] rather than [""]
       self.pythonpath = []
-    elif not self.input and not self.show_config:
+    elif (not self.input and not self.show_config and not self.server and
+          not self.batch):
       raise optparse.OptParseError("Need a filename.")
     self.generate_builtins = generate_builtins
 
@@ -25,6 +25,18 @@ class ConfigTest(unittest.TestCase):
     self.assertEqual(opts.output, "out.pyi")
     self.assertEqual(opts.input, "test.py")
 
+  def test_check_and_infer(self):
+    opts = config.Options(["pytype", "--check-and-infer", "test.py:out.pyi"])
+    self.assertTrue(opts.check_and_infer)
+    self.assertFalse(opts.check)
+    self.assertEqual(opts.output, "out.pyi")
+
+  def test_check_and_infer_conflicts(self):
+    for argv in (["test.py"], ["--check", "test.py"],
+                 ["--protocols", "test.py:out.pyi"]):
+      self.assertRaises(config.OptParseError, config.Options,
+                        ["pytype", "--check-and-infer"] + argv)
+
 
 if __name__ == "__main__":
   test_base.main()
@@ -2,6 +2,7 @@
 
 import logging
 import types
+import weakref
 
 
 from pytype import abstract
@@ -24,6 +25,57 @@ log = logging.getLogger(__name__)
 
 MAX_IMPORT_DEPTH = 12
 
+# The most keys _pytd_cache_key keeps per loader.
+MAX_PYTD_CACHE_KEYS = 100000
+
+
+class _PytdCacheKey(tuple):
+  """A key of Converter._convert_cache that computes its hash only once.
+
+  Hashing a pytd node hashes all of its children, which for a class means all
+  of its methods. So keys containing one are expensive to look up.
+  """
+
+  def __new__(cls, key):
+    self = super(_PytdCacheKey, cls).__new__(cls, key)
+    self._hash = tuple.__hash__(self)
+    return self
+
+  def __hash__(self):
+    return self._hash
+
+
+# The _PytdCacheKeys of the Converters of every loader, by the first item and
+# the id of the pytd node in the key. VMs that analyze one file after another
+# with the same loader (e.g. in batch or server mode) convert the same nodes,
+# above all those of the builtins, so this saves hashing them again for every
+# file. The keys keep their nodes alive, so the ids stay valid for as long as
+# they are cached, and they're dropped along with their loader, so that they
+# don't keep the trees of loaders that are gone.
+_pytd_cache_keys = weakref.WeakKeyDictionary()
+
+
+def _pytd_cache_key(loader, *key):
+  """Get the key for Converter._convert_cache of a key with a pytd node.
+
+  Args:
+    loader: The load_pytd.Loader of the VM.
+    *key: The items of the key. The second item is the pytd node.
+
+  Returns:
+    A key that is equal to key, with the same hash.
+  """
+  keys = _pytd_cache_keys.get(loader)
+  if keys is None:
+    keys = _pytd_cache_keys[loader] = {}
+  index = (key[0], id(key[1]))
+  cached = keys.get(index)
+  if cached is None:
+    if len(keys) >= MAX_PYTD_CACHE_KEYS:
+      keys.clear()
+    cached = keys[index] = _PytdCacheKey(key)
+  return cached
+
 
 class Converter(object):
   """Functions for creating the classes in abstract.py."""
@@ -85,7 +137,9 @@ class Converter(object):
       else:
         instance = abstract.Instance(cls, self.vm)
       self.primitive_class_instances[name] = instance
-      self._convert_cache[(abstract.Instance, cls.pytd_cls)] = instance
+      self._convert_cache[
+          _pytd_cache_key(self.vm.loader, abstract.Instance,
+                          cls.pytd_cls)] = instance
 
     self.none_type = self.primitive_classes[compat.NoneType]
     self.oldstyleclass_type = self.primitive_classes[compat.OldStyleClassType]
@@ -440,7 +494,10 @@ class Converter(object):
       The converted constant. (Instance of AtomicAbstractValue)
     """
     node = node or self.vm.root_cfg_node
-    key = ("constant", pyval, type(pyval))
+    if isinstance(pyval, (pytd.Class, pytd.Function, pytd.Type)):
+      key = _pytd_cache_key(self.vm.loader, "constant", pyval, type(pyval))
+    else:
+      key = ("constant", pyval, type(pyval))
     if key in self._convert_cache:
       if self._convert_cache[key] is None:
         # This error is triggered by, e.g., classes inheriting from each other.
@@ -680,7 +737,7 @@ class Converter(object):
       elif isinstance(cls, pytd.Class):
         assert not cls.template
         # This key is also used in __init__
-        key = (abstract.Instance, cls)
+        key = _pytd_cache_key(self.vm.loader, abstract.Instance, cls)
         if key not in self._convert_cache:
           if cls.name in ["__builtin__.type", "__builtin__.property"]:
             # An instance of "type" or of an anonymous property can be anything.
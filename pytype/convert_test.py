@@ -1,8 +1,11 @@
 """Tests for convert.py."""
 
+import gc
+import weakref
 
 from pytype import abstract
 from pytype import config
+from pytype import convert
 from pytype import errors
 from pytype import load_pytd
 from pytype import utils
@@ -314,6 +317,43 @@ class ConvertTest(unittest.TestCase):
         abstract.AsInstance(pyval), {}, self._vm.root_cfg_node)
     self.assertEqual(v, self._vm.convert.primitive_class_instances[int])
 
+  def test_share_pytd_cache_keys(self):
+    loader = self._vm.loader
+    other_vm = vm.VirtualMachine(
+        errors.ErrorLog(), config.Options.create(), loader)
+    pyval = loader.builtins.Lookup("__builtin__.str")
+    key = convert._pytd_cache_key(loader, "constant", pyval, type(pyval))
+    self.assertIs(key, convert._pytd_cache_key(
+        loader, "constant", pyval, type(pyval)))
+    self.assertEqual(key, ("constant", pyval, type(pyval)))
+    self.assertEqual(hash(key), hash(("constant", pyval, type(pyval))))
+    self.assertIs(self._vm.convert.constant_to_value(pyval),
+                  self._vm.convert.str_type)
+    self.assertIs(other_vm.convert.constant_to_value(pyval),
+                  other_vm.convert.str_type)
+
+  def test_clear_pytd_cache_keys(self):
+    pyval = self._vm.loader.builtins.Lookup("__builtin__.str")
+    convert._pytd_cache_keys[self._vm.loader].clear()
+    self.assertIs(self._vm.convert.constant_to_value(pyval),
+                  self._vm.convert.str_type)
+    instance = self._vm.convert.constant_to_value(abstract.AsInstance(pyval))
+    self.assertIs(instance, self._vm.convert.primitive_class_instances[str])
+
+  def test_pytd_cache_keys_per_loader(self):
+    loader = load_pytd.Loader(None, self.PYTHON_VERSION)
+    other_vm = vm.VirtualMachine(
+        errors.ErrorLog(), config.Options.create(), loader)
+    self.assertIn(loader, convert._pytd_cache_keys)
+    self.assertIsNot(convert._pytd_cache_keys[loader],
+                     convert._pytd_cache_keys[self._vm.loader])
+    # The keys don't outlive their loader.
+    loader_ref = weakref.ref(loader)
+    num_loaders = len(convert._pytd_cache_keys)
+    del other_vm, loader
+    gc.collect()
+    self.assertIsNone(loader_ref())
+    self.assertEqual(len(convert._pytd_cache_keys), num_loaders - 1)
 
 if __name__ == "__main__":
   unittest.main()
@@ -2,12 +2,35 @@
 
 import collections
 import logging
+import mmap
 import os
+import re
+import struct
 import textwrap
+import zlib
+
+from pytype import compat
 
 log = logging.getLogger(__name__)
 
 
+# The layout of a compiled imports map, see compile_imports_map():
+#   _MAGIC
+#   _HEADER: the number of entries, and the number of hash table slots
+#   the hash table: one _UINT per slot, the index of an entry plus one, or 0
+#   the offsets of the entries in the strings, one _UINT per entry plus one
+#   the strings: every entry is a short path, a path, and "p" if the short path
+#     is the __init__ of a package of another entry (or ""), separated by "\0"
+_MAGIC = b"PYTYPE-IMPORTS-MAP-1\n"
+_HEADER = struct.Struct("<II")
+_UINT = struct.Struct("<I")
+
+
+def _hash(key):
+  # Unlike hash(), the same across Python versions and processes.
+  return zlib.crc32(key) & 0xffffffff
+
+
 def _read_imports_map(options_info_path):
   """Read the imports_map file, fold duplicate entries into a multimap."""
   if options_info_path is None:
@@ -26,6 +49,108 @@ def _read_imports_map(options_info_path):
           for short_path, paths in imports_multimap.items()}
 
 
+def _pick_paths(imports_multimap):
+  """Keep the first path of every short path of a multimap."""
+  # Output warnings for all multiple
+  # mappings and keep the lexicographically first.
+  for short_path, paths in imports_multimap.items():
+    if len(paths) > 1:
+      log.warn("Multiple files for %r => %r ignoring %r",
+               short_path, paths[0], paths[1:])
+  return {short_path: paths[0]
+          for short_path, paths in imports_multimap.items()}
+
+
+def _add_init_dirs(imports_map):
+  """Add the directories of the short paths of an imports map."""
+  # Add the potential directory nodes for adding "__init__", because some build
+  # systems automatically create __init__.py in empty directories. These are
+  # added with the path name appended with "/" (os.sep), mapping to the empty
+  # file.  See also load_pytd._import_file which also checks for an empty
+  # directory and acts as if an empty __init__.py is there.
+  # TODO(pludemann): remove either this code or the code in pytd_load.
+  dir_paths = dict(imports_map)
+  for intermediate_dir_init in sorted(_package_inits(imports_map)):
+    if intermediate_dir_init not in dir_paths:
+      log.warn("Created empty __init__ %r", intermediate_dir_init)
+      dir_paths[intermediate_dir_init] = os.devnull
+  return dir_paths
+
+
+def _package_inits(short_paths):
+  """The __init__ short paths of the directories of the given short paths."""
+  inits = set()
+  for short_path in short_paths:
+    short_path_pieces = short_path.split(os.sep)
+    # If we have a mapping file foo/bar/quux.py', then the pieces are ["foo",
+    # "bar", "quux"] and we want to add foo/__init__.py and foo/bar/__init__.py
+    for i in range(1, len(short_path_pieces)):
+      inits.add(os.path.join(*(short_path_pieces[:i] + ["__init__"])))
+  return inits
+
+
+def _is_output(path, output):
+  """Whether a path of the imports map is (a version of) the output file.
+
+  It's not helpful for a file that's being analyzed to import its own pyi,
+  because we're trying to update that information! This _usually_ isn't a
+  problem, but it can be if an __init__.py imports one of its submodules -- the
+  submodule will be read as an Any from the pyi. So every entry whose path is
+  the output file, up to the extension (e.g. out/foo.pyi~ for out/foo.pyi, but
+  not out/foo_lib.pyi), is left out of the imports map, in both formats. The
+  __init__ of a package of other entries is mapped to the empty file instead,
+  so that they can still be imported.
+
+  Args:
+    path: An absolute path from the imports map.
+    output: The output file from the command line, or None.
+  Returns:
+    True if the entry of the path should be left out (or emptied).
+  """
+  if not output:
+    return False
+  stem = os.path.splitext(output)[0].lstrip(os.sep)
+  sep = re.escape(os.sep)
+  return re.search(r"(^|%s)%s\.[^%s]*$" % (sep, re.escape(stem), sep),
+                   path) is not None
+
+
+def _create_output(output):
+  """Create the output file with temporary contents."""
+  # If pytype is processing multiple files that import each other, during the
+  # first pass, we don't have a .pyi for them yet, even though they might be
+  # mentioned in the imports_map. So fill them with temporary contents.
+  if os.path.exists(output):
+    log.error("output file %r already exists; will be overwritten",
+              os.path.abspath(output))
+  with open(output, "w") as fi:
+    fi.write(textwrap.dedent("""\
+        # If you see this comment, it means pytype hasn't properly
+        # processed %r.
+        from typing import Any
+        def __getattr__(name) -> Any: ...
+    """ % output))
+
+
+def _validate_path(short_path, path):
+  """Validate an entry of the imports map.
+
+  Args:
+    short_path: The short path of the entry.
+    path: The path it is mapped to.
+  Raises:
+    AssertionError: If the path doesn't exist.
+  """
+  if not os.path.exists(path):
+    log.error("imports_map file does not exist: %r (mapped from %r)",
+              path, short_path)
+    log.error("tree walk of files from '.' (%r):", os.path.abspath("."))
+    for dirpath, _, files in os.walk(".", followlinks=False):
+      log.error("... dir %r: %r", dirpath, files)
+    log.error("end tree walk of files from '.'")
+    raise AssertionError("bad import map")
+
+
 def _validate_map(imports_map, output):
   """Validate the imports map against the command line arguments.
 
@@ -39,32 +164,157 @@ def _validate_map(imports_map, output):
   Raises:
     AssertionError: If we found an error in the imports map.
   """
-  # If pytype is processing multiple files that import each other, during the
-  # first pass, we don't have a .pyi for them yet, even though they might be
-  # mentioned in the imports_map. So fill them with temporary contents.
   if output is not None:
-    if os.path.exists(output):
-      log.error("output file %r already exists; will be overwritten",
-                os.path.abspath(output))
-    with open(output, "w") as fi:
-      fi.write(textwrap.dedent("""\
-          # If you see this comment, it means pytype hasn't properly
-          # processed %r.
-          from typing import Any
-          def __getattr__(name) -> Any: ...
-      """ % output))
+    _create_output(output)
 
   # Now, validate the imports_map.
   for short_path, paths in imports_map.items():
     for path in paths:
-      if not os.path.exists(path):
-        log.error("imports_map file does not exist: %r (mapped from %r)",
-                  path, short_path)
-        log.error("tree walk of files from '.' (%r):", os.path.abspath("."))
-        for dirpath, _, files in os.walk(".", followlinks=False):
-          log.error("... dir %r: %r", dirpath, files)
-        log.error("end tree walk of files from '.'")
-        raise AssertionError("bad import map")
+      _validate_path(short_path, path)
+
+
+class CompiledImportsMap(object):
+  """An imports map in the format written by compile_imports_map().
+
+  The file is memory-mapped and searched in place, so opening it doesn't depend
+  on the size of the map. Every path is made absolute, and checked for
+  existence, when it is first looked up. Supports the read-only dictionary
+  operations the loader uses.
+  """
+
+  def __init__(self, filename, output=None):
+    """Constructor.
+
+    Args:
+      filename: The compiled imports map.
+      output: The output file from the command line. Paths containing its name
+        (without extension) are left out of the map.
+    Raises:
+      ValueError: If the file isn't a compiled imports map.
+    """
+    with open(filename, "rb") as fi:
+      self._data = mmap.mmap(fi.fileno(), 0, access=mmap.ACCESS_READ)
+    if self._data[:len(_MAGIC)] != _MAGIC:
+      raise ValueError("Not a compiled imports map: %r" % filename)
+    self._len, self._slots = _HEADER.unpack_from(self._data, len(_MAGIC))
+    self._table = len(_MAGIC) + _HEADER.size
+    self._offsets = self._table + self._slots * _UINT.size
+    self._strings = self._offsets + (self._len + 1) * _UINT.size
+    self._output = output
+    self._validated = set()  # indices of the entries checked for existence
+    self._len_without_output = None  # computed by __len__
+
+  def _entry(self, index):
+    start, = _UINT.unpack_from(self._data, self._offsets + index * _UINT.size)
+    end, = _UINT.unpack_from(self._data,
+                             self._offsets + (index + 1) * _UINT.size)
+    short_path, path, package = self._data[
+        self._strings + start:self._strings + end].split(b"\0", 2)
+    return (compat.native_str(short_path), compat.native_str(path),
+            bool(package))
+
+  def _find(self, short_path):
+    """The index of the entry of a short path, or None."""
+    key = compat.bytestring(short_path) + b"\0"
+    slot = _hash(key) & (self._slots - 1)
+    while True:
+      index, = _UINT.unpack_from(self._data, self._table + slot * _UINT.size)
+      if not index:
+        return None
+      index -= 1
+      start, = _UINT.unpack_from(self._data,
+                                 self._offsets + index * _UINT.size)
+      start += self._strings
+      if self._data[start:start + len(key)] == key:
+        return index
+      slot = (slot + 1) & (self._slots - 1)
+
+  def _path(self, index, validate):
+    short_path, path, package = self._entry(index)
+    path = os.path.abspath(path)
+    if _is_output(path, self._output):
+      return os.devnull if package else None
+    if validate and index not in self._validated:
+      _validate_path(short_path, path)
+      self._validated.add(index)
+    return path
+
+  def get(self, short_path, default=None):
+    index = self._find(short_path)
+    path = None if index is None else self._path(index, validate=True)
+    return default if path is None else path
+
+  def __getitem__(self, short_path):
+    path = self.get(short_path)
+    if path is None:
+      raise KeyError(short_path)
+    return path
+
+  def __contains__(self, short_path):
+    return self.get(short_path) is not None
+
+  def __len__(self):
+    # Entries left out because of the output file don't count, so this needs
+    # to look at every path, once.
+    if self._len_without_output is None:
+      self._len_without_output = sum(1 for _ in self.items())
+    return self._len_without_output
+
+  def __nonzero__(self):
+    # Unlike __len__, only looks at paths until it finds one that's in the map.
+    return any(True for _ in self.items())
+
+  __bool__ = __nonzero__
+
+  def items(self):
+    """All (short path, path) pairs, without checking the paths."""
+    for index in range(self._len):
+      path = self._path(index, validate=False)
+      if path is not None:
+        yield self._entry(index)[0], path
+
+
+def compile_imports_map(options_info_path, filename):
+  """Convert an imports_info file into a compiled imports map.
+
+  The compiled map contains the result of build_imports_map, except that the
+  paths are stored as they are in the imports_info file, and are only made
+  absolute and validated by CompiledImportsMap.
+
+  Args:
+    options_info_path: The imports_info file.
+    filename: The file to write the compiled map to.
+  """
+  imports_map = _pick_paths(_read_imports_map(options_info_path))
+  packages = _package_inits(imports_map)
+  entries = [b"\0".join([compat.bytestring(short_path),
+                         compat.bytestring(path),
+                         b"p" if short_path in packages else b""])
+             for short_path, path in sorted(
+                 _add_init_dirs(imports_map).items())]
+  # A power of two, with at most half of the slots in use.
+  slots = 1
+  while slots < 2 * len(entries):
+    slots *= 2
+  table = [0] * slots
+  for index, entry in enumerate(entries):
+    slot = _hash(entry[:entry.index(b"\0") + 1]) & (slots - 1)
+    while table[slot]:
+      slot = (slot + 1) & (slots - 1)
+    table[slot] = index + 1
+  offsets = [0]
+  for entry in entries:
+    offsets.append(offsets[-1] + len(entry))
+  with open(filename, "wb") as fi:
+    fi.write(_MAGIC)
+    fi.write(_HEADER.pack(len(entries), slots))
+    fi.write(b"".join(_UINT.pack(i) for i in table + offsets))
+    fi.write(b"".join(entries))
+
+
+def is_compiled_imports_map(filename):
+  with open(filename, "rb") as fi:
+    return fi.read(len(_MAGIC)) == _MAGIC
 
 
 def build_imports_map(options_info_path, output=None):
@@ -74,52 +324,31 @@ def build_imports_map(options_info_path, output=None):
      (e.g. "path/to/file.py" =>
            "$GENDIR/rulename~~pytype-gen/path_to_file.py~~pytype"
   Args:
-    options_info_path: The file with the info (may be None, for do-nothing)
+    options_info_path: The file with the info (may be None, for do-nothing),
+      either in the text format or compiled by compile_imports_map.
     output: The output file from the command line. When validating
              imports_info, this output should *not* exist.
   Returns:
     Dict of .py short_path to list of .pytd path or None if no options_info_path
+    (a CompiledImportsMap with the same lookups for a compiled imports map)
   """
-  imports_multimap = _read_imports_map(options_info_path)
+  if options_info_path and is_compiled_imports_map(options_info_path):
+    if output is not None:
+      _create_output(output)
+    return CompiledImportsMap(options_info_path, output)
 
-  # Output warnings for all multiple
-  # mappings and keep the lexicographically first.
-  for short_path, paths in imports_multimap.items():
-    if len(paths) > 1:
-      log.warn("Multiple files for %r => %r ignoring %r",
-               short_path, paths[0], paths[1:])
-  imports_map = {short_path: os.path.abspath(paths[0])
-                 for short_path, paths in imports_multimap.items()}
-  # It's not helpful for a file that's being analyzed to import its own pyi,
-  # because we're trying to update that information!
-  # This _usually_ isn't a problem, but it can be if an __init__.py imports
-  # one of its submodules -- the submodule will be read as an Any from the pyi.
-  if output:
-    path, _ = os.path.splitext(output)
-    for k, v in imports_map.items():
-      if path in v:
-        del imports_map[k]
-        break
+  imports_multimap = _read_imports_map(options_info_path)
 
+  imports_map = {short_path: os.path.abspath(path)
+                 for short_path, path in _pick_paths(imports_multimap).items()}
   _validate_map(imports_multimap, output)
 
-  # Add the potential directory nodes for adding "__init__", because some build
-  # systems automatically create __init__.py in empty directories. These are
-  # added with the path name appended with "/" (os.sep), mapping to the empty
-  # file.  See also load_pytd._import_file which also checks for an empty
-  # directory and acts as if an empty __init__.py is there.
-  # TODO(pludemann): remove either this code or the code in pytd_load.
-  dir_paths = {}
-  for short_path, path in sorted(imports_map.items()):
-    dir_paths[short_path] = path
-    short_path_pieces = short_path.split(os.sep)
-    # If we have a mapping file foo/bar/quux.py', then the pieces are ["foo",
-    # "bar", "quux"] and we want to add foo/__init__.py and foo/bar/__init__.py
-    for i in range(1, len(short_path_pieces)):
-      intermediate_dir_init = os.path.join(*(
-          short_path_pieces[:i] + ["__init__"]))
-      if (intermediate_dir_init not in imports_map and
-          intermediate_dir_init not in dir_paths):
-        log.warn("Created empty __init__ %r", intermediate_dir_init)
-        dir_paths[intermediate_dir_init] = os.devnull
-  return dir_paths
+  # Like compile_imports_map, add the directories before leaving out the output.
+  packages = _package_inits(imports_map)
+  result = {}
+  for short_path, path in _add_init_dirs(imports_map).items():
+    if not _is_output(path, output):
+      result[short_path] = path
+    elif short_path in packages:
+      result[short_path] = os.devnull
+  return result
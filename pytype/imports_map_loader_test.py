@@ -70,5 +70,106 @@ class ImportMapLoaderTest(unittest.TestCase):
           ]
       )
 
+  def testCompiledImportsMap(self):
+    """Test that a compiled imports map has the entries of the text one."""
+    with utils.Tempdir() as d:
+      files = ["a/__init__.py", "a/b.py", "a/c/d.py"]
+      for f in files:
+        d.create_file("out/" + f + "i", "")
+      d.create_file("imports_info", "\n".join(
+          "%s %s" % (f, d["out/" + f + "i"]) for f in files))
+      compiled = d["imports_info.compiled"]
+      imports_map_loader.compile_imports_map(d["imports_info"], compiled)
+      imports_map = imports_map_loader.build_imports_map(compiled)
+      self.assertIsInstance(imports_map,
+                            imports_map_loader.CompiledImportsMap)
+      expected = imports_map_loader.build_imports_map(d["imports_info"])
+      self.assertEqual(len(imports_map), len(expected))
+      self.assertItemsEqual(imports_map.items(), expected.items())
+      for short_path, path in expected.items():
+        self.assertIn(short_path, imports_map)
+        self.assertEqual(imports_map[short_path], path)
+      self.assertNotIn("a/e", imports_map)
+      self.assertIsNone(imports_map.get("a"))
+      self.assertRaises(KeyError, lambda: imports_map["a/e"])
+
+  def testCompiledImportsMapValidation(self):
+    """Test that paths of a compiled imports map are checked when used."""
+    with utils.Tempdir() as d:
+      d.create_file("imports_info", "a.py out/a.pyi\nb.py out/b.pyi\n")
+      d.create_file("out/a.pyi", "")
+      compiled = d["imports_info.compiled"]
+      imports_map_loader.compile_imports_map(d["imports_info"], compiled)
+      with utils.cd(d.path):
+        imports_map = imports_map_loader.build_imports_map(compiled)
+        self.assertEqual(imports_map["a"], d["out/a.pyi"])
+        self.assertRaises(AssertionError, lambda: imports_map["b"])
+
+  def testCompiledImportsMapFilter(self):
+    """Test filtering out the current target's entry from a compiled map."""
+    with utils.Tempdir() as d:
+      d.create_file("imports_info", "a.py out/a.pyi\nb.py out/b.pyi\n")
+      d.create_file("out/b.pyi", "")
+      compiled = d["imports_info.compiled"]
+      imports_map_loader.compile_imports_map(d["imports_info"], compiled)
+      with utils.cd(d.path):
+        imports_map = imports_map_loader.build_imports_map(compiled,
+                                                           "out/a.pyi")
+        self.assertTrue(os.path.exists("out/a.pyi"))
+        self.assertNotIn("a", imports_map)
+        self.assertIn("b", imports_map)
+        self.assertEqual(len(imports_map), 1)
+
+  def testFilterFormatsAgree(self):
+    """Test that both formats leave out every entry of the output file."""
+    with utils.Tempdir() as d:
+      d.create_file("imports_info", "a.py out/a.pyi\nc/a.py out/a.pyi~\n"
+                    "b.py out/b.pyi\n")
+      for f in ("out/a.pyi", "out/a.pyi~", "out/b.pyi"):
+        d.create_file(f, "")
+      compiled = d["imports_info.compiled"]
+      imports_map_loader.compile_imports_map(d["imports_info"], compiled)
+      with utils.cd(d.path):
+        expected = imports_map_loader.build_imports_map("imports_info",
+                                                        "out/a.pyi")
+        imports_map = imports_map_loader.build_imports_map(compiled,
+                                                           "out/a.pyi")
+        self.assertNotIn("a", expected)
+        self.assertNotIn("c/a", expected)
+        self.assertEqual(sorted(imports_map.items()), sorted(expected.items()))
+        self.assertEqual(len(imports_map), len(expected))
+        self.assertTrue(imports_map)
+
+  def testFilterPrefixSibling(self):
+    """Test that both formats keep modules whose names start like the output."""
+    with utils.Tempdir() as d:
+      d.create_file("imports_info", "foo.py out/foo.pyi\n"
+                    "foo_lib.py out/foo_lib.pyi\n")
+      d.create_file("out/foo_lib.pyi", "")
+      compiled = d["imports_info.compiled"]
+      imports_map_loader.compile_imports_map(d["imports_info"], compiled)
+      with utils.cd(d.path):
+        for imports_info in ("imports_info", compiled):
+          imports_map = imports_map_loader.build_imports_map(imports_info,
+                                                             "out/foo.pyi")
+          self.assertEqual(list(imports_map.items()),
+                           [("foo_lib", d["out/foo_lib.pyi"])])
+
+  def testFilterKeepsPackage(self):
+    """Test that both formats empty the output's __init__ instead."""
+    with utils.Tempdir() as d:
+      d.create_file("imports_info", "p/__init__.py out/p/__init__.pyi\n"
+                    "p/m.py out/p/m.pyi\n")
+      d.create_file("out/p/m.pyi", "")
+      compiled = d["imports_info.compiled"]
+      imports_map_loader.compile_imports_map(d["imports_info"], compiled)
+      with utils.cd(d.path):
+        for imports_info in ("imports_info", compiled):
+          imports_map = imports_map_loader.build_imports_map(
+              imports_info, "out/p/__init__.pyi")
+          self.assertEqual(imports_map["p/__init__"], os.devnull)
+          self.assertEqual(imports_map["p/m"], d["out/p/m.pyi"])
+
+
 if __name__ == "__main__":
   unittest.main()
@@ -1,21 +1,43 @@
 """Load and link .pyi files."""
 
 import logging
+import marshal
 import os
 
 
 from pytype import utils
+from pytype.pyi import declarations
+from pytype.pyi import parse_cache
 from pytype.pyi import parser
+from pytype.pytd import binary_ast
+from pytype.pytd import pickle_archive
 from pytype.pytd import pytd_utils
 from pytype.pytd import serialize_ast
 from pytype.pytd import typeshed
 from pytype.pytd import visitors
 from pytype.pytd.parse import builtins
-from six.moves import cPickle
 
 log = logging.getLogger(__name__)
 
 
+# The modules of precompiled builtins files, by file, if loaders should share
+# them. See share_precompiled_builtins().
+_shared_precompiled_builtins = None
+
+
+def share_precompiled_builtins():
+  """Let all loaders created from the same precompiled builtins share modules.
+
+  The modules in a precompiled builtins file only reference each other, so once
+  a module is unpickled and resolved, every loader using the same file can
+  reuse it. This is meant for long-running processes that create many loaders,
+  like pytype's server mode.
+  """
+  global _shared_precompiled_builtins
+  if _shared_precompiled_builtins is None:
+    _shared_precompiled_builtins = {}
+
+
 def create_loader(options):
   """Create a pytd loader."""
   kwargs = {"base_module": options.module_name,
@@ -23,6 +45,13 @@ def create_loader(options):
             "pythonpath": options.pythonpath,
             "imports_map": options.imports_map,
             "use_typeshed": options.typeshed}
+  if options.lazy_pyi:
+    kwargs["lazy_pyi"] = True
+  if options.parse_processes:
+    kwargs["parse_processes"] = options.parse_processes
+  if options.pyi_cache:
+    kwargs["pyi_cache"] = parse_cache.ParseCache(
+        options.pyi_cache, max_size=options.pyi_cache_size * 1024 * 1024)
   if options.precompiled_builtins:
     return PickledPyiLoader.load_from_pickle(
         options.precompiled_builtins, **kwargs)
@@ -71,6 +100,48 @@ def get_module_name(filename, pythonpath):
     return _filename_to_module_name(filename)
 
 
+class _PathCache(object):
+  """Answers file existence queries from cached directory listings.
+
+  The directories on the pythonpath can be on slow (e.g. network) filesystems,
+  and import resolution probes several candidate paths per pythonpath entry.
+  Listing a directory once and keeping the result turns most of those probes
+  into dict lookups. The cache assumes that the directories don't change
+  while it is in use.
+  """
+
+  def __init__(self):
+    self._listings = {}  # directory -> frozenset of entries, None if missing
+    self._found = {}  # path of a listed entry -> whether it exists
+
+  def _list(self, directory):
+    try:
+      return self._listings[directory]
+    except KeyError:
+      try:
+        entries = frozenset(os.listdir(directory or os.curdir))
+      except OSError:
+        entries = None  # doesn't exist, or not a directory
+      self._listings[directory] = entries
+      return entries
+
+  def exists(self, path):
+    directory, basename = os.path.split(path)
+    if not basename:
+      return self.isdir(directory)
+    entries = self._list(directory)
+    if entries is None or basename not in entries:
+      return False
+    # Listings include dangling symlinks, which don't exist for os.path.exists.
+    # Only check the few entries we actually look for.
+    if path not in self._found:
+      self._found[path] = os.path.exists(path)
+    return self._found[path]
+
+  def isdir(self, path):
+    return self.exists(path) and self._list(path) is not None
+
+
 class Module(object):
   """Represents a parsed module.
 
@@ -80,22 +151,111 @@ class Module(object):
       unique.
     ast: The parsed PyTD. Internal references will be resolved, but
       NamedType nodes referencing other modules might still be unresolved.
-    pickle: The AST as a pickled string. As long as this field is not None, the
-      ast will be None.
+    pickle: The AST as a string serialized by serialize_ast.StoreAst, or a
+      pickle_archive.Member to read the string from. As long as this field is
+      not None, the ast will be None.
     dirty: The initial value of the dirty attribute.
+    lazy_source: A _LazySource if only some of the declarations of the module
+      have been loaded, None otherwise.
   """
 
   def __init__(self, module_name, filename, ast,
-               pickle=None, dirty=True):
+               pickle=None, dirty=True, lazy_source=None):
     self.module_name = module_name
     self.filename = filename
     self.ast = ast
     self.pickle = pickle
     self.dirty = dirty
+    self.lazy_source = lazy_source
+    self._superclasses = None  # (ast, superclasses) tuple, see superclasses()
 
   def needs_unpickling(self):
     return bool(self.pickle)
 
+  def superclasses(self):
+    """Map the names of the classes in the ast to the names of their bases."""
+    if self._superclasses is None or self._superclasses[0] is not self.ast:
+      self._superclasses = (
+          self.ast, self.ast.Visit(visitors.ExtractSuperClassesByName()))
+    return self._superclasses[1]
+
+
+# The members of a TypeDeclUnit that _LazySource loads one by one.
+_MEMBER_ATTRIBUTES = ("type_params", "constants", "classes", "functions",
+                      "aliases")
+
+
+def _append_members(ast, new):
+  return ast.Replace(**{attr: getattr(ast, attr) + getattr(new, attr)
+                        for attr in _MEMBER_ATTRIBUTES})
+
+
+def _lookup_local_types(ast, new):
+  """Like LookupLocalTypes, for only the members of new, which are in ast."""
+  lookup = visitors.LookupLocalTypes()
+  lookup.EnterTypeDeclUnit(ast)
+  new = new.Replace(**{attr: tuple(m.Visit(lookup) for m in getattr(new, attr))
+                       for attr in _MEMBER_ATTRIBUTES})
+  lookup.LeaveTypeDeclUnit(ast)
+  return new
+
+
+def _replace_members(ast, old, new, replacement):
+  """Replace the members at the positions of the members of new.
+
+  Args:
+    ast: A pytd.TypeDeclUnit, starting with the members of old, followed by the
+      members of new, and possibly more.
+    old: A pytd.TypeDeclUnit.
+    new: A pytd.TypeDeclUnit.
+    replacement: A pytd.TypeDeclUnit with the members to put in place of the
+      members of new.
+
+  Returns:
+    A pytd.TypeDeclUnit.
+  """
+  members = {}
+  for attr in _MEMBER_ATTRIBUTES:
+    start = len(getattr(old, attr))
+    end = start + len(getattr(new, attr))
+    items = getattr(ast, attr)
+    members[attr] = items[:start] + getattr(replacement, attr) + items[end:]
+  return ast.Replace(**members)
+
+
+class _LazySource(object):
+  """The source of a module that's loaded one declaration at a time.
+
+  Attributes:
+    filename: The file the source was read from.
+    index: A declarations.DeclarationIndex of the source.
+    loaded: The numbers of the declarations that have been loaded.
+  """
+
+  def __init__(self, filename, index):
+    self.filename = filename
+    self.index = index
+    self.loaded = set()
+
+  def parse(self, module_name, selected, python_version):
+    """Parse the given declarations, and mark them as loaded."""
+    ast = parser.parse_string(self.index.source(selected),
+                              filename=self.filename, name=module_name,
+                              python_version=python_version)
+    self.loaded.update(selected)
+    return ast
+
+  def is_complete(self):
+    return len(self.loaded) == len(self.index)
+
+
+class _ImportNode(object):
+  """A module in the dependency graph of Loader.import_names."""
+
+  def __init__(self, name):
+    self.name = name
+    self.deps = set()
+
 
 class BadDependencyError(Exception):
   """If we can't resolve a module referenced by the one we're trying to load."""
@@ -117,11 +277,26 @@ class Loader(object):
     base_module: The full name of the module we're based in (i.e., the module
       that's importing other modules using this loader).
     _modules: A map, filename to Module, for caching modules already loaded.
-    _concatenated: A concatenated pytd of all the modules. Refreshed when
-                   necessary.
+    _concatenated: A tuple of the last result of concat_all(), and the module
+      asts it was computed from.
+    _hierarchy: A tuple of the last result of get_superclass_hierarchy(), and
+      the module asts it was computed from.
+    _path_cache: A _PathCache for the files on our pythonpath.
+    _failed_imports: Names of modules we already failed to find.
+    _pyi_cache: A parse_cache.ParseCache for parsed pyi files, or None.
+    _lazy_pyi: Whether to load large pyi files one declaration at a time. See
+      _load_members. Only references from other pyi files are loaded lazily:
+      import_name and the relative imports complete a module before returning
+      it, see _complete_module.
+    _parse_processes: How many processes to parse the pyi files of
+      dependencies in. See prefetch().
+    _prefetched: Maps module names to (filename, src, ast) tuples of pyi files
+      parsed by prefetch(), or to None if there was nothing to parse.
   """
 
   PREFIX = "pytd:"  # for pytd files that ship with pytype
+  # The smallest pyi source, in bytes, that's loaded lazily.
+  LAZY_PYI_MIN_SIZE = 8192
 
   def __init__(self,
                base_module,
@@ -129,7 +304,10 @@ class Loader(object):
                pythonpath=(),
                imports_map=None,
                use_typeshed=True,
-               modules=None):
+               modules=None,
+               pyi_cache=None,
+               lazy_pyi=False,
+               parse_processes=1):
     self._modules = modules or self._base_modules(python_version)
     if self._modules["__builtin__"].needs_unpickling():
       self._unpickle_module(self._modules["__builtin__"])
@@ -143,21 +321,51 @@ class Loader(object):
     self.imports_map = imports_map
     self.use_typeshed = use_typeshed
     self._concatenated = None
+    self._hierarchy = None
     self._import_name_cache = {}  # performance cache
+    self._path_cache = _PathCache()
+    self._failed_imports = set()
+    self._pyi_cache = pyi_cache
+    self._lazy_pyi = lazy_pyi
+    self._parse_processes = parse_processes
+    self._prefetched = {}
     # Paranoid verification that pytype.main properly checked the flags:
     if imports_map is not None:
       assert pythonpath == [""], pythonpath
 
-  def save_to_pickle(self, filename):
-    """Save to a pickle. See PickledPyiLoader.load_from_pickle for reverse."""
+  def save_to_pickle(self, filename, compress=False):
+    """Save to an archive. See PickledPyiLoader.load_from_pickle for reverse.
+
+    Args:
+      filename: The file to write to.
+      compress: Whether to compress the individual modules in the archive.
+        Compressed archives are smaller, but slower to load from.
+    """
     # We assume that the Loader is in a consistent state here. In particular, we
     # assume that for every module in _modules, all the transitive dependencies
     # have been loaded.
-    items = tuple((name, serialize_ast.StoreAst(module.ast))
+    for module in list(self._modules.values()):
+      if module.lazy_source:
+        self._load_members(module)
+    # Clear all pointers before storing any module, so that what's stored
+    # doesn't depend on which nodes the modules happen to share. Function types
+    # would otherwise be stored along with the functions they point to, which
+    # _unpickle_module replaces anyway.
+    for module in self._modules.values():
+      module.ast.Visit(visitors.ClearClassPointers())
+      module.ast.Visit(visitors.ClearFunctionPointers())
+    items = tuple((name, serialize_ast.StoreAst(module.ast),
+                   sorted(self._collect_ast_dependencies(module.ast) - {name}))
                   for name, module in sorted(self._modules.items()))
-    # Now pickle the pickles. We keep the "inner" modules as pickles as a
-    # performance optimization - unpickling is slow.
-    pytd_utils.SavePickle(items, filename, compress=True)
+    # Now store the pickles in an indexed archive. We keep the "inner" modules
+    # as separate pickles as a performance optimization - unpickling is slow,
+    # and most runs only need a handful of modules.
+    pickle_archive.Save(items, filename, compress=compress)
+    # The pointers of our modules were cleared above. The builtins are shared
+    # with other loaders, so restore them.
+    for module in self._modules.values():
+      module.dirty = True
+    self._lookup_all_classes()
 
   def _unpickle_module(self, module):
     raise NotImplementedError()  # overwritten in PickledPyiLoader
@@ -171,31 +379,149 @@ class Loader(object):
         Module("typing", self.PREFIX + "typing", typing, dirty=False)
     }
 
-  def _parse_predefined(self, pytd_subdir, module, as_package=False):
-    """Parse a pyi/pytd file in the pytype source tree."""
+  def _parse_source(self, src, filename, module_name):
+    """Parse pyi source, unless prefetch() already did."""
+    prefetched = self._prefetched.pop(module_name, None)
+    if prefetched and prefetched[:2] == (filename, src):
+      return prefetched[2]
+    if self._pyi_cache:
+      return self._pyi_cache.parse_string(src, filename, module_name,
+                                          self.python_version)
+    return parser.parse_string(src, filename=filename, name=module_name,
+                               python_version=self.python_version)
+
+  def prefetch(self, module_names, processes=None):
+    """Parse the pyi files of modules and their dependencies, in parallel.
+
+    Which files will be loaded is a guess (see _find_source) made before any of
+    them are, so some of the parsed asts might end up unused. The others are
+    picked up by the imports that follow.
+
+    Args:
+      module_names: The names of modules that are about to be imported.
+      processes: The maximum number of processes, see parser.parse_strings.
+        Defaults to the parse_processes the loader was created with.
+
+    Returns:
+      A dictionary mapping the names of the modules parsed by this call to the
+      names of the modules they depend on.
+    """
+    dependencies = {}
+    if self._lazy_pyi:
+      return dependencies  # Lazily loaded modules don't parse all of their pyi.
+    processes = processes or self._parse_processes
+    pending = module_names
+    while pending:
+      sources = []
+      parsed = []
+      for module_name in set(pending):
+        if module_name in self._modules or module_name in self._prefetched:
+          continue
+        self._prefetched[module_name] = None
+        source = self._find_source(module_name)
+        if not source:
+          continue
+        filename, src = source
+        ast = self._pyi_cache and self._pyi_cache.get(
+            src, filename, module_name, self.python_version)
+        if ast:
+          parsed.append((module_name, filename, src, ast))
+        else:
+          sources.append((src, module_name, filename))
+      asts = parser.parse_strings(sources, self.python_version, processes)
+      for (src, module_name, filename), ast in zip(sources, asts):
+        if ast:
+          if self._pyi_cache:
+            self._pyi_cache.put(src, module_name, self.python_version, ast)
+          parsed.append((module_name, filename, src, ast))
+      pending = set()
+      for module_name, filename, src, ast in parsed:
+        self._prefetched[module_name] = (filename, src, ast)
+        package_name = utils.get_pyi_package_name(ast.name, ast.is_package)
+        if package_name:
+          ast = ast.Visit(visitors.QualifyRelativeNames(package_name))
+        dependencies[module_name] = self._collect_ast_dependencies(ast)
+        pending |= dependencies[module_name]
+    return dependencies
+
+  def _find_source(self, module_name):
+    """Find the pyi file that _import_name would parse for a module.
+
+    Args:
+      module_name: The name of the module. May contain dots.
+
+    Returns:
+      A tuple of the filename and the source, or None.
+    """
+    source = self._find_builtin_source("builtins", module_name)
+    if source:
+      return source
+    for searchdir in self.pythonpath:
+      path = os.path.join(searchdir, *module_name.split("."))
+      full_path = self._find_pyi(os.path.join(path, "__init__"))
+      if full_path:
+        return self._read_source(full_path)
+      elif self.imports_map is None and self._path_cache.isdir(path):
+        return None  # An empty package, see _import_file.
+      full_path = self._find_pyi(path)
+      if full_path:
+        return self._read_source(full_path)
+    source = self._find_builtin_source("stdlib", module_name)
+    if not source and not self.imports_map:
+      source = self._find_builtin_source(
+          "third_party", module_name, third_party_only=True)
+    return source
+
+  def _find_builtin_source(self, subdir, module_name, third_party_only=False):
+    """Find a pytd/pyi that ships with pytype or typeshed, see _load_builtin."""
+    if not third_party_only:
+      source = self._find_predefined(subdir, module_name)
+      if source:
+        return source
+    if self.use_typeshed:
+      return typeshed.get_type_definition_file(
+          subdir, module_name, self.python_version)
+    return None
+
+  def _find_predefined(self, subdir, module_name):
+    """Find a pyi/pytd file in the pytype source tree."""
+    builtin_dir = utils.get_versioned_path(subdir, self.python_version)
+    for as_package in (False, True):
+      try:
+        return pytd_utils.GetPredefinedFile(builtin_dir, module_name,
+                                            as_package=as_package)
+      except IOError:
+        pass
+    return None
+
+  def _read_source(self, filename):
     try:
-      filename, src = pytd_utils.GetPredefinedFile(pytd_subdir, module,
-                                                   as_package=as_package)
+      with open(filename, "r") as fi:
+        return filename, fi.read()
     except IOError:
       return None
-    ast = parser.parse_string(src, filename=filename, name=module,
-                              python_version=self.python_version)
-    assert ast.name == module
-    return ast
 
   def _postprocess_pyi(self, ast):
     """Apply all the PYI transformations we need."""
+    ast = self._resolve_pyi_dependencies(ast)
+    return ast.Visit(visitors.LookupLocalTypes())
+
+  def _resolve_pyi_dependencies(self, ast):
+    """Apply the PYI transformations that come before resolving local types."""
     package_name = utils.get_pyi_package_name(ast.name, ast.is_package)
+    transforms = []
     if package_name:
-      ast = ast.Visit(visitors.QualifyRelativeNames(package_name))
-    ast = ast.Visit(visitors.LookupBuiltins(self.builtins, full_names=False))
-    ast = ast.Visit(visitors.ExpandCompatibleBuiltins(self.builtins,
-                                                      self.python_version))
+      transforms.append(visitors.QualifyRelativeNames(package_name))
+    transforms.append(
+        visitors.LookupBuiltins(self.builtins, full_names=False))
+    transforms.append(
+        visitors.ExpandCompatibleBuiltins(self.builtins, self.python_version))
+    ast = visitors.ApplyVisitors(ast, transforms)
     dependencies = self._collect_ast_dependencies(ast)
     if dependencies:
       self._load_ast_dependencies(dependencies, ast)
+      self._load_lazy_members(ast)
       ast = self._resolve_external_types(ast)
-    ast = ast.Visit(visitors.LookupLocalTypes())
     return ast
 
   def _create_empty(self, module_name, filename):
@@ -213,14 +539,48 @@ class Loader(object):
 
   def load_file(self, module_name, filename, ast=None):
     """Load (or retrieve from cache) a module and resolve its dependencies."""
-    self._concatenated = None  # invalidate
     # Check for an existing ast first
     existing = self._get_existing_ast(module_name)
     if existing:
       return existing
     if not ast:
-      ast = parser.parse_file(filename=filename, name=module_name,
-                              python_version=self.python_version)
+      with open(filename, "r") as fi:
+        src = fi.read()
+      return self._load_source(module_name, filename, filename, src)
+    return self._process_module(module_name, filename, ast)
+
+  def _load_source(self, module_name, filename, src_filename, src):
+    """Load a module from pyi source, lazily if enabled and worthwhile.
+
+    Args:
+      module_name: The fully qualified name of the module being imported.
+      filename: The filename of the module.
+      src_filename: The file the source was read from.
+      src: The pyi source.
+
+    Returns:
+      The ast (pytd.TypeDeclUnit) as represented in this loader.
+    """
+    if self._lazy_pyi and len(src) >= self.LAZY_PYI_MIN_SIZE:
+      try:
+        index = declarations.DeclarationIndex(src)
+      except declarations.ScanError as e:
+        log.info("Loading %s in full: %s", src_filename, e)
+      else:
+        # Start with an empty module, and load the declarations that are always
+        # included.
+        ast = pytd_utils.CreateModule(module_name).Replace(
+            is_package=utils.is_pyi_directory_init(src_filename))
+        module = Module(module_name, filename, ast,
+                        lazy_source=_LazySource(src_filename, index))
+        self._modules[module_name] = module
+        try:
+          self._load_members(module, ())
+        except:
+          del self._modules[module_name]
+          raise
+        return module.ast
+    ast = self._parse_source(src, src_filename, module_name)
     return self._process_module(module_name, filename, ast)
 
   def _process_module(self, module_name, filename, ast):
@@ -262,6 +622,8 @@ class Loader(object):
 
   def _load_ast_dependencies(self, dependencies, ast, ast_name=None):
     """Fill in all ClassType.cls pointers and load reexported modules."""
+    if self._parse_processes > 1 and dependencies:
+      self.prefetch(dependencies)
     for name in (dependencies or ()):
       if name not in self._modules or not self._modules[name].ast:
         other_ast = self._import_name(name)
@@ -269,6 +631,97 @@ class Loader(object):
           error = "Can't find pyi for %r" % name
           raise BadDependencyError(error, ast_name or ast.name)
 
+  def _load_lazy_members(self, ast):
+    """Load the members of lazily loaded modules that the ast refers to."""
+    deps = visitors.CollectDependencies()
+    ast.Visit(deps)
+    names_by_module = {}
+    for name in deps.names:
+      module_name, _, member_name = name.rpartition(".")
+      module = self._modules.get(module_name)
+      if module and module.lazy_source:
+        names_by_module.setdefault(module, set()).add(member_name)
+    for module, names in names_by_module.items():
+      # A star import needs all of the module.
+      self._load_members(module, None if "*" in names else names)
+
+  def _load_members(self, module, names=None):
+    """Load more of the declarations of a lazily loaded module.
+
+    The new members are processed like a module of their own, and appended to
+    the module's ast, which keeps the members that were already there. Other
+    modules that point into the module stay valid.
+
+    Args:
+      module: A Module with a lazy_source.
+      names: The names of the members to load (plus what they refer to), or
+        None to load the rest of the module.
+    """
+    lazy_source = module.lazy_source
+    index = lazy_source.index
+    if names is None:
+      wanted = set(range(len(index)))
+    else:
+      wanted = index.closure(names)
+    if wanted <= lazy_source.loaded:
+      return
+    old_loaded = set(lazy_source.loaded)
+    old_ast = module.ast
+    # The parse includes the loaded declarations that the new ones refer to,
+    # since the parser needs them. We only keep the ones that are new.
+    parsed = lazy_source.parse(module.module_name, wanted, self.python_version)
+    if lazy_source.is_complete():
+      module.lazy_source = None
+    old_names = {m.name for attr in _MEMBER_ATTRIBUTES
+                 for m in getattr(old_ast, attr)}
+    # Star imports are in the first batch of declarations, and are expanded
+    # when it's processed.
+    raw = old_ast.Replace(**{
+        attr: tuple(m for m in getattr(parsed, attr)
+                    if m.name not in old_names and
+                    not (old_loaded and m.name.endswith(".*")))
+        for attr in _MEMBER_ATTRIBUTES})
+    try:
+      # Loading the dependencies of the new members can lead back here, so make
+      # them visible right away, like _process_module does for a new module.
+      # Members added by such nested calls are appended after ours.
+      module.ast = _append_members(old_ast, raw)
+      resolved = self._resolve_pyi_dependencies(raw)
+      ast = _replace_members(module.ast, old_ast, raw, resolved)
+      new = _lookup_local_types(ast, resolved)
+      # AdjustTypeParameters declares the type parameters the module doesn't.
+      adjusted = new.Replace(type_params=ast.type_params).Visit(
+          visitors.AdjustTypeParameters())
+      new = adjusted.Replace(type_params=new.type_params +
+                             adjusted.type_params[len(ast.type_params):])
+      ast = _replace_members(ast, old_ast, resolved, new)
+      new.Visit(visitors.FillInLocalPointers({"": ast,
+                                              module.module_name: ast}))
+    except:
+      module.ast = old_ast
+      module.lazy_source = lazy_source
+      lazy_source.loaded = old_loaded
+      raise
+    module.ast = ast
+    module.dirty = True
+
+  def _complete_module(self, module_name, ast):
+    """Load the rest of a lazily loaded module. Returns the module's ast.
+
+    The VM converts an imported module's ast into an abstract.Module with all
+    of its members, and some of its users look up names in the ast directly,
+    so a module that's imported by name has to be complete.
+
+    Args:
+      module_name: The name of the module.
+      ast: The module's ast, as returned by _import_name, or None.
+    """
+    module = self._modules.get(module_name)
+    if ast and module and module.lazy_source:
+      self._load_members(module)
+      return module.ast
+    return ast
+
   def _resolve_external_types(self, ast):
     try:
       ast = ast.Visit(visitors.LookupExternalTypes(
@@ -309,7 +762,8 @@ class Loader(object):
       raise ValueError("Attempting relative import in non-package.")
     path = self.base_module.split(".")[:-1]
     path.append(name)
-    ast = self._import_name(".".join(path))
+    module_name = ".".join(path)
+    ast = self._complete_module(module_name, self._import_name(module_name))
     self._lookup_all_classes()
     if ast:
       self._verify_ast(ast)
@@ -338,7 +792,7 @@ class Loader(object):
       raise ValueError("Attempting relative import in non-package.")
     components = self.base_module.split(".")
     sub_module = ".".join(components[0:-level])
-    ast = self._import_name(sub_module)
+    ast = self._complete_module(sub_module, self._import_name(sub_module))
     self._lookup_all_classes()
     if ast:
       self._verify_ast(ast)
@@ -348,7 +802,7 @@ class Loader(object):
     # This method is used by convert.py for LateType, so memoize results early:
     if module_name in self._import_name_cache:
       return self._import_name_cache[module_name]
-    ast = self._import_name(module_name)
+    ast = self._complete_module(module_name, self._import_name(module_name))
     self._lookup_all_classes()
     if ast:
       self._verify_ast(ast)
@@ -359,11 +813,11 @@ class Loader(object):
     """Load a pytd/pyi that ships with pytype or typeshed."""
     # Try our own type definitions first.
     if not third_party_only:
-      builtin_dir = utils.get_versioned_path(subdir, self.python_version)
-      mod = self._parse_predefined(builtin_dir, module_name)
-      if not mod:
-        mod = self._parse_predefined(builtin_dir, module_name, as_package=True)
-      if mod:
+      source = self._find_predefined(subdir, module_name)
+      if source:
+        filename, src = source
+        mod = self._parse_source(src, filename, module_name)
+        assert mod.name == module_name
         return self.load_file(filename=self.PREFIX + module_name,
                               module_name=module_name,
                               ast=mod)
@@ -373,13 +827,122 @@ class Loader(object):
 
   def _load_typeshed_builtin(self, subdir, module_name):
     """Load a pyi from typeshed."""
-    mod = typeshed.parse_type_definition(
+    existing = self._get_existing_ast(module_name)
+    if existing:
+      return existing
+    definition = typeshed.get_type_definition_file(
         subdir, module_name, self.python_version)
-    if mod:
-      return self.load_file(filename=self.PREFIX + module_name,
-                            module_name=module_name, ast=mod)
+    if definition:
+      filename, src = definition
+      return self._load_source(module_name, self.PREFIX + module_name,
+                               filename, src)
     return None
 
+  def import_names(self, module_names, processes=1):
+    """Import many modules, resolving independent ones in parallel.
+
+    The modules and their dependencies are parsed by prefetch(), and then
+    resolved in waves of children forked from the current process. Every wave
+    resolves the import cycles (usually single modules) whose dependencies were
+    resolved by the previous waves, and sends them back in the format of
+    binary_ast. Which process resolves a module doesn't change the result, so
+    the loaded modules are the same for any number of processes.
+
+    Args:
+      module_names: The names of the modules.
+      processes: The maximum number of processes.
+
+    Returns:
+      A list of the asts of the modules, see import_name().
+    """
+    dependencies = self.prefetch(module_names, processes)
+    if processes > 1:
+      for wave in self._import_waves(dependencies):
+        self._import_in_children(wave, processes)
+    # This also reports the errors of the modules that failed in a child.
+    return [self.import_name(module_name) for module_name in module_names]
+
+  def _import_waves(self, dependencies):
+    """Group modules into waves of import cycles, for import_names.
+
+    Args:
+      dependencies: A dictionary mapping module names to the names of the
+        modules they depend on, see prefetch().
+
+    Returns:
+      A list of waves. Every wave is a list of import cycles, each a list of
+      module names, that only depend on the import cycles of earlier waves.
+    """
+    nodes = {name: _ImportNode(name) for name in dependencies}
+    for name, deps in dependencies.items():
+      nodes[name].deps = {nodes[d] for d in deps if d in nodes and d != name}
+    waves = []
+    wave_of = {}
+    for cycle in utils.strongly_connected_components(
+        [nodes[name] for name in sorted(nodes)]):
+      wave = max([wave_of[dep] + 1 for node in cycle for dep in node.deps
+                  if dep not in cycle] or [0])
+      if wave == len(waves):
+        waves.append([])
+      waves[wave].append([node.name for node in cycle])
+      for node in cycle:
+        wave_of[node] = wave
+    return waves
+
+  def _import_in_children(self, cycles, processes):
+    """Import independent import cycles in forked children.
+
+    The modules the children loaded are added to this loader. Modules that
+    failed to load in a child are left for import_name to load (or fail on)
+    again.
+
+    Args:
+      cycles: A list of import cycles, each a list of module names.
+      processes: The maximum number of children.
+    """
+    children = []
+    for i in range(min(processes, len(cycles))):
+      r, w = os.pipe()
+      pid = os.fork()
+      if not pid:
+        # Never return from here: the stack above us belongs to the parent.
+        try:
+          os.close(r)
+          loaded = set(self._modules)
+          for cycle in cycles[i::processes]:
+            for module_name in cycle:
+              try:
+                self._import_name(module_name)
+              except Exception as e:  # pylint: disable=broad-except
+                # The parent imports the module again, and reports the error.
+                log.debug("Couldn't import %s in a child: %s", module_name, e)
+          new = sorted(name for name in self._modules if name not in loaded)
+          # The class pointers would drag other modules into the output.
+          for name in new:
+            self._modules[name].ast.Visit(visitors.ClearClassPointers())
+          results = [(name, self._modules[name].filename,
+                      binary_ast.Dump(self._modules[name].ast))
+                     for name in new]
+          with os.fdopen(w, "wb") as f:
+            f.write(marshal.dumps(results))
+        finally:
+          os._exit(0)  # pylint: disable=protected-access
+      os.close(w)
+      children.append((pid, r))
+    for pid, r in children:
+      with os.fdopen(r, "rb") as f:
+        data = f.read()
+      os.waitpid(pid, 0)
+      try:
+        results = marshal.loads(data)
+      except (EOFError, ValueError, TypeError):
+        log.warning("A process importing modules died")
+        continue
+      for name, filename, data in results:
+        if name not in self._modules:
+          self._modules[name] = Module(name, filename, binary_ast.Load(data))
+    self._lookup_all_classes()
+
   def _import_name(self, module_name):
     """Load a name like 'sys' or 'foo.bar.baz'.
 
@@ -393,6 +956,8 @@ class Loader(object):
     existing = self._get_existing_ast(module_name)
     if existing:
       return existing
+    if module_name in self._failed_imports:
+      return None
 
     assert os.sep not in module_name, (os.sep, module_name)
     log.debug("Trying to import %r", module_name)
@@ -428,6 +993,7 @@ class Loader(object):
       for module, path in self.imports_map.items():
         log.debug("%s -> %s", module, path)
 
+    self._failed_imports.add(module_name)
     return None
 
   def _import_file(self, module_name, module_name_split):
@@ -453,7 +1019,7 @@ class Loader(object):
       if init_ast is not None:
         log.debug("Found module %r with path %r", module_name, init_path)
         return init_ast
-      elif self.imports_map is None and os.path.isdir(path):
+      elif self.imports_map is None and self._path_cache.isdir(path):
         # We allow directories to not have an __init__ file.
         # The module's empty, but you can still load submodules.
         log.debug("Created empty module %r with path %r",
@@ -477,6 +1043,14 @@ class Loader(object):
       The parsed pyi, instance of pytd.TypeDeclUnit, or None if we didn't
       find the module.
     """
+    full_path = self._find_pyi(path)
+    if full_path:
+      return self.load_file(filename=full_path, module_name=module_name)
+    else:
+      return None
+
+  def _find_pyi(self, path):
+    """The pyi file for a path without extension, or None if there is none."""
     if self.imports_map is not None:
       if path in self.imports_map:
         full_path = self.imports_map[path]
@@ -487,18 +1061,64 @@ class Loader(object):
 
     # We have /dev/null entries in the import_map - os.path.isfile() returns
     # False for those. However, we *do* want to load them. Hence exists / isdir.
-    if os.path.exists(full_path) and not os.path.isdir(full_path):
-      return self.load_file(filename=full_path, module_name=module_name)
+    if (self._path_cache.exists(full_path) and
+        not self._path_cache.isdir(full_path)):
+      return full_path
     else:
       return None
 
   def concat_all(self):
-    if not self._concatenated:
-      self._concatenated = pytd_utils.Concat(
-          *(module.ast for module in self._modules.values()
-            if module.ast),
-          name="<all>")
-    return self._concatenated
+    """Concatenate the asts of all the loaded modules.
+
+    Returns:
+      A pytd.TypeDeclUnit. Modules loaded since the last call are appended to
+      the previous result, and its Lookup() reuses the name indices of the
+      modules, so this stays cheap while more and more modules are loaded.
+    """
+    module_map = self._get_module_map()
+    if self._concatenated:
+      concatenated, included = self._concatenated
+      if any(module_map.get(name) is not ast
+             for name, ast in included.items()):
+        concatenated = None  # A module was replaced, start over.
+    else:
+      concatenated = None
+    if concatenated is None:
+      concatenated = pytd_utils.Concat(*module_map.values(), name="<all>")
+    else:
+      new_asts = [ast for name, ast in module_map.items()
+                  if name not in included]
+      if new_asts:
+        concatenated = pytd_utils.Concat(concatenated, *new_asts, name="<all>")
+    self._concatenated = (concatenated, module_map)
+    return concatenated
+
+  def get_superclass_hierarchy(self):
+    """The class hierarchy of all the loaded modules, for optimize.Optimize.
+
+    Returns:
+      An optimize.SuperClassHierarchy. It's extended as more modules are
+      loaded, so that the transitive closures it already computed are kept.
+    """
+    module_map = self._get_module_map()
+    if self._hierarchy:
+      hierarchy, included = self._hierarchy
+      if any(module_map.get(name) is not ast
+             for name, ast in included.items()):
+        hierarchy = None  # A module was replaced, start over.
+    else:
+      hierarchy = None
+    if hierarchy is None:
+      # Imported here, since only the modes that optimize pyi files need it.
+      from pytype.pytd import optimize  # pylint: disable=g-import-not-at-top
+      hierarchy, included = optimize.SuperClassHierarchy({}), {}
+    superclasses = {}
+    for name in module_map:
+      if name not in included:
+        superclasses.update(self._modules[name].superclasses())
+    hierarchy = hierarchy.Extend(superclasses)
+    self._hierarchy = (hierarchy, module_map)
+    return hierarchy
 
   def _get_module_map(self):
     return {name: module.ast for name, module in self._modules.items()
@@ -513,6 +1133,13 @@ class Loader(object):
             "%s/__init__" % module in self.imports_map)
 
 
+def _pickle_offset(module):
+  """Sort key for reading pickled modules in the order they're stored."""
+  if isinstance(module.pickle, pickle_archive.Member):
+    return module.pickle.offset
+  return -1
+
+
 class PickledPyiLoader(Loader):
   """A Loader which always loads pickle instead of PYI, for speed."""
 
@@ -521,41 +1148,104 @@ class PickledPyiLoader(Loader):
 
   @classmethod
   def load_from_pickle(cls, filename, base_module, **kwargs):
-    items = pytd_utils.LoadPickle(filename, compress=True)
-    modules = {
+    """Create a loader from a file written by Loader.save_to_pickle."""
+    if _shared_precompiled_builtins is None:
+      modules = cls._read_precompiled_builtins(filename)
+    else:
+      stat = os.stat(filename)
+      key = (os.path.abspath(filename), stat.st_mtime, stat.st_size)
+      if key not in _shared_precompiled_builtins:
+        _shared_precompiled_builtins[key] = cls._read_precompiled_builtins(
+            filename)
+      # The Module objects are shared, so modules unpickled by one loader are
+      # available to all of them. Modules loaded from elsewhere are only added
+      # to this loader's copy of the dict.
+      modules = dict(_shared_precompiled_builtins[key])
+    return cls(base_module=base_module, modules=modules, **kwargs)
+
+  @classmethod
+  def _read_precompiled_builtins(cls, filename):
+    if pickle_archive.IsArchive(filename):
+      # Only the index is read here. Modules are unpickled on first use.
+      archive = pickle_archive.Archive(filename)
+      items = ((name, archive.Member(name)) for name in archive.Names())
+    else:
+      # Legacy format: A gzipped pickle of all the pickled modules.
+      items = pytd_utils.LoadPickle(filename, compress=True)
+    return {
         name: Module(name, filename=None, ast=None, pickle=pickle, dirty=False)
         for name, pickle in items
     }
-    return cls(base_module=base_module, modules=modules, **kwargs)
+
+  def unpickle_all(self):
+    """Unpickle all modules that are still pickled.
+
+    Useful for a process that forks workers: modules that are unpickled before
+    the fork don't have to be unpickled by every worker.
+    """
+    for module in list(self._modules.values()):
+      self._unpickle_module(module)
+
+  def _plan_unpickling(self, modules, seen):
+    """Find the pickled modules needed to unpickle the given ones.
+
+    For modules in an archive, the dependencies are taken from its index, so
+    they're known without reading the modules themselves.
+
+    Args:
+      modules: The modules to unpickle.
+      seen: The modules planned so far. Updated in place.
+
+    Returns:
+      The modules to unpickle, in the order they're stored in their archive.
+    """
+    plan = []
+    todo = list(modules)
+    while todo:
+      m = todo.pop()
+      if m in seen or not m.pickle:
+        continue
+      seen.add(m)
+      plan.append(m)
+      if isinstance(m.pickle, pickle_archive.Member):
+        todo.extend(self._modules[dependency]
+                    for dependency in m.pickle.dependencies)
+    return sorted(plan, key=_pickle_offset)
 
   def _unpickle_module(self, module):
     if not module.pickle:
       return
-    todo = [module]
     seen = set()
     newly_loaded_asts = []
+    todo = self._plan_unpickling([module], seen)
     while todo:
-      m = todo.pop()
-      if m in seen:
-        continue
-      else:
-        seen.add(m)
-      if not m.pickle:
-        continue
-      loaded_ast = cPickle.loads(m.pickle)
-      deps = [d for d in loaded_ast.dependencies if d != loaded_ast.ast.name]
-      loaded_ast = serialize_ast.EnsureAstName(loaded_ast, m.module_name)
-      assert m.module_name in self._modules
-      todo.extend(self._modules[dependency] for dependency in deps)
-      newly_loaded_asts.append(loaded_ast)
-      m.ast = loaded_ast.ast
-      m.pickle = None
+      deps = []
+      for m in todo:
+        if isinstance(m.pickle, pickle_archive.Member):
+          loaded_ast = serialize_ast.LoadAst(m.pickle.Read())
+        else:
+          loaded_ast = serialize_ast.LoadAst(m.pickle)
+        deps.extend(d for d in loaded_ast.dependencies
+                    if d != loaded_ast.ast.name)
+        loaded_ast = serialize_ast.EnsureAstName(loaded_ast, m.module_name)
+        assert m.module_name in self._modules
+        newly_loaded_asts.append(loaded_ast)
+        m.ast = loaded_ast.ast
+        m.pickle = None
+      # Legacy pickles only tell us their dependencies once they're loaded.
+      todo = self._plan_unpickling(
+          [self._modules[dependency] for dependency in deps], seen)
     module_map = self._get_module_map()
     for loaded_ast in newly_loaded_asts:
       unused_new_serialize_ast = serialize_ast.FillLocalReferences(
           loaded_ast, module_map)
     assert module.ast
 
+  def _read_source(self, filename):
+    if os.path.splitext(filename)[1].startswith(".pickled"):
+      return None  # Not parsed, see load_file.
+    return super(PickledPyiLoader, self)._read_source(filename)
+
   def load_file(self, module_name, filename, ast=None):
     """Load (or retrieve from cache) a module and resolve its dependencies."""
     if not os.path.splitext(filename)[1].startswith(".pickled"):
@@ -564,7 +1254,7 @@ class PickledPyiLoader(Loader):
     if existing:
       # TODO(kramm): When does this happen?
       return existing
-    loaded_ast = pytd_utils.LoadPickle(filename)
+    loaded_ast = serialize_ast.LoadAstFromFile(filename)
     # At this point ast.name and module_name could be different.
     # They are later synced in ProcessAst.
     dependencies = [d for d in loaded_ast.dependencies
@@ -572,6 +1262,7 @@ class PickledPyiLoader(Loader):
     loaded_ast = serialize_ast.EnsureAstName(loaded_ast, module_name, fix=True)
     self._modules[module_name] = Module(module_name, filename, loaded_ast.ast)
     self._load_ast_dependencies(dependencies, ast, module_name)
+    self._load_lazy_members(loaded_ast.ast)
     try:
       ast = serialize_ast.ProcessAst(loaded_ast, self._get_module_map())
     except serialize_ast.UnrestorableDependencyError as e:
@@ -7,7 +7,9 @@ import textwrap
 from pytype import config
 from pytype import load_pytd
 from pytype import utils
+from pytype.pyi import parse_cache
 from pytype.pytd import pytd
+from pytype.pytd import pytd_utils
 from pytype.pytd import serialize_ast
 from pytype.pytd import visitors
 
@@ -55,6 +57,189 @@ class ImportPathsTest(unittest.TestCase):
       ast = loader.import_name("path.to.some.module")
       self.assertTrue(ast.Lookup("path.to.some.module.foo"))
 
+  def testPyiCache(self):
+    with utils.Tempdir() as d:
+      d.create_file("foo.pyi", """
+        import bar
+        def f(x: bar.A) -> bar.A
+      """)
+      d.create_file("bar.pyi", "class A(object): ...")
+      cache = parse_cache.ParseCache(d.create_directory("cache"))
+      for _ in range(2):
+        loader = load_pytd.Loader("base", self.PYTHON_VERSION,
+                                  pythonpath=[d.path], pyi_cache=cache)
+        ast = loader.import_name("foo")
+        f = ast.Lookup("foo.f")
+        self.assertIs(f.signatures[0].return_type.cls,
+                      loader.import_name("bar").Lookup("bar.A"))
+      self.assertEqual(len(os.listdir(cache.path)), 2)
+
+  def testPyiCacheTypeshed(self):
+    with utils.Tempdir() as d:
+      cache = parse_cache.ParseCache(d.create_directory("cache"))
+      for _ in range(2):
+        loader = load_pytd.Loader("base", self.PYTHON_VERSION,
+                                  pyi_cache=cache)
+        self.assertTrue(loader.import_name("errno").Lookup("errno.errorcode"))
+      self.assertEqual(len(os.listdir(cache.path)), 1)
+
+  def _lazy_loader(self, path):
+    loader = load_pytd.Loader("base", self.PYTHON_VERSION, pythonpath=[path],
+                              lazy_pyi=True)
+    loader.LAZY_PYI_MIN_SIZE = 0
+    return loader
+
+  def testLazyPyi(self):
+    with utils.Tempdir() as d:
+      d.create_file("foo.pyi", """
+        import bar
+        def f() -> bar.B[int]
+      """)
+      d.create_file("bar.pyi", """
+        from typing import Generic, TypeVar
+        T = TypeVar("T")
+        class A(object): ...
+        class B(A, Generic[T]):
+          def g(self) -> T
+        class C(object):
+          def h(self, x: T) -> T
+        D = C
+      """)
+      loader = self._lazy_loader(d.path)
+      foo = loader.import_name("foo")
+      b = foo.Lookup("foo.f").signatures[0].return_type.base_type.cls
+      bar = loader._modules["bar"]
+      self.assertTrue(bar.lazy_source)
+      self.assertIs(bar.ast.Lookup("bar.B"), b)
+      self.assertTrue(bar.ast.Lookup("bar.A"))
+      self.assertRaises(KeyError, bar.ast.Lookup, "bar.C")
+      self.assertIs(loader.import_name("bar"), bar.ast)
+      self.assertFalse(bar.lazy_source)
+      self.assertIs(bar.ast.Lookup("bar.B"), b)
+      self.assertIs(b.parents[0].cls, bar.ast.Lookup("bar.A"))
+      self.assertIs(bar.ast.Lookup("bar.D").type.cls, bar.ast.Lookup("bar.C"))
+      expected = load_pytd.Loader("base", self.PYTHON_VERSION,
+                                  pythonpath=[d.path]).import_name("bar")
+      self.assertMultiLineEqual(pytd_utils.Print(bar.ast),
+                                pytd_utils.Print(expected))
+
+  def testLazyPyiCircularDependency(self):
+    with utils.Tempdir() as d:
+      d.create_file("foo.pyi", """
+        import bar
+        class X(bar.Y): ...
+        class Z(object): ...
+        def f() -> bar.Y
+      """)
+      d.create_file("bar.pyi", """
+        import foo
+        class Y(object):
+          def g(self) -> foo.Z
+        def h() -> foo.X
+      """)
+      loader = self._lazy_loader(d.path)
+      foo = loader.import_name("foo")
+      bar = loader.import_name("bar")
+      self.assertIs(foo.Lookup("foo.X").parents[0].cls, bar.Lookup("bar.Y"))
+      self.assertIs(bar.Lookup("bar.Y").Lookup("g").signatures[0]
+                    .return_type.cls, foo.Lookup("foo.Z"))
+      self.assertIs(bar.Lookup("bar.h").signatures[0].return_type.cls,
+                    foo.Lookup("foo.X"))
+
+  def testLazyPyiStarImport(self):
+    with utils.Tempdir() as d:
+      d.create_file("foo.pyi", """
+        from bar import *
+        class A(object): ...
+      """)
+      d.create_file("bar.pyi", """
+        class B(object): ...
+        class C(object): ...
+      """)
+      d.create_file("baz.pyi", """
+        import foo
+        x = ...  # type: foo.B
+      """)
+      loader = self._lazy_loader(d.path)
+      baz = loader.import_name("baz")
+      self.assertTrue(loader._modules["foo"].lazy_source)
+      self.assertIs(baz.Lookup("baz.x").type.cls,
+                    loader.import_name("bar").Lookup("bar.B"))
+      self.assertTrue(loader.import_name("foo").Lookup("foo.C"))
+
+  def testLazyPyiSaveToPickle(self):
+    with utils.Tempdir() as d:
+      d.create_file("foo.pyi", """
+        import bar
+        x = ...  # type: bar.A
+      """)
+      d.create_file("bar.pyi", """
+        class A(object): ...
+        class B(object): ...
+      """)
+      filename = d.create_file("builtins.pickle")
+      loader = self._lazy_loader(d.path)
+      loader.import_name("foo")
+      loader.save_to_pickle(filename)
+      loader = load_pytd.PickledPyiLoader.load_from_pickle(
+          filename, "base", python_version=self.PYTHON_VERSION)
+      self.assertTrue(loader.import_name("bar").Lookup("bar.B"))
+
+  def testPrefetch(self):
+    with utils.Tempdir() as d:
+      d.create_file("foo.pyi", """
+        import bar
+        x = ...  # type: bar.A
+      """)
+      d.create_file("bar.pyi", "class A(object): ...")
+      loader = load_pytd.Loader("base", self.PYTHON_VERSION,
+                                pythonpath=[d.path])
+      loader.prefetch(["foo"], processes=2)
+      self.assertTrue(loader._prefetched["foo"])
+      self.assertTrue(loader._prefetched["bar"])
+      foo = loader.import_name("foo")
+      self.assertFalse(loader._prefetched)
+      self.assertIs(foo.Lookup("foo.x").type.cls,
+                    loader.import_name("bar").Lookup("bar.A"))
+
+  def testPrefetchChangedFile(self):
+    with utils.Tempdir() as d:
+      d.create_file("foo.pyi", "class A(object): ...")
+      loader = load_pytd.Loader("base", self.PYTHON_VERSION,
+                                pythonpath=[d.path])
+      loader.prefetch(["foo"], processes=2)
+      d.create_file("foo.pyi", "class B(object): ...")
+      self.assertTrue(loader.import_name("foo").Lookup("foo.B"))
+
+  def testImportNames(self):
+    with utils.Tempdir() as d:
+      d.create_file("foo.pyi", """
+        import bar
+        from baz import f
+        x = ...  # type: bar.A
+      """)
+      d.create_file("bar.pyi", """
+        import baz
+        class A(baz.B): ...
+      """)
+      d.create_file("baz.pyi", """
+        class B(object): ...
+        def f(x: B) -> B: ...
+      """)
+      pickles = []
+      for processes in (1, 2):
+        loader = load_pytd.Loader("base", self.PYTHON_VERSION,
+                                  pythonpath=[d.path])
+        foo, bar = loader.import_names(["foo", "bar"], processes=processes)
+        self.assertIs(foo.Lookup("foo.x").type.cls, bar.Lookup("bar.A"))
+        self.assertIs(bar.Lookup("bar.A").parents[0].cls,
+                      loader.import_name("baz").Lookup("baz.B"))
+        filename = d.create_file("builtins%d.pickle" % processes)
+        loader.save_to_pickle(filename)
+        with open(filename, "rb") as fi:
+          pickles.append(fi.read())
+      self.assertEqual(pickles[0], pickles[1])
+
   def testPath(self):
     with utils.Tempdir() as d1:
       with utils.Tempdir() as d2:
@@ -248,10 +433,83 @@ class ImportPathsTest(unittest.TestCase):
       ast = loader.import_name("pkg.sub")
       self.assertTrue(ast.Lookup("pkg.sub.X"))
 
+  def testSuperClassHierarchy(self):
+    with utils.Tempdir() as d:
+      d.create_file("foo.pyi", "class A(int): ...")
+      loader = load_pytd.Loader("base", self.PYTHON_VERSION,
+                                pythonpath=[d.path])
+      hierarchy = loader.get_superclass_hierarchy()
+      self.assertIs(hierarchy, loader.get_superclass_hierarchy())
+      self.assertIn("__builtin__.bool",
+                    hierarchy.ExpandSubClasses("__builtin__.int"))
+      loader.import_name("foo")
+      hierarchy = loader.get_superclass_hierarchy()
+      self.assertLessEqual({"foo.A", "__builtin__.int", "__builtin__.object"},
+                           hierarchy.ExpandSuperClasses("foo.A"))
+      self.assertIn("foo.A", hierarchy.ExpandSubClasses("__builtin__.int"))
+      self.assertEqual(
+          loader.concat_all().Visit(visitors.ExtractSuperClassesByName()),
+          hierarchy.GetSuperClasses())
+
+  def testConcatAll(self):
+    with utils.Tempdir() as d:
+      d.create_file("foo.pyi", "class A(int): ...")
+      d.create_file("bar.pyi", "class B(int): ...")
+      loader = load_pytd.Loader("base", self.PYTHON_VERSION,
+                                pythonpath=[d.path])
+      loader.import_name("foo")
+      concatenated = loader.concat_all()
+      self.assertIs(concatenated, loader.concat_all())
+      loader.import_name("foo")
+      self.assertIs(concatenated, loader.concat_all())
+      loader.import_name("bar")
+      # New modules are appended to the previous concatenation.
+      extended = loader.concat_all()
+      self.assertEqual(concatenated.classes,
+                       extended.classes[:len(concatenated.classes)])
+      self.assertEqual("foo.A", extended.Lookup("foo.A").name)
+      self.assertEqual("bar.B", extended.Lookup("bar.B").name)
+      self.assertEqual("<all>", extended.name)
+
 
 _Module = collections.namedtuple("_", ["module_name", "file_name"])
 
 
+class PathCacheTest(unittest.TestCase):
+  """Tests for load_pytd._PathCache."""
+
+  def testExists(self):
+    with utils.Tempdir() as d:
+      d.create_file("foo/bar.pyi")
+      cache = load_pytd._PathCache()
+      self.assertTrue(cache.exists(os.path.join(d.path, "foo")))
+      self.assertTrue(cache.isdir(os.path.join(d.path, "foo")))
+      self.assertTrue(cache.exists(os.path.join(d.path, "foo", "bar.pyi")))
+      self.assertFalse(cache.isdir(os.path.join(d.path, "foo", "bar.pyi")))
+      self.assertFalse(cache.exists(os.path.join(d.path, "foo", "baz.pyi")))
+      self.assertFalse(cache.exists(os.path.join(d.path, "baz", "bar.pyi")))
+      self.assertFalse(cache.isdir(os.path.join(d.path, "baz")))
+
+  def testDanglingSymlink(self):
+    with utils.Tempdir() as d:
+      os.symlink(os.path.join(d.path, "missing.pyi"),
+                 os.path.join(d.path, "foo.pyi"))
+      cache = load_pytd._PathCache()
+      self.assertFalse(cache.exists(os.path.join(d.path, "foo.pyi")))
+      loader = load_pytd.Loader("base", (2, 7), pythonpath=[d.path])
+      self.assertIsNone(loader.import_name("foo"))
+
+  def testListingIsCached(self):
+    with utils.Tempdir() as d:
+      d.create_directory("foo")
+      cache = load_pytd._PathCache()
+      self.assertFalse(cache.exists(os.path.join(d.path, "foo", "bar.pyi")))
+      d.create_file("foo/bar.pyi")
+      self.assertFalse(cache.exists(os.path.join(d.path, "foo", "bar.pyi")))
+      self.assertTrue(load_pytd._PathCache().exists(
+          os.path.join(d.path, "foo", "bar.pyi")))
+
+
 class PickledPyiLoaderTest(unittest.TestCase):
 
   PYTHON_VERSION = (2, 7)
@@ -383,6 +641,84 @@ class PickledPyiLoaderTest(unittest.TestCase):
       self.assertTrue(loader.import_name("foo"))
       self.assertTrue(loader.import_name("ctypes"))
 
+  def testPickledBuiltinsUnpickledLazily(self):
+    with utils.Tempdir() as d:
+      filename = d.create_file("builtins.pickle")
+      base_loader = load_pytd.Loader("base", self.PYTHON_VERSION)
+      base_loader.import_name("datetime")
+      base_loader.save_to_pickle(filename)
+      loader = load_pytd.PickledPyiLoader.load_from_pickle(
+          filename, "base", python_version=self.PYTHON_VERSION)
+      self.assertTrue(loader._modules["datetime"].needs_unpickling())
+      self.assertTrue(loader.import_name("datetime"))
+      self.assertFalse(loader._modules["datetime"].needs_unpickling())
+
+  def testSharePickledBuiltins(self):
+    with utils.Tempdir() as d:
+      filename = d.create_file("builtins.pickle")
+      d.create_file("foo.pyi", "x = ...  # type: int")
+      load_pytd.Loader("base", self.PYTHON_VERSION).save_to_pickle(filename)
+      old_shared = load_pytd._shared_precompiled_builtins
+      load_pytd.share_precompiled_builtins()
+      try:
+        loader1, loader2 = [load_pytd.PickledPyiLoader.load_from_pickle(
+            filename, "base", python_version=self.PYTHON_VERSION,
+            pythonpath=[d.path]) for _ in range(2)]
+      finally:
+        load_pytd._shared_precompiled_builtins = old_shared
+      self.assertIs(loader1.builtins, loader2.builtins)
+      self.assertTrue(loader1.import_name("foo"))
+      self.assertNotIn("foo", loader2._modules)
+
+  def testUnpickleAll(self):
+    with utils.Tempdir() as d:
+      filename = d.create_file("builtins.pickle")
+      loader = load_pytd.Loader("base", self.PYTHON_VERSION)
+      loader.import_name("sys")
+      loader.save_to_pickle(filename)
+      loader = load_pytd.PickledPyiLoader.load_from_pickle(
+          filename, "base", python_version=self.PYTHON_VERSION)
+      self.assertTrue(loader._modules["sys"].pickle)
+      loader.unpickle_all()
+      self.assertFalse(any(m.pickle for m in loader._modules.values()))
+      self.assertTrue(loader._modules["sys"].ast.Lookup("sys.path"))
+
+  def testUnpickleDependenciesFromIndex(self):
+    with utils.Tempdir() as d:
+      filename = d.create_file("builtins.pickle")
+      loader = load_pytd.Loader("base", self.PYTHON_VERSION)
+      loader.import_name("datetime")
+      loader.save_to_pickle(filename)
+      loader = load_pytd.PickledPyiLoader.load_from_pickle(
+          filename, "base", python_version=self.PYTHON_VERSION)
+      archive = loader._modules["datetime"].pickle.archive
+      read = []
+      archive_read = archive.Read
+      def Read(name):
+        read.append(name)
+        return archive_read(name)
+      archive.Read = Read
+      pickled = {name for name in archive.Dependencies("datetime")
+                 if loader._modules[name].pickle}
+      loader.import_name("datetime")
+      # The pickled dependencies in the index were read in one pass over the
+      # file, together with the module itself.
+      self.assertIn("datetime", read)
+      self.assertTrue(pickled <= set(read))
+      self.assertEqual(read, sorted(read, key=archive.Offset))
+
+  def testLegacyPickledBuiltins(self):
+    with utils.Tempdir() as d:
+      filename = d.create_file("builtins.pickle")
+      base_loader = load_pytd.Loader("base", self.PYTHON_VERSION)
+      items = tuple((name, serialize_ast.StoreAst(module.ast))
+                    for name, module in sorted(base_loader._modules.items()))
+      pytd_utils.SavePickle(items, filename, compress=True)
+      loader = load_pytd.PickledPyiLoader.load_from_pickle(
+          filename, "base", python_version=self.PYTHON_VERSION)
+      self.assertTrue(loader.import_name("sys"))
+      self.assertTrue(loader.builtins.Lookup("__builtin__.int"))
+
 
 class Python3Test(unittest.TestCase):
   """Tests for load_pytd.py."""
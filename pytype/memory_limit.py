@@ -0,0 +1,109 @@
+"""A soft limit on the memory use of pytype (--max-memory).
+
+Instead of running out of memory on large files, the VM checks the resident set
+size (RSS) of the process every CHECK_INTERVAL opcodes, and as it gets close to
+the limit, degrades the analysis in these levels:
+
+  DROP_CALL_RECORDS: Drop the call records of the functions analyzed so far,
+    and the references to their last frames. Their signatures in the pyi are
+    then generated from their definitions only.
+  REDUCE_DEPTH: Don't follow calls into other functions (like --quick).
+  REUSE_CALLS: Reuse the result of any earlier call of a function with the same
+    arguments, even with --no-skip-calls, and even if it's unsolvable.
+  STOP_ANALYSIS: Don't analyze any more functions, and emit what we have.
+"""
+
+import logging
+import resource
+import sys
+
+
+log = logging.getLogger(__name__)
+
+DROP_CALL_RECORDS = "drop-call-records"
+REDUCE_DEPTH = "reduce-depth"
+REUSE_CALLS = "reuse-calls"
+STOP_ANALYSIS = "stop-analysis"
+
+# The levels, with the fractions of the limit at which they're triggered.
+_LEVELS = ((0.7, DROP_CALL_RECORDS),
+           (0.8, REDUCE_DEPTH),
+           (0.9, REUSE_CALLS),
+           (1.0, STOP_ANALYSIS))
+
+# How many opcodes the VM runs between two measurements.
+CHECK_INTERVAL = 1000
+
+# The maximum depth of the analysis from REDUCE_DEPTH on. See
+# vm.VirtualMachine.is_at_maximum_depth: Analyze a function, but not its calls.
+_REDUCED_MAXIMUM_DEPTH = 1
+
+
+def get_rss():
+  """Get the resident set size of this process, in bytes.
+
+  Returns:
+    The current size on Linux. Elsewhere, the peak size so far.
+  """
+  try:
+    with open("/proc/self/statm") as fi:
+      return int(fi.read().split()[1]) * resource.getpagesize()
+  except (IOError, IndexError, ValueError):
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+class MemoryLimit(object):
+  """A soft limit on the memory use of the process.
+
+  Attributes:
+    limit: The limit in bytes.
+    levels: The levels triggered so far, in order.
+  """
+
+  def __init__(self, limit, interval=CHECK_INTERVAL, get_memory=get_rss):
+    """Constructor.
+
+    Args:
+      limit: The limit in bytes.
+      interval: Measure the memory use on the first, and then on every
+        interval'th, call of check().
+      get_memory: A function returning the memory use in bytes.
+    """
+    self.limit = limit
+    self.levels = []
+    self._interval = interval
+    self._countdown = 1  # measure on the first call
+    self._get_memory = get_memory
+
+  def check(self):
+    """Check the memory use, every so many calls.
+
+    Returns:
+      The levels that have been triggered since the last check.
+    """
+    self._countdown -= 1
+    if self._countdown:
+      return []
+    self._countdown = self._interval
+    memory = self._get_memory()
+    new_levels = [level for fraction, level in _LEVELS[len(self.levels):]
+                  if memory >= fraction * self.limit]
+    for level in new_levels:
+      log.warning("Memory use of %d MB triggered level %s of --max-memory",
+                  memory >> 20, level)
+    self.levels.extend(new_levels)
+    return new_levels
+
+  def reached(self, level):
+    return level in self.levels
+
+  def cap_depth(self, maximum_depth):
+    """Limit the maximum depth of the analysis according to the levels."""
+    if self.reached(STOP_ANALYSIS):
+      return 0
+    elif self.reached(REDUCE_DEPTH):
+      return min(maximum_depth, _REDUCED_MAXIMUM_DEPTH)
+    else:
+      return maximum_depth
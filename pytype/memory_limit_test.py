@@ -0,0 +1,99 @@
+"""Tests for memory_limit.py."""
+
+import sys
+import textwrap
+
+from pytype import analyze
+from pytype import config
+from pytype import errors
+from pytype import load_pytd
+from pytype import memory_limit
+from pytype.pytd import pytd
+
+import unittest
+
+
+class MemoryLimitTest(unittest.TestCase):
+  """Tests for MemoryLimit."""
+
+  def test_get_rss(self):
+    self.assertGreater(memory_limit.get_rss(), 0)
+
+  def test_levels(self):
+    memory = [0]
+    limit = memory_limit.MemoryLimit(100, interval=2,
+                                     get_memory=lambda: memory[0])
+    self.assertEqual(limit.check(), [])
+    memory[0] = 85
+    self.assertEqual(limit.check(), [])  # not measured
+    self.assertEqual(limit.check(), [memory_limit.DROP_CALL_RECORDS,
+                                     memory_limit.REDUCE_DEPTH])
+    memory[0] = 100
+    limit.check()
+    self.assertEqual(limit.check(), [memory_limit.REUSE_CALLS,
+                                     memory_limit.STOP_ANALYSIS])
+    self.assertEqual(limit.levels, [memory_limit.DROP_CALL_RECORDS,
+                                    memory_limit.REDUCE_DEPTH,
+                                    memory_limit.REUSE_CALLS,
+                                    memory_limit.STOP_ANALYSIS])
+
+  def test_cap_depth(self):
+    memory = [0]
+    limit = memory_limit.MemoryLimit(100, interval=1,
+                                     get_memory=lambda: memory[0])
+    self.assertEqual(limit.cap_depth(sys.maxsize), sys.maxsize)
+    memory[0] = 80
+    limit.check()
+    self.assertTrue(limit.reached(memory_limit.REDUCE_DEPTH))
+    self.assertEqual(limit.cap_depth(sys.maxsize), 1)
+    memory[0] = 100
+    limit.check()
+    self.assertEqual(limit.cap_depth(sys.maxsize), 0)
+
+
+class DegradeTest(unittest.TestCase):
+  """Tests for the analysis under a memory limit."""
+
+  _SRC = textwrap.dedent("""\
+    def f(x):
+      return g(x)
+    def g(x):
+      return [x]
+    def h():
+      return f(42)
+  """)
+
+  def _infer(self, memory):
+    options = config.Options.create()
+    loader = load_pytd.Loader(None, options.python_version)
+    limit = memory_limit.MemoryLimit(100, interval=1, get_memory=lambda: memory)
+    ast, _ = analyze.infer_types(self._SRC, errors.ErrorLog(), options, loader,
+                                 memory_limit=limit)
+    return ast, limit.levels
+
+  def _return_type(self, ast, name):
+    signature, = ast.Lookup(name).signatures
+    return pytd.Print(signature.return_type)
+
+  def test_no_degradation(self):
+    ast, levels = self._infer(memory=0)
+    self.assertEqual(levels, [])
+    self.assertEqual(self._return_type(ast, "h"), "List[int]")
+
+  def test_reduce_depth(self):
+    ast, levels = self._infer(memory=80)
+    self.assertEqual(levels, [memory_limit.DROP_CALL_RECORDS,
+                              memory_limit.REDUCE_DEPTH])
+    # Every function is analyzed, but calls into other functions aren't.
+    self.assertEqual(self._return_type(ast, "h"), "Any")
+    self.assertEqual(self._return_type(ast, "g"), "List[_T0]")
+
+  def test_stop_analysis(self):
+    ast, levels = self._infer(memory=100)
+    self.assertIn(memory_limit.STOP_ANALYSIS, levels)
+    for name in ("f", "g", "h"):
+      self.assertEqual(self._return_type(ast, name), "Any")
+
+
+if __name__ == "__main__":
+  unittest.main()
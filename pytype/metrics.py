@@ -22,8 +22,6 @@ import math
 import re
 import time
 
-import yaml
-
 # TODO(tsudol): Not needed once pytype is ported to Python 3.
 try:
   import tracemalloc  # pylint: disable=g-import-not-at-top
@@ -75,6 +73,7 @@ def get_report():
 
 def merge_from_file(metrics_file):
   """Merge metrics recorded in another file into the current metrics."""
+  import yaml  # pylint: disable=g-import-not-at-top
   for metric in yaml.load(metrics_file):
     existing = _registered_metrics.get(metric.name)
     if existing is None:
@@ -105,6 +104,10 @@ class Metric(object):
     """Return a string sumamrizing the value of the metric."""
     raise NotImplementedError
 
+  def _reset(self):
+    """Reset the metric to its initial value."""
+    raise NotImplementedError
+
   def _merge(self, other):
     """Merge data from another metric of the same type."""
     raise NotImplementedError
@@ -118,6 +121,9 @@ class Counter(Metric):
 
   def __init__(self, name):
     super(Counter, self).__init__(name)
+    self._reset()
+
+  def _reset(self):
     self._total = 0
 
   def inc(self, count=1):
@@ -141,6 +147,10 @@ class StopWatch(Metric):
 
   def __init__(self, name):
     super(StopWatch, self).__init__(name)
+    self._reset()
+
+  def _reset(self):
+    self._total = 0
 
   def __enter__(self):
     self._start_time = time.clock()
@@ -162,6 +172,9 @@ class ReentrantStopWatch(Metric):
 
   def __init__(self, name):
     super(ReentrantStopWatch, self).__init__(name)
+    self._reset()
+
+  def _reset(self):
     self._time = 0
     self._calls = 0
 
@@ -188,6 +201,9 @@ class MapCounter(Metric):
 
   def __init__(self, name):
     super(MapCounter, self).__init__(name)
+    self._reset()
+
+  def _reset(self):
     self._counts = {}
     self._total = 0
 
@@ -225,6 +241,9 @@ class Distribution(Metric):
 
   def __init__(self, name):
     super(Distribution, self).__init__(name)
+    self._reset()
+
+  def _reset(self):
     self._count = 0  # Number of values.
     self._total = 0.0  # Sum of the values.
     self._squared = 0.0  # Sum of the squares of the values.
@@ -286,7 +305,7 @@ class Snapshot(Metric):
   def __init__(self, name, enabled=False, groupby="lineno",
                nframes=1, count=10):
     super(Snapshot, self).__init__(name)
-    self.snapshots = []
+    self._reset()
     # The metric to group memory blocks by. Default is "lineno", which groups by
     # which file and line allocated the block. The other useful value is
     # "traceback", which groups by the stack frames leading to each allocation.
@@ -304,6 +323,9 @@ class Snapshot(Metric):
     # options.memory_snapshot flag set by the --memory-snapshots option)
     self.enabled = tracemalloc and _enabled and enabled
 
+  def _reset(self):
+    self.snapshots = []
+
   def _start_tracemalloc(self):
     tracemalloc.start(self.nframes)
     self.running = True
@@ -344,7 +366,12 @@ class Snapshot(Metric):
 
 
 class MetricsContext(object):
-  """A context manager that configures metrics and writes their output."""
+  """A context manager that configures metrics and writes their output.
+
+  Metrics are collected per context: Metrics that already exist are reset when
+  entering the context, and metrics created inside the context are removed when
+  leaving it. That way, a long-running process can run pytype several times.
+  """
 
   def __init__(self, output_path):
     """Initialize.
@@ -355,15 +382,24 @@ class MetricsContext(object):
     """
     self._output_path = output_path
     self._old_enabled = None  # Set in __enter__.
+    self._old_names = None  # Set in __enter__.
 
   def __enter__(self):
     global _enabled
     self._old_enabled = _enabled
+    self._old_names = set(_registered_metrics)
+    for metric in _registered_metrics.values():
+      metric._reset()  # pylint: disable=protected-access
     _enabled = bool(self._output_path)
 
   def __exit__(self, exc_type, exc_value, traceback):
     global _enabled
     _enabled = self._old_enabled
     if self._output_path:
+      # yaml takes longer to import than most runs take to get started, so
+      # only import it when metrics are actually written.
+      import yaml  # pylint: disable=g-import-not-at-top
       with open(self._output_path, "w") as f:
         yaml.dump(list(_registered_metrics.values()), f)
+    for name in set(_registered_metrics) - self._old_names:
+      del _registered_metrics[name]
@@ -305,6 +305,17 @@ class MetricsContextTest(unittest.TestCase):
       self._counter.inc()
     self.assertEqual(0, self._counter._total)
 
+  def test_repeated(self):
+    with tempfile.NamedTemporaryFile() as out:
+      out.close()
+      for _ in range(2):
+        with metrics.MetricsContext(out.name):
+          self._counter.inc()
+          with metrics.StopWatch("bar"):
+            pass
+        self.assertEqual(1, self._counter._total)
+        self.assertEqual(["foo"], list(metrics._registered_metrics))
+
 
 if __name__ == "__main__":
   unittest.main()
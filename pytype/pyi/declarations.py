@@ -0,0 +1,211 @@
+"""A cheap pre-scan of pyi source, indexing its top-level declarations.
+
+The scan doesn't parse anything. It splits the source into top-level
+declarations (a class with its body, a function with its decorators, a
+constant, ...) by looking at indentation and brackets, and notes the name each
+one declares and the identifiers it mentions. That's enough to cut out the
+source of the declarations a user of the module needs, plus everything they
+refer to, and to parse only that.
+
+Declarations that don't declare names ("if" blocks, star imports, and anything
+the scan doesn't recognize), TypeVars, and the declarations of a few special
+names are always included.
+Including a declaration too many is harmless, so identifiers are collected
+without regard to what they mean.
+"""
+
+import re
+
+
+_IDENTIFIER = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+# The tokens that matter for finding the start of top-level statements.
+_TOKEN = re.compile(r"""
+    (\"\"\"|\'\'\')[\s\S]*?\1 |  # multi-line strings
+    '[^'\\\n]*(?:\\.[^'\\\n]*)*' |  # strings
+    "[^"\\\n]*(?:\\.[^"\\\n]*)*" |
+    \#[^\n]* |  # comments
+    \\\n |  # line continuations
+    [()\[\]{}\n]
+""", re.VERBOSE)
+_DEFINITION = re.compile(r"(?:async\s+)?(?:def|class)\s+([A-Za-z_]\w*)")
+_ASSIGNMENT = re.compile(r"([A-Za-z_]\w*)\s*(?:=|:)")
+_IMPORT = re.compile(r"(?:from\s+[\w.]+\s+)?import\s+([^#]*)")
+_IMPORTED_NAME = re.compile(r"([\w.]+)(?:\s+as\s+(\w+))?$")
+
+# Names whose declarations are always included: __getattr__ can resolve any
+# name, and the others are names the parser introduces without them appearing in
+# the source (e.g. NoneType for "Optional", list for "typing.List").
+_ALWAYS_INCLUDED_NAMES = frozenset([
+    "__getattr__", "NoneType", "classobj", "object", "list", "dict", "tuple",
+    "set", "frozenset", "generator", "type"])
+
+
+class ScanError(Exception):
+  """If the source has constructs the scan doesn't handle."""
+
+
+class _Declaration(object):
+  """A top-level declaration: a range of the source."""
+
+  def __init__(self, start):
+    self.start = start
+    self.end = None
+    self.header = None  # the first line that's not a decorator
+    self.names = ()  # empty if the declaration is always included
+
+
+class DeclarationIndex(object):
+  """The top-level declarations of a pyi source, indexed by name.
+
+  Declarations are referred to by their number, in order of appearance.
+  """
+
+  def __init__(self, src):
+    """Scan the source.
+
+    Args:
+      src: The pyi source, a string.
+
+    Raises:
+      ScanError: If the source can't be scanned reliably.
+    """
+    self.src = src
+    self._declarations = _scan(src)
+    self._by_name = {}
+    self._always = set()
+    self._references = []
+    for i, d in enumerate(self._declarations):
+      text = src[d.start:d.end]
+      if not d.names:
+        self._always.add(i)
+      for name in d.names:
+        self._by_name.setdefault(name, []).append(i)
+      self._references.append(frozenset(_IDENTIFIER.findall(text)))
+
+  def __len__(self):
+    return len(self._declarations)
+
+  def names(self):
+    """The names of the declarations that aren't always included."""
+    return set(self._by_name)
+
+  def always_included(self):
+    """The declarations that are always included."""
+    return set(self._always)
+
+  def closure(self, names=()):
+    """The declarations of the given names and everything they refer to.
+
+    Args:
+      names: An iterable of names. Names that aren't declared are ignored.
+
+    Returns:
+      A set of declaration numbers, including the declarations that are
+      always included.
+    """
+    todo = list(self._always)
+    for name in names:
+      todo.extend(self._by_name.get(name, ()))
+    result = set()
+    while todo:
+      i = todo.pop()
+      if i in result:
+        continue
+      result.add(i)
+      for identifier in self._references[i]:
+        todo.extend(self._by_name.get(identifier, ()))
+    return result
+
+  def source(self, declarations):
+    """The source of the given declarations, in their original order."""
+    return "".join(self.src[self._declarations[i].start:
+                            self._declarations[i].end]
+                   for i in sorted(declarations))
+
+
+def _statement_starts(src):
+  """Yield the offsets of the lines that start a logical line."""
+  yield 0
+  depth = 0
+  for m in _TOKEN.finditer(src):
+    token = m.group()
+    if token == "\n":
+      if not depth:
+        yield m.end()
+    elif token in "([{":
+      depth += 1
+    elif token in ")]}":
+      depth -= 1
+      if depth < 0:
+        raise ScanError("Unbalanced brackets")
+  if depth:
+    raise ScanError("Unexpected end of source")
+
+
+def _scan(src):
+  """Split src into top-level declarations."""
+  declarations = []
+  for offset in _statement_starts(src):
+    if src[offset:offset + 1] in ("", " ", "\t", "\r", "\n", "\f", "#"):
+      continue  # indented, blank or a comment
+    line = src[offset:src.find("\n", offset) + 1 or len(src)]
+    keyword = line.split(None, 1)[0].rstrip(":")
+    current = declarations[-1] if declarations else None
+    if current and (current.header is None or keyword in ("elif", "else")):
+      # Continues a decorated definition or an "if" block.
+      if current.header is None and not line.startswith("@"):
+        current.header = line
+    else:
+      current = _Declaration(offset)
+      if not line.startswith("@"):
+        current.header = line
+      if declarations:
+        declarations[-1].end = offset
+      declarations.append(current)
+  if declarations:
+    # Comments and blank lines around the declarations belong to the first and
+    # the last one.
+    declarations[0].start = 0
+    declarations[-1].end = len(src)
+  for d in declarations:
+    d.names = _declared_names(d.header, src[d.start:d.end])
+  return declarations
+
+
+def _imported_names(statement):
+  """The names an import statement declares. Empty for a star import."""
+  m = _IMPORT.match(statement)
+  if not m:
+    raise ScanError("Can't parse import: %r" % statement)
+  names = []
+  for item in m.group(1).strip("() \t").split(","):
+    item = item.strip()
+    if item == "*":
+      return ()
+    elif not item:
+      continue  # trailing comma
+    m = _IMPORTED_NAME.match(item)
+    if not m:
+      raise ScanError("Can't parse import: %r" % statement)
+    # "import a.b" declares "a".
+    names.append(m.group(2) or m.group(1).split(".")[0])
+  return tuple(names)
+
+
+def _declared_names(header, text):
+  """The names a declaration declares, or () to always include it."""
+  if header is None:
+    raise ScanError("Decorator without a definition")
+  if header.startswith(("import", "from")) and _IMPORT.match(header):
+    # Imports can span lines, and can have comments on each of them.
+    statement = " ".join(
+        line.split("#", 1)[0].rstrip("\\") for line in text.splitlines())
+    names = _imported_names(statement.strip())
+  else:
+    m = _DEFINITION.match(header) or _ASSIGNMENT.match(header)
+    if not m or "TypeVar(" in text:
+      return ()
+    names = (m.group(1),)
+  if _ALWAYS_INCLUDED_NAMES.intersection(names):
+    return ()
+  return names
@@ -0,0 +1,137 @@
+import textwrap
+
+from pytype.pyi import declarations
+
+import unittest
+
+
+class DeclarationIndexTest(unittest.TestCase):
+
+  def _index(self, src):
+    return declarations.DeclarationIndex(textwrap.dedent(src))
+
+  def _closure_source(self, index, *names):
+    return index.source(index.closure(names))
+
+  def test_split(self):
+    index = self._index("""
+      import foo
+      from typing import List
+
+      x = ...  # type: int
+
+      class A(object):
+        y = ...  # type: List[B]
+
+      class B(object):
+        pass
+
+      def f(x: A) -> None: ...
+    """)
+    self.assertEqual(len(index), 6)
+    self.assertEqual(index.names(), {"foo", "List", "x", "A", "B", "f"})
+    self.assertFalse(index.always_included())
+    self.assertEqual(index.source(range(len(index))), index.src)
+
+  def test_closure(self):
+    index = self._index("""
+      from typing import List
+      x = ...  # type: int
+      class A(object):
+        y = ...  # type: List[B]
+      class B(object):
+        pass
+      class C(object):
+        pass
+      def f(a: A) -> None: ...
+    """)
+    src = self._closure_source(index, "f")
+    self.assertIn("from typing import List", src)
+    self.assertIn("def f", src)
+    self.assertIn("class A", src)
+    self.assertIn("class B", src)
+    self.assertNotIn("class C", src)
+    self.assertNotIn("x = ", src)
+    self.assertEqual(self._closure_source(index, "unknown"), "")
+
+  def test_imports(self):
+    index = self._index("""
+      import os
+      import os.path, sys as system
+      from typing import (Any,  # comment
+          List as L,
+      )
+      from foo import \\
+          bar
+      from . import baz
+      from qux import *
+    """)
+    self.assertEqual(index.names(),
+                     {"os", "system", "Any", "L", "bar", "baz"})
+    self.assertEqual(len(index.closure(["os"])), 3)
+    self.assertEqual(self._closure_source(index).strip(), "from qux import *")
+
+  def test_overloads(self):
+    index = self._index("""
+      from typing import overload
+      @overload
+      def f(x: int) -> int: ...
+      @overload
+      def f(x: str) -> str: ...
+      def g() -> None: ...
+    """)
+    self.assertEqual(index.names(), {"overload", "f", "g"})
+    src = self._closure_source(index, "f")
+    self.assertEqual(src.count("@overload"), 2)
+    self.assertNotIn("def g", src)
+
+  def test_always_included(self):
+    index = self._index("""
+      import sys
+      from typing import Any, TypeVar
+      T = TypeVar('T')
+      if sys.version_info >= (3,):
+        def f() -> str: ...
+      elif sys.version_info >= (2, 7):
+        def f() -> unicode: ...
+      else:
+        def f() -> bytes: ...
+      def __getattr__(name) -> Any: ...
+      class object:
+        pass
+      def g() -> None: ...
+    """)
+    self.assertEqual(index.names(), {"sys", "Any", "TypeVar", "g"})
+    src = self._closure_source(index)
+    self.assertIn("import sys", src)
+    self.assertIn("from typing import Any, TypeVar", src)
+    self.assertIn("T = TypeVar", src)
+    self.assertEqual(src.count("def f"), 3)
+    self.assertIn("def __getattr__", src)
+    self.assertIn("class object", src)
+    self.assertNotIn("def g", src)
+
+  def test_brackets_and_strings(self):
+    index = self._index('''
+      def f(x: int,
+      y: str) -> None: ...
+      x = ...  # type: "(" \\
+      # not a declaration
+      class A(object):
+        """Docstring
+      class B: ...
+        """
+      s = ...  # type: ')'
+    ''')
+    self.assertEqual(index.names(), {"f", "x", "A", "s"})
+
+  def test_unbalanced_brackets(self):
+    self.assertRaises(declarations.ScanError, self._index, "def f(x: int\n")
+    self.assertRaises(declarations.ScanError, self._index, "x = 1)\n")
+
+  def test_decorator_without_definition(self):
+    self.assertRaises(declarations.ScanError, self._index, "@overload\n")
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,193 @@
+"""An on-disk cache of parsed pyi files.
+
+Parsing a pyi file, including the transformations that follow it (see
+parser.post_process_ast), is the same work every time the file is loaded, by
+every process that loads it. This cache stores the parsed ast, in the format of
+binary_ast, keyed by a hash of the file content, the module name, the python
+version and the pytype code doing the parsing. It's safe to share between
+processes: entries are written atomically, and carry a checksum of their
+content. Broken or missing entries are treated as misses.
+
+The cache is bounded in size: whenever an entry is written, the least recently
+used entries are removed until the total size is below max_size.
+"""
+
+import hashlib
+import logging
+import os
+import tempfile
+
+from pytype import utils
+from pytype.pyi import parser
+from pytype.pyi import parser_ext
+from pytype.pytd import binary_ast
+from pytype.pytd import pep484
+from pytype.pytd import pytd
+from pytype.pytd import visitors
+from pytype.pytd.parse import node as pytd_node
+
+log = logging.getLogger(__name__)
+
+
+DEFAULT_MAX_SIZE = 256 * 1024 * 1024
+
+_SUFFIX = ".pyi.bin"
+
+# Every entry starts with the SHA-1 digest of the rest of it.
+_CHECKSUM_SIZE = hashlib.sha1().digest_size
+
+# The modules whose code determines the parsed ast. Cache entries written by
+# any other version of them are not used.
+_PARSING_MODULES = (parser, parser_ext, pep484, visitors, pytd, pytd_node,
+                    binary_ast)
+
+_code_fingerprint = None
+
+
+def _get_code_fingerprint():
+  """A hash of the code in _PARSING_MODULES, computed once per process."""
+  global _code_fingerprint
+  if _code_fingerprint is None:
+    h = hashlib.sha1()
+    for module in _PARSING_MODULES:
+      with open(module.__file__, "rb") as fi:
+        h.update(fi.read())
+    _code_fingerprint = h.hexdigest()
+  return _code_fingerprint
+
+
+class ParseCache(object):
+  """A directory of parsed pyi files, shared by all processes using it."""
+
+  def __init__(self, path, max_size=DEFAULT_MAX_SIZE):
+    """Constructor.
+
+    Args:
+      path: The cache directory. Created if it doesn't exist.
+      max_size: The maximum total size of the cache entries, in bytes.
+    """
+    self.path = path
+    self.max_size = max_size
+    if not os.path.isdir(path):
+      try:
+        os.makedirs(path)
+      except OSError:
+        if not os.path.isdir(path):  # created concurrently by someone else?
+          raise
+
+  def _key(self, src, name, python_version):
+    h = hashlib.sha1()
+    for item in (_get_code_fingerprint(), name or "",
+                 ".".join(str(v) for v in python_version or ())):
+      h.update(item.encode("utf-8"))
+      h.update(b"\0")
+    h.update(src)
+    return h.hexdigest()
+
+  def parse_file(self, filename, name, python_version):
+    """Parse a pyi file, or retrieve it from the cache. See parser.parse_file.
+
+    Args:
+      filename: The pyi file.
+      name: The module name.
+      python_version: The python version, a tuple.
+
+    Returns:
+      A pytd.TypeDeclUnit.
+
+    Raises:
+      parser.ParseError: If the file can't be parsed. Errors aren't cached.
+    """
+    with open(filename, "r") as fi:
+      src = fi.read()
+    return self.parse_string(src, filename, name, python_version)
+
+  def parse_string(self, src, filename, name, python_version):
+    """Like parse_file, for pyi source that was already read."""
+    ast = self.get(src, filename, name, python_version)
+    if ast is None:
+      ast = parser.parse_string(src, name=name, filename=filename,
+                                python_version=python_version)
+      self.put(src, name, python_version, ast)
+    return ast
+
+  def get(self, src, filename, name, python_version):
+    """Retrieve the ast of a pyi source from the cache, or None on a miss."""
+    ast = self._read(self._entry(src, name, python_version))
+    if ast is not None:
+      ast = ast.Replace(is_package=utils.is_pyi_directory_init(filename))
+    return ast
+
+  def put(self, src, name, python_version, ast):
+    """Store the ast of a pyi source that was parsed elsewhere."""
+    self._write(self._entry(src, name, python_version), ast)
+
+  def _entry(self, src, name, python_version):
+    data = src if isinstance(src, bytes) else src.encode("utf-8")
+    return os.path.join(self.path,
+                        self._key(data, name, python_version) + _SUFFIX)
+
+  def _read(self, entry):
+    try:
+      with open(entry, "rb") as fi:
+        data = fi.read()
+    except (IOError, OSError):
+      return None
+    checksum, data = data[:_CHECKSUM_SIZE], data[_CHECKSUM_SIZE:]
+    if hashlib.sha1(data).digest() != checksum:
+      log.warning("Ignoring broken cache entry %s: Bad checksum", entry)
+      return None
+    try:
+      ast = binary_ast.Load(data)
+    except Exception as e:  # pylint: disable=broad-except
+      log.warning("Ignoring broken cache entry %s: %s", entry, e)
+      return None
+    if not isinstance(ast, pytd.TypeDeclUnit):
+      log.warning("Ignoring broken cache entry %s", entry)
+      return None
+    try:
+      os.utime(entry, None)  # for _evict
+    except OSError:
+      pass
+    return ast
+
+  def _write(self, entry, ast):
+    """Atomically write an entry. Failures are logged, not raised."""
+    data = binary_ast.Dump(ast)
+    data = hashlib.sha1(data).digest() + data
+    try:
+      fd, tmp = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+      try:
+        with os.fdopen(fd, "wb") as fi:
+          fi.write(data)
+        os.rename(tmp, entry)
+      except:
+        os.unlink(tmp)
+        raise
+    except (IOError, OSError) as e:
+      log.warning("Couldn't write cache entry %s: %s", entry, e)
+      return
+    self._evict()
+
+  def _evict(self):
+    """Remove the least recently used entries until we're below max_size."""
+    entries = []
+    total = 0
+    for filename in os.listdir(self.path):
+      if not filename.endswith(_SUFFIX):
+        continue
+      path = os.path.join(self.path, filename)
+      try:
+        stat = os.stat(path)
+      except OSError:
+        continue  # removed concurrently
+      entries.append((stat.st_mtime, path, stat.st_size))
+      total += stat.st_size
+    entries.sort()
+    while total > self.max_size and entries:
+      _, path, size = entries.pop(0)
+      try:
+        os.unlink(path)
+      except OSError:
+        pass
+      total -= size
@@ -0,0 +1,129 @@
+import os
+
+from pytype import utils
+from pytype.pyi import parse_cache
+from pytype.pyi import parser
+from pytype.pytd import pytd_utils
+
+import unittest
+
+
+class ParseCacheTest(unittest.TestCase):
+
+  PYTHON_VERSION = (2, 7)
+
+  SRC = """
+    from typing import List
+    class A(object):
+      x = ...  # type: List[int]
+      def f(self, y: A) -> str: ...
+    def g() -> A: ...
+  """
+
+  def _entries(self, cache):
+    return sorted(f for f in os.listdir(cache.path) if f.endswith(".pyi.bin"))
+
+  def test_hit(self):
+    with utils.Tempdir() as d:
+      filename = d.create_file("foo.pyi", self.SRC)
+      cache = parse_cache.ParseCache(d.create_directory("cache"))
+      ast1 = cache.parse_file(filename, "foo", self.PYTHON_VERSION)
+      entries = self._entries(cache)
+      self.assertEqual(len(entries), 1)
+      ast2 = cache.parse_file(filename, "foo", self.PYTHON_VERSION)
+      self.assertEqual(self._entries(cache), entries)
+      expected = parser.parse_file(filename, "foo", self.PYTHON_VERSION)
+      for ast in (ast1, ast2):
+        self.assertTrue(ast.ASTeq(expected))
+        self.assertEqual(ast.name, "foo")
+        self.assertEqual(pytd_utils.Print(ast), pytd_utils.Print(expected))
+
+  def test_key(self):
+    with utils.Tempdir() as d:
+      filename = d.create_file("foo.pyi", self.SRC)
+      cache = parse_cache.ParseCache(d.create_directory("cache"))
+      cache.parse_file(filename, "foo", self.PYTHON_VERSION)
+      cache.parse_file(filename, "bar", self.PYTHON_VERSION)
+      cache.parse_file(filename, "foo", (3, 6))
+      self.assertEqual(len(self._entries(cache)), 3)
+      d.create_file("foo.pyi", self.SRC + "  def h() -> int: ...\n")
+      ast = cache.parse_file(filename, "foo", self.PYTHON_VERSION)
+      self.assertEqual(len(self._entries(cache)), 4)
+      self.assertTrue(ast.Lookup("foo.h"))
+
+  def test_is_package(self):
+    with utils.Tempdir() as d:
+      module = d.create_file("foo.pyi", self.SRC)
+      package = d.create_file("foo/__init__.pyi", self.SRC)
+      cache = parse_cache.ParseCache(d.create_directory("cache"))
+      self.assertFalse(cache.parse_file(module, "foo", self.PYTHON_VERSION)
+                       .is_package)
+      self.assertTrue(cache.parse_file(package, "foo", self.PYTHON_VERSION)
+                      .is_package)
+
+  def test_broken_entry(self):
+    with utils.Tempdir() as d:
+      filename = d.create_file("foo.pyi", self.SRC)
+      cache = parse_cache.ParseCache(d.create_directory("cache"))
+      cache.parse_file(filename, "foo", self.PYTHON_VERSION)
+      entry, = self._entries(cache)
+      with open(os.path.join(cache.path, entry), "wb") as fi:
+        fi.write(b"garbage")
+      ast = cache.parse_file(filename, "foo", self.PYTHON_VERSION)
+      self.assertTrue(ast.Lookup("foo.A"))
+      self.assertEqual(self._entries(cache), [entry])
+
+  def test_corrupted_entry(self):
+    with utils.Tempdir() as d:
+      filename = d.create_file("foo.pyi", self.SRC)
+      cache = parse_cache.ParseCache(d.create_directory("cache"))
+      cache.parse_file(filename, "foo", self.PYTHON_VERSION)
+      entry, = self._entries(cache)
+      path = os.path.join(cache.path, entry)
+      with open(path, "rb") as fi:
+        data = fi.read()
+      # Still valid binary_ast data, but not what was written.
+      self.assertEqual(data.count(b"foo.g"), 1)
+      data = data.replace(b"foo.g", b"foo.h")
+      with open(path, "wb") as fi:
+        fi.write(data)
+      with open(filename, "r") as fi:
+        src = fi.read()
+      self.assertIsNone(cache.get(src, filename, "foo", self.PYTHON_VERSION))
+      ast = cache.parse_file(filename, "foo", self.PYTHON_VERSION)
+      self.assertTrue(ast.Lookup("foo.A"))
+      self.assertIsNotNone(cache.get(src, filename, "foo",
+                                     self.PYTHON_VERSION))
+
+  def test_parse_error(self):
+    with utils.Tempdir() as d:
+      filename = d.create_file("foo.pyi", "def f(")
+      cache = parse_cache.ParseCache(d.create_directory("cache"))
+      self.assertRaises(parser.ParseError, cache.parse_file,
+                        filename, "foo", self.PYTHON_VERSION)
+      self.assertFalse(self._entries(cache))
+
+  def test_max_size(self):
+    with utils.Tempdir() as d:
+      cache = parse_cache.ParseCache(d.create_directory("cache"))
+      filename = d.create_file("foo.pyi", self.SRC)
+      cache.parse_file(filename, "foo", self.PYTHON_VERSION)
+      entry, = self._entries(cache)
+      cache.max_size = os.path.getsize(os.path.join(cache.path, entry))
+      os.utime(os.path.join(cache.path, entry), (0, 0))
+      cache.parse_file(filename, "bar", self.PYTHON_VERSION)
+      # The older entry is evicted.
+      self.assertEqual(len(self._entries(cache)), 1)
+      self.assertNotIn(entry, self._entries(cache))
+
+  def test_create_directory(self):
+    with utils.Tempdir() as d:
+      path = os.path.join(d.path, "a", "b")
+      filename = d.create_file("foo.pyi", self.SRC)
+      cache = parse_cache.ParseCache(path)
+      cache.parse_file(filename, "foo", self.PYTHON_VERSION)
+      self.assertEqual(len(self._entries(cache)), 1)
+
+
+if __name__ == "__main__":
+  unittest.main()
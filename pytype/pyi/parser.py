@@ -2,15 +2,20 @@
 
 import collections
 import hashlib
-
+import logging
+import marshal
+import os
 
 from pytype import utils
 from pytype.pyi import parser_ext
+from pytype.pytd import binary_ast
 from pytype.pytd import pep484
 from pytype.pytd import pytd
 from pytype.pytd import visitors
 from pytype.pytd.parse import parser_constants  # pylint: disable=g-importing-member
 
+log = logging.getLogger(__name__)
+
 _DEFAULT_VERSION = (2, 7, 6)
 _DEFAULT_PLATFORM = "linux"
 
@@ -220,6 +225,30 @@ class _PropertyToConstant(visitors.Visitor):
         return True
 
 
+class ApplyParseTransformations(visitors.Visitor):
+  """Applies the special cases of _Parser to a tree that wasn't parsed.
+
+  Together with visitors.ApplyPrintTransformations and post_process_ast, this
+  turns a tree into the tree we would get by printing and parsing it.
+  """
+
+  def VisitClass(self, node):
+    parents = tuple(p for p in node.parents
+                    if not isinstance(p, pytd.NothingType))
+    # Ensure that old style classes inherit from classobj.
+    if not parents and node.name not in ["classobj", "object"]:
+      parents = (pytd.NamedType("classobj"),)
+    return node.Replace(parents=parents)
+
+  def VisitFunction(self, node):
+    # The printer always prints return types, so unlike new_function, we don't
+    # need to add a return type to __init__.
+    if node.name == "__new__":
+      return node.Replace(kind=pytd.STATICMETHOD)
+    else:
+      return node
+
+
 class _Parser(object):
   """A class used to parse a single PYI file.
 
@@ -388,24 +417,10 @@ class _Parser(object):
       else:
         raise e
 
-    ast = ast.Visit(_PropertyToConstant())
-    ast = ast.Visit(_InsertTypeParameters())
-    # TODO(kramm): This is in the wrong place- it should happen after resolving
-    # local names, in load_pytd.
-    ast = ast.Visit(pep484.ConvertTypingToNative(name))
-
-    if name:
-      ast = ast.Replace(name=name)
-      ast = ast.Visit(visitors.AddNamePrefix())
-    else:
+    ast = post_process_ast(ast, name)
+    if not name:
       # If there's no unique name, hash the sourcecode.
       ast = ast.Replace(name=hashlib.md5(src.encode("utf-8")).hexdigest())
-    ast = ast.Visit(visitors.StripExternalNamePrefix())
-
-    # Typeshed files that explicitly import and refer to "builtins" need to have
-    # that rewritten to __builtin__
-    ast = ast.Visit(visitors.RenameBuiltinsPrefix())
-
     return ast.Replace(is_package=utils.is_pyi_directory_init(filename))
 
   def _build_type_decl_unit(self, defs):
@@ -1031,6 +1046,106 @@ def parse_file(filename=None, name=None, python_version=None,
       src, name, filename)
 
 
+def _try_parse(src, name, filename, python_version):
+  try:
+    return parse_string(src, name=name, filename=filename,
+                        python_version=python_version)
+  except Exception as e:  # pylint: disable=broad-except
+    log.debug("Couldn't parse %s: %s", filename, e)
+    return None
+
+
+def _split_by_size(sources, n):
+  """Split the indices of sources into n lists of about the same total size."""
+  shares = [[] for _ in range(n)]
+  sizes = [0] * n
+  for i in sorted(range(len(sources)), key=lambda i: -len(sources[i][0])):
+    smallest = sizes.index(min(sizes))
+    shares[smallest].append(i)
+    sizes[smallest] += len(sources[i][0])
+  return shares
+
+
+def parse_strings(sources, python_version, processes=1):
+  """Parse many pyi sources, in parallel.
+
+  The sources are split between up to "processes" children forked from the
+  current process, which do all of the parsing (including post_process_ast)
+  and send the asts back in the format of binary_ast.
+
+  Args:
+    sources: A sequence of (src, name, filename) tuples, see parse_string.
+    python_version: The python version, a tuple.
+    processes: The maximum number of child processes. With 1, the sources are
+      parsed in the current process.
+
+  Returns:
+    A list with the ast of each source, or None for the sources that couldn't
+    be parsed. Use parse_string to get the error for those.
+  """
+  if processes <= 1 or len(sources) <= 1:
+    return [_try_parse(src, name, filename, python_version)
+            for src, name, filename in sources]
+  children = []
+  for share in _split_by_size(sources, min(processes, len(sources))):
+    r, w = os.pipe()
+    pid = os.fork()
+    if not pid:
+      # Never return from here: the stack above us belongs to the parent.
+      try:
+        os.close(r)
+        dumps = []
+        for i in share:
+          ast = _try_parse(*sources[i], python_version=python_version)
+          dumps.append(None if ast is None else binary_ast.Dump(ast))
+        with os.fdopen(w, "wb") as f:
+          f.write(marshal.dumps(dumps))
+      finally:
+        os._exit(0)  # pylint: disable=protected-access
+    os.close(w)
+    children.append((pid, r, share))
+  results = [None] * len(sources)
+  for pid, r, share in children:
+    with os.fdopen(r, "rb") as f:
+      data = f.read()
+    os.waitpid(pid, 0)
+    try:
+      dumps = marshal.loads(data)
+    except (EOFError, ValueError, TypeError):
+      log.warning("A parser process died, leaving %d sources unparsed",
+                  len(share))
+      continue
+    for i, dump in zip(share, dumps):
+      if dump is not None:
+        results[i] = binary_ast.Load(dump)
+  return results
+
+
+def post_process_ast(ast, name):
+  """Apply the transformations that follow the construction of a parsed ast.
+
+  Args:
+    ast: A pytd.TypeDeclUnit with unqualified names.
+    name: The module name, or None. If given, it's used as the name of the
+      returned ast and as the prefix of the names of its members.
+
+  Returns:
+    A pytd.TypeDeclUnit.
+  """
+  ast = ast.Visit(_PropertyToConstant())
+  ast = ast.Visit(_InsertTypeParameters())
+  # TODO(kramm): This is in the wrong place- it should happen after resolving
+  # local names, in load_pytd.
+  ast = ast.Visit(pep484.ConvertTypingToNative(name))
+  if name:
+    ast = ast.Replace(name=name)
+    ast = ast.Visit(visitors.AddNamePrefix())
+  # Typeshed files that explicitly import and refer to "builtins" need to have
+  # that rewritten to __builtin__
+  return visitors.ApplyVisitors(ast, [visitors.StripExternalNamePrefix(),
+                                      visitors.RenameBuiltinsPrefix()])
+
+
 def join_types(types):
   """Combine a list of types into a union type, if needed.
 
@@ -8,6 +8,7 @@ import textwrap
 from pytype import utils
 from pytype.pyi import parser
 from pytype.pytd import pytd
+from pytype.pytd import pytd_utils
 import six
 
 import unittest
@@ -1835,5 +1836,30 @@ class AnyTest(_ParserTestBase):
       x = ...  # type: Any""")
 
 
+class ParseStringsTest(unittest.TestCase):
+
+  PYTHON_VERSION = (2, 7, 6)
+  SOURCES = [("x = ...  # type: int", "foo", "foo.pyi"),
+             ("def f(x) -> str", "bar", "bar/__init__.pyi"),
+             ("this is an error", "baz", "baz.pyi")]
+
+  def check(self, processes):
+    asts = parser.parse_strings(self.SOURCES, self.PYTHON_VERSION, processes)
+    self.assertEqual(len(asts), len(self.SOURCES))
+    for (src, name, filename), ast in zip(self.SOURCES, asts[:2]):
+      expected = parser.parse_string(src, name=name, filename=filename,
+                                     python_version=self.PYTHON_VERSION)
+      self.assertMultiLineEqual(pytd_utils.Print(ast),
+                                pytd_utils.Print(expected))
+      self.assertEqual(ast.is_package, expected.is_package)
+    self.assertIsNone(asts[2])
+
+  def test_in_process(self):
+    self.check(processes=1)
+
+  def test_in_children(self):
+    self.check(processes=2)
+
+
 if __name__ == "__main__":
   unittest.main()
@@ -0,0 +1,345 @@
+"""A compact binary serialization format for pytd trees.
+
+Pickling a pytd tree stores every node, and every copy of a name, separately,
+and unpickling needs a raised recursion limit for deep trees. This format
+stores each distinct string and int once, shares structurally identical
+subtrees, and is read back without recursion.
+
+All values (None, False, True, strings, ints, and then tuples and nodes) are
+numbered, in that order, and refer to each other by their number. Tuples and
+nodes are stored bottom-up, so the children of every tuple or node precede it,
+and can be created with a single pass over the data.
+
+File layout:
+  magic (8 bytes), number of the root value (unsigned 32 bit, little endian)
+  strings: lengths (array), kinds (array, 1 for text), utf-8 data (bytes)
+  ints: zigzag encoded (array)
+  classes: string numbers of the names of the pytd node classes used (array)
+  nodes: for every tuple or node, its class (0 for tuple, i + 1 for
+    classes[i]), the length if it's a tuple, and the numbers of its children
+    (array)
+  pointers: pairs of the number of a pytd.ClassType or pytd.FunctionType and
+    the number of the value its .cls or .function points to (array)
+
+Arrays are stored as an item size (1, 2, 4 or 8 bytes), the number of items,
+and the items, as little endian unsigned ints. Every array uses the smallest
+item size that can hold its largest item.
+"""
+
+import array
+import struct
+import sys
+
+from pytype.pytd import pytd
+import six
+
+
+MAGIC = b"PYTDBIN1"
+_HEADER = struct.Struct("<8sI")
+_ARRAY_HEADER = struct.Struct("<BQ")
+_BYTES_HEADER = struct.Struct("<Q")
+
+# Maps item sizes to the array typecodes for unsigned ints of that size.
+_TYPECODES = {}
+for _typecode in "LIHB":
+  _TYPECODES[array.array(_typecode).itemsize] = _typecode
+
+# Nodes that are filled in in place, and the attribute that is filled in.
+_POINTER_ATTRIBUTES = {pytd.ClassType: "cls", pytd.FunctionType: "function"}
+
+# Kinds of references used while writing, see _Writer.
+_FIXED, _STRING, _INT, _COMPOSITE = range(4)
+_FIXED_VALUES = (None, False, True)
+
+
+class LoadError(Exception):
+  """If data isn't valid binary_ast data."""
+
+
+def IsBinary(data):
+  """Return True if data (a byte string) starts with the binary_ast magic."""
+  return data[:len(MAGIC)] == MAGIC
+
+
+def _WriteArray(out, items):
+  maximum = max(items) if items else 0
+  for itemsize in sorted(_TYPECODES):
+    if maximum < 1 << (8 * itemsize):
+      break
+  else:
+    raise ValueError("Value too large: %d" % maximum)
+  a = array.array(_TYPECODES[itemsize], items)
+  if sys.byteorder == "big":
+    a.byteswap()
+  out.append(_ARRAY_HEADER.pack(itemsize, len(a)))
+  out.append(a.tostring() if six.PY2 else a.tobytes())
+
+
+def _ReadArray(data, pos):
+  itemsize, length = _ARRAY_HEADER.unpack_from(data, pos)
+  pos += _ARRAY_HEADER.size
+  end = pos + itemsize * length
+  if itemsize not in _TYPECODES or end > len(data):
+    raise LoadError("Invalid array at offset %d" % pos)
+  a = array.array(_TYPECODES[itemsize])
+  if six.PY2:
+    a.fromstring(data[pos:end])
+  else:
+    a.frombytes(data[pos:end])
+  if sys.byteorder == "big":
+    a.byteswap()
+  return a.tolist(), end
+
+
+def _ZigZag(i):
+  return 2 * i if i >= 0 else -2 * i - 1
+
+
+def _UnZigZag(i):
+  # int() turns the longs we get from 8 byte arrays under Python 2 into ints.
+  return int(i >> 1 if not i & 1 else -(i >> 1) - 1)
+
+
+class _Writer(object):
+  """Collects the values of a tree and assigns them numbers.
+
+  While writing, values are referred to by their kind (_FIXED, _STRING, _INT or
+  _COMPOSITE) and their index among the values of that kind, packed into one
+  int. They are renumbered once all values are known.
+  """
+
+  def __init__(self):
+    self._strings = []
+    self._string_refs = {}
+    self._ints = []
+    self._int_refs = {}
+    self._classes = []  # references of the class names
+    self._arities = []
+    self._class_ids = {}
+    self._nodes = []  # the "nodes" section, with references not yet renumbered
+    self._composite_count = 0
+    self._composite_refs = {}  # structural keys of composites to references
+    self._refs_by_id = {}  # ids of already written composites to references
+    self._objects = []  # keeps the objects whose ids we use alive
+    self._pointers = []
+
+  def _ConstantRef(self, value):
+    """Returns the reference of value, or None if it's a tuple or node."""
+    cls = value.__class__
+    if value is None or cls is bool:
+      return _FIXED_VALUES.index(value) << 2 | _FIXED
+    elif cls in (six.binary_type, six.text_type):
+      key = (cls, value)
+      ref = self._string_refs.get(key)
+      if ref is None:
+        ref = len(self._strings) << 2 | _STRING
+        self._string_refs[key] = ref
+        self._strings.append(value)
+      return ref
+    elif cls in six.integer_types:
+      ref = self._int_refs.get(value)
+      if ref is None:
+        ref = len(self._ints) << 2 | _INT
+        self._int_refs[value] = ref
+        self._ints.append(value)
+      return ref
+    elif isinstance(value, tuple):
+      return None
+    else:
+      raise TypeError("Can't serialize %s" % cls.__name__)
+
+  def _ClassId(self, cls):
+    if cls is tuple:
+      return 0
+    class_id = self._class_ids.get(cls)
+    if class_id is None:
+      if getattr(pytd, cls.__name__, None) is not cls:
+        raise TypeError("Can't serialize %s" % cls.__name__)
+      self._classes.append(self._ConstantRef(cls.__name__))
+      self._arities.append(len(cls._fields))
+      class_id = self._class_ids[cls] = len(self._classes)
+    return class_id
+
+  def _Ref(self, value):
+    ref = self._ConstantRef(value)
+    if ref is None:
+      ref = self._refs_by_id.get(id(value))
+    return ref
+
+  def Add(self, root):
+    """Add a value, and everything it contains. Returns its reference."""
+    stack = [root]
+    while stack:
+      value = stack[-1]
+      if self._Ref(value) is not None:
+        stack.pop()
+        continue
+      child_refs = [self._Ref(child) for child in value]
+      missing = [child for child, ref in zip(value, child_refs) if ref is None]
+      if missing:
+        stack.extend(reversed(missing))
+        continue
+      stack.pop()
+      cls = value.__class__
+      class_id = self._ClassId(cls)
+      if cls is tuple:
+        entry = [class_id, len(child_refs)] + child_refs
+      else:
+        entry = [class_id] + child_refs
+      if cls is tuple or cls.shareable:
+        # Structurally identical values are only stored once.
+        key = tuple(entry)
+        ref = self._composite_refs.get(key)
+      else:
+        key = ref = None
+      if ref is None:
+        ref = self._composite_count << 2 | _COMPOSITE
+        self._composite_count += 1
+        self._nodes.extend(entry)
+        if key is not None:
+          self._composite_refs[key] = ref
+        if cls in _POINTER_ATTRIBUTES:
+          self._pointers.append((ref, getattr(value, _POINTER_ATTRIBUTES[cls])))
+      self._refs_by_id[id(value)] = ref
+      self._objects.append(value)
+    return self._Ref(root)
+
+  def Write(self, root):
+    """Serialize root. Returns a byte string."""
+    root_ref = self.Add(root)
+    # Pointers can refer to values outside of the tree, and those values can
+    # contain more pointers.
+    pointers = []
+    while self._pointers:
+      ref, target = self._pointers.pop()
+      pointers.append((ref, self.Add(target)))
+    string_base = len(_FIXED_VALUES)
+    int_base = string_base + len(self._strings)
+    bases = (0, string_base, int_base, int_base + len(self._ints))
+    renumber = lambda ref: bases[ref & 3] + (ref >> 2)
+    nodes = self._nodes
+    pos = 0
+    while pos < len(nodes):
+      if nodes[pos]:
+        start = pos + 1
+        end = start + self._arities[nodes[pos] - 1]
+      else:
+        start = pos + 2
+        end = start + nodes[pos + 1]
+      nodes[start:end] = [renumber(ref) for ref in nodes[start:end]]
+      pos = end
+    out = [_HEADER.pack(MAGIC, renumber(root_ref))]
+    encoded = [s if isinstance(s, six.binary_type) else s.encode("utf-8")
+               for s in self._strings]
+    _WriteArray(out, [len(s) for s in encoded])
+    _WriteArray(out, [int(isinstance(s, six.text_type)) for s in self._strings])
+    data = b"".join(encoded)
+    out.append(_BYTES_HEADER.pack(len(data)))
+    out.append(data)
+    _WriteArray(out, [_ZigZag(i) for i in self._ints])
+    _WriteArray(out, [renumber(ref) for ref in self._classes])
+    _WriteArray(out, nodes)
+    _WriteArray(out, [renumber(ref) for pointer in sorted(pointers)
+                      for ref in pointer])
+    return b"".join(out)
+
+
+def Dump(value):
+  """Serialize a tree of pytd nodes, tuples, strings, ints, bools and Nones.
+
+  Args:
+    value: The value to serialize.
+
+  Returns:
+    A byte string.
+
+  Raises:
+    TypeError: If value contains anything that isn't supported.
+  """
+  return _Writer().Write(value)
+
+
+def Load(data):
+  """Deserialize the output of Dump.
+
+  Args:
+    data: A byte string.
+
+  Returns:
+    The deserialized value. Structurally identical nodes (see
+    node.Node.shareable) and tuples are shared.
+
+  Raises:
+    LoadError: If data can't be deserialized.
+  """
+  if not IsBinary(data):
+    raise LoadError("Not binary_ast data")
+  try:
+    return _Load(data)
+  except (OverflowError, UnicodeDecodeError, ValueError) as e:
+    raise LoadError("Invalid data: %s" % e)
+
+
+def _IsNodeClass(cls):
+  # Every node class has the "shareable" flag, see node.Node.
+  return (isinstance(cls, type) and issubclass(cls, tuple) and
+          hasattr(cls, "_fields") and hasattr(cls, "shareable"))
+
+
+def _Load(data):
+  """Load, for data that starts with the binary_ast magic."""
+  try:
+    _, root = _HEADER.unpack_from(data, 0)
+    pos = _HEADER.size
+    lengths, pos = _ReadArray(data, pos)
+    kinds, pos = _ReadArray(data, pos)
+    length, = _BYTES_HEADER.unpack_from(data, pos)
+    pos += _BYTES_HEADER.size
+    string_data = data[pos:pos + length]
+    pos += length
+    ints, pos = _ReadArray(data, pos)
+    classes, pos = _ReadArray(data, pos)
+    nodes, pos = _ReadArray(data, pos)
+    pointers, pos = _ReadArray(data, pos)
+  except struct.error as e:
+    raise LoadError("Truncated data: %s" % e)
+  values = list(_FIXED_VALUES)
+  start = 0
+  for length, kind in zip(lengths, kinds):
+    end = start + length
+    if kind:
+      values.append(string_data[start:end].decode("utf-8"))
+    else:
+      values.append(string_data[start:end])
+    start = end
+  values.extend(_UnZigZag(i) for i in ints)
+  try:
+    node_classes = [tuple] + [getattr(pytd, values[i]) for i in classes]
+  except (AttributeError, IndexError, TypeError):
+    raise LoadError("Invalid class table")
+  if not all(_IsNodeClass(cls) for cls in node_classes[1:]):
+    raise LoadError("Invalid class table")
+  arities = [None] + [len(cls._fields) for cls in node_classes[1:]]
+  # This is the hot loop. We create the tuples and nodes directly, without
+  # going through their constructors.
+  append = values.append
+  get = values.__getitem__
+  new = tuple.__new__
+  pos, end = 0, len(nodes)
+  try:
+    while pos < end:
+      class_id = nodes[pos]
+      if class_id:
+        pos += 1
+        children = nodes[pos:pos + arities[class_id]]
+      else:
+        pos += 2
+        children = nodes[pos:pos + nodes[pos - 1]]
+      append(new(node_classes[class_id], map(get, children)))
+      pos += len(children)
+    for i in range(0, len(pointers), 2):
+      node, target = values[pointers[i]], values[pointers[i + 1]]
+      setattr(node, _POINTER_ATTRIBUTES[node.__class__], target)
+    return values[root]
+  except (IndexError, KeyError, TypeError):
+    raise LoadError("Invalid node table")
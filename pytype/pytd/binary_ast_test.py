@@ -0,0 +1,112 @@
+"""Tests for binary_ast.py."""
+
+from pytype.pytd import binary_ast
+from pytype.pytd import pytd
+from pytype.pytd import visitors
+from pytype.pytd.parse import parser_test_base
+from six.moves import cPickle
+
+import unittest
+
+
+class BinaryAstTest(parser_test_base.ParserTest):
+
+  def _ParseWithPointers(self, src):
+    ast = self.Parse(src, name="foo")
+    ast = ast.Visit(visitors.LookupLocalTypes())
+    ast.Visit(visitors.FillInLocalPointers({"": ast, "foo": ast}))
+    return ast
+
+  def testPrimitives(self):
+    values = (None, True, False, 0, 1, -1, 2 ** 40, -2 ** 40, b"bytes",
+              u"text", u"\xe9", (), ((),), (1, (2, u"3")))
+    loaded = binary_ast.Load(binary_ast.Dump(values))
+    self.assertEqual(values, loaded)
+    self.assertEqual([type(v) for v in values], [type(v) for v in loaded])
+
+  def testRoundTrip(self):
+    ast = self.Parse("""
+      from typing import List, TypeVar
+      T = TypeVar("T")
+      x = ...  # type: List[int]
+      class A(List[T]):
+        def f(self, x: T, *args, **kwargs) -> A: ...
+        def g(self) -> int or str: ...
+      def h(x: A = ...) -> List[str]: ...
+    """)
+    loaded = binary_ast.Load(binary_ast.Dump(ast))
+    self.assertIsInstance(loaded, pytd.TypeDeclUnit)
+    self.assertTrue(ast.ASTeq(loaded))
+    self.assertMultiLineEqual(pytd.Print(ast), pytd.Print(loaded))
+
+  def testPointers(self):
+    ast = self._ParseWithPointers("""
+      from typing import Any
+      class A(Any):
+        def f(self) -> A: ...
+      x = ...  # type: A
+    """)
+    loaded = binary_ast.Load(binary_ast.Dump(ast))
+    a = loaded.Lookup("foo.A")
+    self.assertIs(a, loaded.Lookup("foo.x").type.cls)
+    self.assertIs(a, a.methods[0].signatures[0].return_type.cls)
+    loaded.Visit(visitors.VerifyContainers())
+
+  def testUnresolvedPointers(self):
+    class_type = pytd.ClassType("foo.A")
+    function_type = pytd.FunctionType("foo.f")
+    loaded_class_type, loaded_function_type = binary_ast.Load(
+        binary_ast.Dump((class_type, function_type)))
+    self.assertEqual(class_type, loaded_class_type)
+    self.assertIsNone(loaded_class_type.cls)
+    self.assertEqual(function_type, loaded_function_type)
+    self.assertIsNone(loaded_function_type.function)
+
+  def testSharing(self):
+    t1 = pytd.NamedType("int")
+    t2 = pytd.NamedType("int")
+    c1 = pytd.ClassType("int")
+    c2 = pytd.ClassType("int")
+    loaded = binary_ast.Load(binary_ast.Dump((t1, t2, c1, c2, c1)))
+    self.assertIs(loaded[0], loaded[1])
+    # ClassType nodes are filled in in place, so they are never merged.
+    self.assertIsNot(loaded[2], loaded[3])
+    self.assertIs(loaded[2], loaded[4])
+
+  def testSmallerThanPickle(self):
+    ast = self.Parse("""
+      def f(x: int, y: int) -> int: ...
+      def g(x: int, y: int) -> int: ...
+      def h(x: int, y: int) -> int: ...
+    """)
+    self.assertLess(len(binary_ast.Dump(ast)),
+                    len(cPickle.dumps(ast, 2)))
+
+  def testUnsupported(self):
+    self.assertRaises(TypeError, binary_ast.Dump, [1])
+    self.assertRaises(TypeError, binary_ast.Dump, (1.0,))
+
+  def testInvalid(self):
+    data = binary_ast.Dump(pytd.NamedType("int"))
+    self.assertTrue(binary_ast.IsBinary(data))
+    self.assertFalse(binary_ast.IsBinary(b"\x80\x02"))
+    self.assertRaises(binary_ast.LoadError, binary_ast.Load, b"\x80\x02")
+    self.assertRaises(binary_ast.LoadError, binary_ast.Load, data[:-1])
+
+  def testInvalidUtf8(self):
+    data = binary_ast.Dump(pytd.NamedType(u"caf\xe9"))
+    encoded = u"caf\xe9".encode("utf-8")
+    self.assertIn(encoded, data)
+    data = data.replace(encoded, b"\xff" * len(encoded))
+    self.assertRaises(binary_ast.LoadError, binary_ast.Load, data)
+
+  def testInvalidClass(self):
+    data = binary_ast.Dump(pytd.NamedType("int"))
+    # Something in the pytd module that isn't a node class.
+    self.assertTrue(hasattr(pytd, "itertools"))
+    data = data.replace(b"NamedType", b"itertools")
+    self.assertRaises(binary_ast.LoadError, binary_ast.Load, data)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -39,6 +39,38 @@ import six
 log = logging.getLogger(__name__)
 
 
+def _JoinTypes(types, old_type):
+  """Like pytd_utils.JoinTypes, but reuses old_type if the result is the same.
+
+  JoinTypes always creates a new UnionType, even if it consists of exactly the
+  types of old_type. Returning the node we started from, instead, tells the
+  visitor traversal that this part of the tree hasn't changed.
+
+  Arguments:
+    types: A list of types.
+    old_type: The type the joined types are replacing.
+
+  Returns:
+    The union of types. Either old_type or a new node.
+  """
+  new_type = pytd_utils.JoinTypes(types)
+  if (isinstance(new_type, pytd.UnionType) and
+      isinstance(old_type, pytd.UnionType) and
+      len(new_type.type_list) == len(old_type.type_list) and
+      all(t1 is t2 for t1, t2 in zip(new_type.type_list, old_type.type_list))):
+    return old_type
+  return new_type
+
+
+def _ReplaceSignatures(f, signatures):
+  """Replace the signatures of a function, unless they're the same ones."""
+  signatures = tuple(signatures)
+  if (len(signatures) == len(f.signatures) and
+      all(s1 is s2 for s1, s2 in zip(signatures, f.signatures))):
+    return f
+  return f.Replace(signatures=signatures)
+
+
 class RenameUnknowns(visitors.Visitor):
   """Give unknowns that map to the same set of concrete types the same name."""
 
@@ -69,9 +101,10 @@ class RemoveDuplicates(visitors.Visitor):
   """
 
   def VisitFunction(self, node):
+    if len(node.signatures) == 1:
+      return node  # Optimization: Don't bother hashing a single signature.
     # We remove duplicates, but keep existing entries in the same order.
-    return node.Replace(
-        signatures=tuple(pytd_utils.OrderedSet(node.signatures)))
+    return _ReplaceSignatures(node, pytd_utils.OrderedSet(node.signatures))
 
 
 class RemoveRedundantSignatures(visitors.Visitor):
@@ -138,7 +171,7 @@ class SimplifyUnions(visitors.Visitor):
   """
 
   def VisitUnionType(self, union):
-    return pytd_utils.JoinTypes(union.type_list)
+    return _JoinTypes(union.type_list, union)
 
 
 class _ReturnsAndExceptions(object):
@@ -188,9 +221,15 @@ class CombineReturnsAndExceptions(visitors.Visitor):
       signatures: A list of function signatures (Signature instances).
 
     Returns:
-      A dictionary mapping signatures (without return and exceptions) to
-      a tuple of return values and exceptions.
+      A list of tuples (signature, ReturnsAndExceptions), one for each
+      signature without return and exceptions.
     """
+    if len(signatures) == 1:
+      # Optimization: There's nothing to group, so don't hash the signature.
+      sig, = signatures
+      ret = _ReturnsAndExceptions()
+      ret.Update(sig)
+      return [(sig.Replace(return_type=None, exceptions=None), ret)]
     groups = collections.OrderedDict()  # Signature -> ReturnsAndExceptions
     for sig in signatures:
       stripped_signature = sig.Replace(return_type=None, exceptions=None)
@@ -202,7 +241,7 @@ class CombineReturnsAndExceptions(visitors.Visitor):
 
       ret.Update(sig)
 
-    return groups
+    return list(groups.items())
 
   def VisitFunction(self, f):
     """Merge signatures of a function.
@@ -217,16 +256,28 @@ class CombineReturnsAndExceptions(visitors.Visitor):
       Function with simplified / combined signatures.
     """
     groups = self._GroupByArguments(f.signatures)
+    if len(groups) == len(f.signatures):
+      # Every signature is in a group of its own.
+      originals = f.signatures
+    else:
+      originals = [None] * len(groups)
 
     new_signatures = []
-    for stripped_signature, ret_exc in groups.items():
-      ret = pytd_utils.JoinTypes(ret_exc.return_types)
+    for original, (stripped_signature, ret_exc) in zip(originals, groups):
+      if original is not None:
+        ret = _JoinTypes(ret_exc.return_types, original.return_type)
+      else:
+        ret = pytd_utils.JoinTypes(ret_exc.return_types)
       exc = tuple(ret_exc.exceptions)
 
+      if (original is not None and ret is original.return_type and
+          len(exc) == len(original.exceptions)):
+        new_signatures.append(original)
+        continue
       new_signatures.append(
           stripped_signature.Replace(return_type=ret, exceptions=exc)
       )
-    return f.Replace(signatures=tuple(new_signatures))
+    return _ReplaceSignatures(f, new_signatures)
 
 
 class CombineContainers(visitors.Visitor):
@@ -294,7 +345,7 @@ class CombineContainers(visitors.Visitor):
     if not any(isinstance(t, pytd.GenericType) for t in union.type_list):
       # Optimization: If we're not going to change anything, return original.
       return union
-    union = pytd_utils.JoinTypes(union.type_list)  # flatten
+    union = _JoinTypes(union.type_list, union)  # flatten
     if not isinstance(union, pytd.UnionType):
       union = pytd.UnionType((union,))
     merge_tuples = self._should_merge(pytd.TupleType, union)
@@ -391,6 +442,31 @@ class Factorize(visitors.Visitor):
         groups[stripped_signature] = [param_i.type]
     return groups.items()
 
+  def _JoinParameterTypes(self, f):
+    """Factorize a function with a single signature.
+
+    There is nothing to factorize in this case, so all VisitFunction would do is
+    to apply JoinTypes to the type of every (non-mutated) parameter. This does
+    the same, without grouping (and hence hashing) the signature.
+
+    Arguments:
+      f: An instance of pytd.Function, with a single signature.
+
+    Returns:
+      f, or a new instance of pytd.Function if any of the types changed.
+    """
+    sig, = f.signatures
+    params = []
+    for p in sig.params:
+      if p.mutated_type is None:
+        t = _JoinTypes([p.type], p.type)
+        if t is not p.type:
+          p = p.Replace(type=t)
+      params.append(p)
+    if all(p1 is p2 for p1, p2 in zip(params, sig.params)):
+      return f
+    return f.Replace(signatures=(sig.Replace(params=tuple(params)),))
+
   def VisitFunction(self, f):
     """Shrink a function, by factorizing cartesian products of arguments.
 
@@ -407,13 +483,25 @@ class Factorize(visitors.Visitor):
       A new, potentially optimized, instance of pytd.Function.
 
     """
+    if len(f.signatures) == 1:
+      return self._JoinParameterTypes(f)
     max_argument_count = max(len(s.params) for s in f.signatures)
     signatures = f.signatures
 
     for i in six.moves.xrange(max_argument_count):
+      groups = self._GroupByOmittedArg(signatures, i)
+      if len(groups) == len(signatures):
+        # Every signature is in a group of its own.
+        originals = signatures
+      else:
+        originals = [None] * len(groups)
       new_sigs = []
-      for sig, types in self._GroupByOmittedArg(signatures, i):
-        if types:
+      for original, (sig, types) in zip(originals, groups):
+        if original is not None and types and (
+            _JoinTypes(types, types[0]) is original.params[i].type):
+          # Joining a single type changes nothing. Keep the original.
+          new_sigs.append(original)
+        elif types:
           # One or more options for argument <i>:
           new_params = list(sig.params)
           new_params[i] = sig.params[i].Replace(
@@ -425,7 +513,7 @@ class Factorize(visitors.Visitor):
           new_sigs.append(sig)
       signatures = new_sigs
 
-    return f.Replace(signatures=tuple(signatures))
+    return _ReplaceSignatures(f, signatures)
 
 
 class ApplyOptionalArguments(visitors.Visitor):
@@ -478,6 +566,9 @@ class ApplyOptionalArguments(visitors.Visitor):
       A potentially simplified instance of pytd.Function.
     """
 
+    if len(f.signatures) == 1:
+      return f  # Optimization: A signature can't be shorter than itself.
+
     # Set of signatures that can replace longer ones. Only used for matching,
     # hence we can use an unordered data structure.
     optional_arg_sigs = frozenset(s.params
@@ -486,19 +577,69 @@ class ApplyOptionalArguments(visitors.Visitor):
 
     new_signatures = (s for s in f.signatures
                       if not self._HasShorterVersion(s, optional_arg_sigs))
-    return f.Replace(signatures=tuple(new_signatures))
+    return _ReplaceSignatures(f, new_signatures)
 
 
 class SuperClassHierarchy(object):
-  """Utility class for optimizations working with superclasses."""
+  """Utility class for optimizations working with superclasses.
+
+  The transitive super- and subclasses of a type are computed on first use,
+  and remembered, so it pays off to reuse a hierarchy. For instance, the
+  hierarchy of the builtins is computed once per loader (see
+  load_pytd.Loader.get_superclass_hierarchy), and extended with the classes of
+  each module that's optimized (see Extend).
+  """
 
   def __init__(self, superclasses):
     self._superclasses = superclasses
     self._subclasses = utils.invert_dict(self._superclasses)
+    # Memoized results of ExpandSuperClasses and ExpandSubClasses.
+    self._all_superclasses = {}
+    self._all_subclasses = {}
 
   def GetSuperClasses(self):
     return self._superclasses
 
+  def Extend(self, superclasses):
+    """Create a new hierarchy with additional (or redefined) classes.
+
+    Arguments:
+      superclasses: A dictionary mapping class names to the names of their
+        superclasses. Overrides the entries of this hierarchy.
+
+    Returns:
+      A new SuperClassHierarchy. The classes of this hierarchy stay as they
+      are. Its remembered results are shared, unless the new classes change
+      them.
+    """
+    if not superclasses:
+      return self
+    new = SuperClassHierarchy({})
+    new._superclasses = self._superclasses.copy()
+    new._superclasses.update(superclasses)
+    # Copy the subclass lists only where they change.
+    new._subclasses = collections.defaultdict(list, self._subclasses)
+    for name, parents in superclasses.items():
+      for parent in self._superclasses.get(name, ()):
+        new._subclasses[parent] = [
+            sub for sub in new._subclasses[parent] if sub != name]
+      for parent in parents:
+        new._subclasses[parent] = new._subclasses[parent] + [name]
+    # The superclasses of a type change if the type or any of its superclasses
+    # is redefined. Its subclasses change if it's a (new or old) superclass of
+    # a redefined type.
+    new._all_superclasses = {
+        name: closure for name, closure in self._all_superclasses.items()
+        if closure.isdisjoint(superclasses)}
+    affected = set()
+    for name in superclasses:
+      affected.update(self.ExpandSuperClasses(name))
+      affected.update(new.ExpandSuperClasses(name))
+    new._all_subclasses = {
+        name: closure for name, closure in self._all_subclasses.items()
+        if name not in affected}
+    return new
+
   def _CollectSuperclasses(self, type_name, collect):
     """Recursively collect super classes for a type.
 
@@ -506,6 +647,8 @@ class SuperClassHierarchy(object):
       type_name: A string, the type's name.
       collect: A set() of strings, modified to contain all superclasses.
     """
+    if type_name in collect:
+      return  # Don't loop forever on a (broken) cyclic hierarchy.
     collect.add(type_name)
     superclasses = [name
                     for name in self._superclasses.get(type_name, [])]
@@ -524,9 +667,12 @@ class SuperClassHierarchy(object):
       A set of types. This set includes t as well as all its superclasses. For
       example, this will return "bool", "int" and "object" for "bool".
     """
-    superclasses = set()
-    self._CollectSuperclasses(t, superclasses)
-    return superclasses
+    closure = self._all_superclasses.get(t)
+    if closure is None:
+      superclasses = set()
+      self._CollectSuperclasses(t, superclasses)
+      closure = self._all_superclasses[t] = frozenset(superclasses)
+    return set(closure)
 
   def ExpandSubClasses(self, t):
     """Generate a set of all (known) subclasses for a type.
@@ -538,14 +684,17 @@ class SuperClassHierarchy(object):
       A set of types. This set includes t as well as all its subclasses. For
       example, this will return "int" and "bool" for "int".
     """
-    queue = [t]
-    seen = set()
-    while queue:
-      item = queue.pop()
-      if item not in seen:
-        seen.add(item)
-        queue.extend(self._subclasses[item])
-    return seen
+    closure = self._all_subclasses.get(t)
+    if closure is None:
+      queue = [t]
+      seen = set()
+      while queue:
+        item = queue.pop()
+        if item not in seen:
+          seen.add(item)
+          queue.extend(self._subclasses[item])
+      closure = self._all_subclasses[t] = frozenset(seen)
+    return set(closure)
 
   def HasSubClassInSet(self, cls, known):
     """Queries whether a subclass of a type is present in a given set."""
@@ -585,7 +734,7 @@ class SimplifyUnionsWithSuperclasses(visitors.Visitor):
     # in collections.Counter. It'll happen for types that are not
     # instances of GENERIC_BASE_TYPE, like container types.
     new_type_list = [t for t in union.type_list if c[str(t)] <= 1]
-    return pytd_utils.JoinTypes(new_type_list)
+    return _JoinTypes(new_type_list, union)
 
 
 class FindCommonSuperClasses(visitors.Visitor):
@@ -681,10 +830,14 @@ class AdjustReturnAndConstantGenericType(visitors.Visitor):
   """Changes "object" to "Any" in return and constant types."""
 
   def VisitSignature(self, sig):
-    return sig.Replace(return_type=sig.return_type.Visit(AdjustGenericType()))
+    return_type = sig.return_type.Visit(AdjustGenericType())
+    if return_type is sig.return_type:
+      return sig
+    return sig.Replace(return_type=return_type)
 
   def VisitConstant(self, c):
-    return c.Replace(type=c.type.Visit(AdjustGenericType()))
+    t = c.type.Visit(AdjustGenericType())
+    return c if t is c.type else c.Replace(type=t)
 
 
 class AddInheritedMethods(visitors.Visitor):
@@ -1122,13 +1275,124 @@ class MergeTypeParameters(TypeParameterScope):
           visitors.ReplaceTypeParameters(substitutions)).Visit(SimplifyUnions())
 
 
+def _NodeClassNames(node):
+  """Collect the names of the classes of all nodes in a tree."""
+  names = set()
+  stack = [node]
+  while stack:
+    n = stack.pop()
+    if isinstance(n, tuple):
+      if type(n) is not tuple:  # pylint: disable=unidiomatic-typecheck
+        names.add(n.__class__.__name__)
+      stack.extend(n)
+  return names
+
+
+class _Members(object):
+  """The members of a module, for optimizing them one at a time.
+
+  Most optimizations only look at one function or constant at a time, and most
+  of them only change a few members of a module. We hence split a module into
+  its constants, functions, aliases and type parameters, and the methods,
+  constants and remainder of each of its classes, and only visit the members
+  a visitor might change: those that contain a node the visitor has a Visit
+  function for. Which nodes a member contains is only recomputed after the
+  member changed.
+
+  Only visitors that don't need to see the surrounding class or module
+  (i.e., without Enter/Leave functions, and not looking anything up in the
+  tree) can be applied like this.
+  """
+
+  _FIELDS = ("constants", "type_params", "functions", "aliases")
+
+  def __init__(self, node, split=True):
+    """Constructor.
+
+    Args:
+      node: A pytd node, usually a TypeDeclUnit.
+      split: Whether to split a TypeDeclUnit into its members. If False (or if
+        node isn't a TypeDeclUnit), the node is visited as a whole.
+    """
+    self._node = node
+    self._split = split and isinstance(node, pytd.TypeDeclUnit)
+    self._members = []
+    self._fields = []  # (field, start, end)
+    self._classes = []  # (class, remainder, start, end)
+    if not self._split:
+      self._members.append(node)
+    else:
+      for field in self._FIELDS:
+        start = len(self._members)
+        self._members.extend(getattr(node, field))
+        self._fields.append((field, start, len(self._members)))
+      for cls in node.classes:
+        remainder = cls.Replace(methods=(), constants=())
+        start = len(self._members)
+        self._members.append(remainder)
+        self._members.extend(cls.methods + cls.constants)
+        self._classes.append((cls, remainder, start, len(self._members)))
+    # The names of the node classes in each member, computed when needed.
+    self._class_names = [None] * len(self._members)
+
+  def _MightChange(self, visitor, i):
+    """Whether the visitor might change the i-th member."""
+    member = self._members[i]
+    if (not self._split or visitor.visits_all_node_types or
+        member.__class__.__name__ in visitor.visit_functions):
+      return True
+    if self._class_names[i] is None:
+      self._class_names[i] = _NodeClassNames(member)
+    return not self._class_names[i].isdisjoint(visitor.visit_functions)
+
+  def Visit(self, visitor):
+    """Apply a visitor to all the members it might change."""
+    for i, member in enumerate(self._members):
+      if self._MightChange(visitor, i):
+        new_member = member.Visit(visitor)
+        if new_member is not member:
+          self._members[i] = new_member
+          self._class_names[i] = None
+
+  def _Unchanged(self, start, old_members):
+    return all(m1 is m2 for m1, m2 in
+               zip(self._members[start:start + len(old_members)], old_members))
+
+  def Assemble(self):
+    """Put the (optimized) members back together.
+
+    Returns:
+      The optimized node. Parts of the tree that didn't change are reused.
+    """
+    if not self._split:
+      return self._members[0]
+    fields = {}
+    for field, start, end in self._fields:
+      if not self._Unchanged(start, getattr(self._node, field)):
+        fields[field] = tuple(self._members[start:end])
+    classes = []
+    for cls, remainder, start, end in self._classes:
+      if self._Unchanged(start, (remainder,) + cls.methods + cls.constants):
+        classes.append(cls)
+      else:
+        methods_end = start + 1 + len(cls.methods)
+        classes.append(self._members[start].Replace(
+            methods=tuple(self._members[start + 1:methods_end]),
+            constants=tuple(self._members[methods_end:end])))
+    if any(c1 is not c2 for c1, c2 in zip(classes, self._node.classes)):
+      fields["classes"] = tuple(classes)
+    return self._node.Replace(**fields) if fields else self._node
+
+
 def Optimize(node,
              builtins=None,
              lossy=False,
              use_abcs=False,
              max_union=7,
              remove_mutable=False,
-             can_do_lookup=True):
+             can_do_lookup=True,
+             builtins_hierarchy=None,
+             incremental=False):
   """Optimize a PYTD tree.
 
   Tries to shrink a PYTD tree by applying various optimizations.
@@ -1147,35 +1411,47 @@ def Optimize(node,
     can_do_lookup: True: We're either allowed to try to resolve NamedType
         instances in the AST, or the AST is already resolved. False: Skip any
         optimizations that would require NamedTypes to be resolved.
+    builtins_hierarchy: The SuperClassHierarchy of builtins, if it's already
+        known. See load_pytd.Loader.get_superclass_hierarchy.
+    incremental: Optimize the functions, constants etc. of a TypeDeclUnit one
+        at a time, only applying the optimizations that might change them.
+        See _Members. The result is the same.
 
   Returns:
     An optimized node.
   """
-  node = node.Visit(RemoveDuplicates())
-  node = node.Visit(SimplifyUnions())
-  node = node.Visit(CombineReturnsAndExceptions())
-  node = node.Visit(Factorize())
-  node = node.Visit(ApplyOptionalArguments())
-  node = node.Visit(CombineContainers())
-  node = node.Visit(SimplifyContainers())
+  members = _Members(node, split=incremental)
+  members.Visit(RemoveDuplicates())
+  members.Visit(SimplifyUnions())
+  members.Visit(CombineReturnsAndExceptions())
+  members.Visit(Factorize())
+  members.Visit(ApplyOptionalArguments())
+  members.Visit(CombineContainers())
+  members.Visit(SimplifyContainers())
+  node = members.Assemble()
   if builtins:
-    superclasses = builtins.Visit(visitors.ExtractSuperClassesByName())
-    superclasses.update(node.Visit(visitors.ExtractSuperClassesByName()))
+    if builtins_hierarchy is None:
+      builtins_hierarchy = SuperClassHierarchy(
+          builtins.Visit(visitors.ExtractSuperClassesByName()))
+    hierarchy = builtins_hierarchy.Extend(
+        node.Visit(visitors.ExtractSuperClassesByName()))
     if use_abcs:
-      superclasses.update(abc_hierarchy.GetSuperClasses())
-    hierarchy = SuperClassHierarchy(superclasses)
-    node = node.Visit(SimplifyUnionsWithSuperclasses(hierarchy))
+      hierarchy = hierarchy.Extend(abc_hierarchy.GetSuperClasses())
+    members.Visit(SimplifyUnionsWithSuperclasses(hierarchy))
     if lossy:
-      node = node.Visit(FindCommonSuperClasses(hierarchy))
+      members.Visit(FindCommonSuperClasses(hierarchy))
   if max_union:
-    node = node.Visit(CollapseLongUnions(max_union))
-  node = node.Visit(AdjustReturnAndConstantGenericType())
+    members.Visit(CollapseLongUnions(max_union))
+  members.Visit(AdjustReturnAndConstantGenericType())
   if remove_mutable:
+    node = members.Assemble()
     node = node.Visit(AbsorbMutableParameters())
     node = node.Visit(CombineContainers())
     node = node.Visit(MergeTypeParameters())
     node = node.Visit(visitors.AdjustSelf())
-  node = node.Visit(SimplifyContainers())
+    members = _Members(node, split=incremental)
+  members.Visit(SimplifyContainers())
+  node = members.Assemble()
   if builtins and can_do_lookup:
     node = visitors.LookupClasses(node, builtins, ignore_late_types=True)
     node = node.Visit(RemoveInheritedMethods())
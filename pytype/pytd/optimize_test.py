@@ -39,7 +39,12 @@ class TestOptimize(parser_test_base.ParserTest):
     return ast.Visit(visitors.LookupBuiltins(self.builtins))
 
   def Optimize(self, ast, **kwargs):
-    return optimize.Optimize(ast, self.builtins, **kwargs)
+    result = optimize.Optimize(ast, self.builtins, **kwargs)
+    # Optimizing incrementally needs to give the same result.
+    incremental = optimize.Optimize(ast, self.builtins, incremental=True,
+                                    **kwargs)
+    self.assertMultiLineEqual(pytd.Print(result), pytd.Print(incremental))
+    return result
 
   def OptimizedString(self, data):
     tree = self.Parse(data) if isinstance(data, six.string_types) else data
@@ -555,6 +560,73 @@ class TestOptimize(parser_test_base.ParserTest):
     new_src = self.ApplyVisitorToString(src, visitor)
     self.AssertSourceEquals(new_src, expected)
 
+  def testExtendSuperClassHierarchy(self):
+    hierarchy = optimize.SuperClassHierarchy(
+        {"object": [], "A": ["object"], "B": ["A"], "C": ["object"]})
+    self.assertEqual({"A", "B"}, hierarchy.ExpandSubClasses("A"))
+    self.assertEqual({"object", "A", "B"}, hierarchy.ExpandSuperClasses("B"))
+    self.assertEqual({"object", "C"}, hierarchy.ExpandSuperClasses("C"))
+    # Add a subclass of A, and move B from A to C.
+    extended = hierarchy.Extend({"D": ["A"], "B": ["C"]})
+    self.assertEqual({"A", "D"}, extended.ExpandSubClasses("A"))
+    self.assertEqual({"B", "C"}, extended.ExpandSubClasses("C"))
+    self.assertEqual({"object", "C", "B"}, extended.ExpandSuperClasses("B"))
+    self.assertEqual({"object", "A", "B", "C", "D"},
+                     extended.ExpandSubClasses("object"))
+    self.assertEqual({"object", "C"}, extended.ExpandSuperClasses("C"))
+    # The original hierarchy is unchanged.
+    self.assertEqual({"A", "B"}, hierarchy.ExpandSubClasses("A"))
+    self.assertEqual({"object", "A", "B"}, hierarchy.ExpandSuperClasses("B"))
+    self.assertNotIn("D", hierarchy.GetSuperClasses())
+
+  def testCyclicSuperClassHierarchy(self):
+    hierarchy = optimize.SuperClassHierarchy({"A": ["B"], "B": ["A"]})
+    self.assertEqual({"A", "B"}, hierarchy.ExpandSuperClasses("A"))
+    extended = hierarchy.Extend({"C": ["A"]})
+    self.assertEqual({"A", "B", "C"}, extended.ExpandSuperClasses("C"))
+
+  def testBuiltinsHierarchy(self):
+    src = textwrap.dedent("""
+        class A(int): ...
+        def f(x: A or int or bool) -> ?
+    """)
+    expected = textwrap.dedent("""
+        class A(int): ...
+        def f(x: int) -> ?
+    """)
+    ast = self.ParseAndResolve(src)
+    hierarchy = optimize.SuperClassHierarchy(
+        self.builtins.Visit(visitors.ExtractSuperClassesByName()))
+    for _ in range(2):
+      new_ast = optimize.Optimize(ast, self.builtins, can_do_lookup=False,
+                                  builtins_hierarchy=hierarchy)
+      new_ast = new_ast.Visit(visitors.DropBuiltinPrefix())
+      self.AssertSourceEquals(new_ast, expected)
+
+  def testIncremental(self):
+    for ast in (self.builtins, self.typing):
+      for lossy in (False, True):
+        for remove_mutable in (False, True):
+          self.Optimize(ast, lossy=lossy, use_abcs=lossy,
+                        remove_mutable=remove_mutable, can_do_lookup=False)
+
+  def testIncrementalKeepsUnchangedNodes(self):
+    ast = self.ParseAndResolve(textwrap.dedent("""
+        x = ...  # type: int or str
+        def f(x: int or str) -> list[int or str]
+        def g(x: int) -> int
+        def g(x: float) -> int
+        class A(object):
+          y = ...  # type: int
+          def h(self) -> int or str
+    """))
+    new_ast = optimize.Optimize(ast, self.builtins, can_do_lookup=False,
+                                incremental=True)
+    self.assertIs(ast.constants, new_ast.constants)
+    self.assertIs(ast.functions[0], new_ast.functions[0])
+    self.assertIsNot(ast.functions[1], new_ast.functions[1])
+    self.assertIs(ast.classes[0].methods[0], new_ast.classes[0].methods[0])
+
   def testFindCommonSuperClasses(self):
     src = textwrap.dedent("""
         x = ...  # type: int or other.Bar
@@ -75,6 +75,19 @@ def SetCheckPreconditions(enabled):
   _CHECK_PRECONDITIONS = enabled
 
 
+def SetVisitorInstrumentation(enabled):
+  """Turn recording metrics about every visitor run on or off.
+
+  When off (the default), Node.Visit calls straight into the traversal, without
+  any bookkeeping. See _InstrumentedVisit for what gets recorded.
+
+  Args:
+    enabled: Whether to instrument visitors.
+  """
+  global _visit
+  _visit = _InstrumentedVisit if enabled else _VisitNode
+
+
 def Node(*child_names):
   """Create a new Node class.
 
@@ -102,6 +115,11 @@ def Node(*child_names):
 
     _CHECKER = preconditions.CallChecker(precondition_pairs)
 
+    # Whether instances may be shared with structurally identical nodes, see
+    # binary_ast.Load. Subclasses that carry state outside of their fields, or
+    # that are modified in place, set this to False.
+    shareable = True
+
     def __init__(self, *args, **kwargs):
       if _CHECK_PRECONDITIONS:
         self._CHECKER.check(*args, **kwargs)
@@ -211,7 +229,7 @@ def Node(*child_names):
       Returns:
         Transformed version of this node.
       """
-      return _Visit(self, visitor, *args, **kwargs)
+      return _visit(self, visitor, *args, **kwargs)
 
   return NamedTupleNode
 
@@ -230,23 +248,51 @@ def _CreateUnchecked(cls, *args):
 # The set of visitor names currently being processed.
 _visiting = set()
 
+# While an instrumented visit runs, the numbers of nodes it has reached and
+# rebuilt, as a list of two ints, which _VisitNode updates. None otherwise.
+_node_counts = None
+
+
+def _InstrumentedVisit(node, visitor, *args, **kwargs):
+  """Like _VisitNode, but records metrics about the visitor.
+
+  For every top-level visit, this records the time taken, the number of nodes
+  reached and the number of nodes rebuilt, under the name of the visitor class.
+  Visits that happen while the same visitor class is already running (e.g.,
+  from within its callbacks) are accounted to the outer visit.
 
-def _Visit(node, visitor, *args, **kwargs):
+  Args:
+    node: The node to transform.
+    visitor: The visitor to apply.
+    *args: Passed to visitor callbacks.
+    **kwargs: Passed to visitor callbacks.
+  Returns:
+    The transformed node.
+  """
+  global _node_counts
   name = type(visitor).__name__
-  recursive = name in _visiting
+  if name in _visiting:
+    return _VisitNode(node, visitor, *args, **kwargs)
   _visiting.add(name)
-
+  # Nodes of visits of other visitors, e.g. from within callbacks, are counted
+  # for those.
+  outer_node_counts = _node_counts
+  _node_counts = [0, 0]
   start = time.clock()
   try:
     return _VisitNode(node, visitor, *args, **kwargs)
   finally:
-    if not recursive:
-      _visiting.remove(name)
-      elapsed = time.clock() - start
-      metrics.get_metric("visit_" + name, metrics.Distribution).add(elapsed)
-      if _visiting:
-        metrics.get_metric(
-            "visit_nested_" + name, metrics.Distribution).add(elapsed)
+    elapsed = time.clock() - start
+    reached, rebuilt = _node_counts
+    _node_counts = outer_node_counts
+    _visiting.remove(name)
+    metrics.get_metric("visit_" + name, metrics.Distribution).add(elapsed)
+    if _visiting:
+      metrics.get_metric(
+          "visit_nested_" + name, metrics.Distribution).add(elapsed)
+    metrics.get_metric("visitor_nodes", metrics.MapCounter).inc(name, reached)
+    metrics.get_metric("visitor_rebuilt_nodes", metrics.MapCounter).inc(
+        name, rebuilt)
 
 
 def _VisitNode(node, visitor, *args, **kwargs):
@@ -307,6 +353,8 @@ def _VisitNode(node, visitor, *args, **kwargs):
   node_class_name = node_class.__name__
   if node_class_name not in visitor.visit_class_names:
     return node
+  if _node_counts is not None:
+    _node_counts[0] += 1
 
   if node_class_name in visitor.enter_functions:
     # The visitor wants to be informed that we're descending into this part
@@ -327,6 +375,8 @@ def _VisitNode(node, visitor, *args, **kwargs):
       changed = True
     new_children.append(new_child)
   if changed:
+    if _node_counts is not None:
+      _node_counts[1] += 1
     # The constructor of namedtuple() differs from tuple(), so we have to
     # pass the current tuple using "*".
     if node_class_name in visitor.unchecked_node_names:
@@ -346,3 +396,7 @@ def _VisitNode(node, visitor, *args, **kwargs):
 
   del visitor.old_node
   return new_node
+
+
+# What Node.Visit calls. See SetVisitorInstrumentation.
+_visit = _VisitNode
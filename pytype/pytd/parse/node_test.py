@@ -14,6 +14,7 @@
 
 
 import itertools
+from pytype import metrics
 from pytype.pytd import visitors
 from pytype.pytd.parse import node
 import unittest
@@ -251,6 +252,51 @@ class TestNode(unittest.TestCase):
       # Restore preconditions (not part of the public API, but ensures the
       # test doesn't have a surprising side effect).
       node.SetCheckPreconditions(True)
+
+  def testInstrumentation(self):
+    xy = XY(X(1, (1, 2)), Y((V(1),), Data(42, 43, 44)))
+    v = DataVisitor()
+    visit_class_names = v.visit_class_names
+    metrics._prepare_for_test()
+    try:
+      node.SetVisitorInstrumentation(True)
+      new_xy = xy.Visit(v)
+    finally:
+      node.SetVisitorInstrumentation(False)
+    self.assertEqual(repr(new_xy),
+                     "XY(X(1, (1, 2)), Y((V(1),), Data(42, 43, -1)))")
+    # XY, X, Y, V and Data were reached. Y and XY were rebuilt, since Data was
+    # replaced by the visitor.
+    reached = metrics.get_metric("visitor_nodes", metrics.MapCounter)
+    rebuilt = metrics.get_metric("visitor_rebuilt_nodes", metrics.MapCounter)
+    self.assertDictEqual({"DataVisitor": 5}, reached._counts)
+    self.assertDictEqual({"DataVisitor": 2}, rebuilt._counts)
+    self.assertEqual(1, metrics.get_metric(
+        "visit_DataVisitor", metrics.Distribution)._count)
+    # The visitor is left as it was.
+    self.assertIs(visit_class_names, v.visit_class_names)
+    self.assertNotIn("unchecked_node_names", vars(v))
+    # Without instrumentation, nothing is recorded.
+    metrics._prepare_for_test()
+    xy.Visit(v)
+    self.assertDictEqual({}, metrics.get_metric(
+        "visitor_nodes", metrics.MapCounter)._counts)
+
+  def testInstrumentationSkippedNodes(self):
+    xy = XY(X(1, (1, 2)), Y((V(1),), Data(42, 43, 44)))
+    v = DataVisitor()
+    v.visit_class_names = {"XY", "Y", "Data"}
+    metrics._prepare_for_test()
+    try:
+      node.SetVisitorInstrumentation(True)
+      xy.Visit(v)
+    finally:
+      node.SetVisitorInstrumentation(False)
+    # X and V aren't visited, so they don't count as reached.
+    self.assertDictEqual({"DataVisitor": 3}, metrics.get_metric(
+        "visitor_nodes", metrics.MapCounter)._counts)
+    self.assertDictEqual({"DataVisitor": 2}, metrics.get_metric(
+        "visitor_rebuilt_nodes", metrics.MapCounter)._counts)
 # pylint: enable=g-generic-assert
 
 
@@ -0,0 +1,144 @@
+"""An indexed, memory-mapped archive of pickled modules.
+
+Precompiled builtins used to be stored as one gzipped pickle of
+(module name, pickled module) pairs, which had to be decompressed and read in
+full before a single module could be used. An archive stores the same data
+with an index in front, so that readers can mmap the file and only touch the
+modules they actually need.
+
+File layout:
+  magic (8 bytes), index length (unsigned 64 bit, little endian)
+  index: a pickled tuple of (name, offset, length, compressed, dependencies)
+  data: the items, at the given offsets relative to the end of the index.
+"""
+
+import collections
+import mmap
+import struct
+import zlib
+
+from six.moves import cPickle
+
+
+_MAGIC = b"PYTDARC1"
+_HEADER = struct.Struct("<8sQ")
+_PICKLE_PROTOCOL = cPickle.HIGHEST_PROTOCOL
+
+
+class ArchiveError(Exception):
+  """If a file isn't a valid archive."""
+
+
+_IndexEntry = collections.namedtuple(
+    "_IndexEntry", ["offset", "length", "compressed", "dependencies"])
+
+
+class Member(collections.namedtuple("Member", ["archive", "name"])):
+  """A reference to an item in an Archive, read on demand."""
+
+  def Read(self):
+    return self.archive.Read(self.name)
+
+  def Load(self):
+    return self.archive.Load(self.name)
+
+  @property
+  def dependencies(self):
+    return self.archive.Dependencies(self.name)
+
+  @property
+  def offset(self):
+    return self.archive.Offset(self.name)
+
+
+def IsArchive(filename):
+  """Return True if filename starts with the archive magic."""
+  with open(filename, "rb") as fi:
+    return fi.read(len(_MAGIC)) == _MAGIC
+
+
+def Save(items, filename, compress=False):
+  """Write an archive.
+
+  Args:
+    items: An iterable of (name, data, dependencies) tuples. data is a byte
+      string (typically a pickle), dependencies a sequence of the names of
+      the items this item needs.
+    filename: The file to write to.
+    compress: If True, zlib-compress every item individually.
+  """
+  index = []
+  blobs = []
+  offset = 0
+  for name, data, dependencies in items:
+    if compress:
+      data = zlib.compress(data)
+    index.append((name, offset, len(data), compress, tuple(dependencies)))
+    blobs.append(data)
+    offset += len(data)
+  index_data = cPickle.dumps(tuple(index), _PICKLE_PROTOCOL)
+  with open(filename, "wb") as fi:
+    fi.write(_HEADER.pack(_MAGIC, len(index_data)))
+    fi.write(index_data)
+    for data in blobs:
+      fi.write(data)
+
+
+class Archive(object):
+  """A read-only view of an archive file.
+
+  Only the index is read when the archive is opened. Items are copied out of
+  the mapped file, and decompressed if necessary, when they are requested.
+  """
+
+  def __init__(self, filename):
+    self.filename = filename
+    with open(filename, "rb") as fi:
+      header = fi.read(_HEADER.size)
+      if len(header) != _HEADER.size:
+        raise ArchiveError("Truncated archive: %s" % filename)
+      magic, index_length = _HEADER.unpack(header)
+      if magic != _MAGIC:
+        raise ArchiveError("Not an archive: %s" % filename)
+      self._index = {
+          name: _IndexEntry(offset, length, compressed, dependencies)
+          for name, offset, length, compressed, dependencies
+          in cPickle.loads(fi.read(index_length))}
+      self._data_start = _HEADER.size + index_length
+      self._mmap = mmap.mmap(fi.fileno(), 0, access=mmap.ACCESS_READ)
+
+  def __contains__(self, name):
+    return name in self._index
+
+  def __len__(self):
+    return len(self._index)
+
+  def Names(self):
+    return sorted(self._index)
+
+  def Member(self, name):
+    if name not in self._index:
+      raise KeyError(name)
+    return Member(self, name)
+
+  def Dependencies(self, name):
+    return self._index[name].dependencies
+
+  def Offset(self, name):
+    return self._index[name].offset
+
+  def Read(self, name):
+    """Return the data stored for name, as a byte string."""
+    entry = self._index[name]
+    start = self._data_start + entry.offset
+    data = self._mmap[start:start + entry.length]
+    if entry.compressed:
+      data = zlib.decompress(data)
+    return data
+
+  def Load(self, name):
+    """Unpickle the data stored for name."""
+    return cPickle.loads(self.Read(name))
+
+  def Close(self):
+    self._mmap.close()
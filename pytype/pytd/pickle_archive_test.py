@@ -0,0 +1,60 @@
+"""Tests for pickle_archive.py."""
+
+from pytype import utils
+from pytype.pytd import pickle_archive
+from pytype.pytd import pytd_utils
+from six.moves import cPickle
+
+import unittest
+
+
+class PickleArchiveTest(unittest.TestCase):
+
+  def _Items(self):
+    return [("foo", cPickle.dumps(("foo", 1)), ()),
+            ("bar", cPickle.dumps(["bar"] * 100), ("foo",)),
+            ("baz", b"", ("bar", "foo"))]
+
+  def _RoundTrip(self, compress):
+    with utils.Tempdir() as d:
+      filename = d.create_file("archive")
+      pickle_archive.Save(self._Items(), filename, compress=compress)
+      self.assertTrue(pickle_archive.IsArchive(filename))
+      archive = pickle_archive.Archive(filename)
+      try:
+        self.assertEqual(3, len(archive))
+        self.assertEqual(["bar", "baz", "foo"], archive.Names())
+        self.assertEqual(("foo", 1), archive.Load("foo"))
+        self.assertEqual(["bar"] * 100, archive.Member("bar").Load())
+        self.assertEqual(b"", archive.Read("baz"))
+        self.assertEqual(("bar", "foo"), archive.Dependencies("baz"))
+        self.assertEqual(("foo",), archive.Member("bar").dependencies)
+        self.assertNotIn("qux", archive)
+        self.assertRaises(KeyError, archive.Member, "qux")
+      finally:
+        archive.Close()
+
+  def testRoundTrip(self):
+    self._RoundTrip(compress=False)
+
+  def testRoundTripCompressed(self):
+    self._RoundTrip(compress=True)
+
+  def testNotAnArchive(self):
+    with utils.Tempdir() as d:
+      filename = d.create_file("pickle")
+      pytd_utils.SavePickle([("foo", "data")], filename, compress=True)
+      self.assertFalse(pickle_archive.IsArchive(filename))
+      self.assertRaises(pickle_archive.ArchiveError,
+                        pickle_archive.Archive, filename)
+
+  def testEmptyFile(self):
+    with utils.Tempdir() as d:
+      filename = d.create_file("empty")
+      self.assertFalse(pickle_archive.IsArchive(filename))
+      self.assertRaises(pickle_archive.ArchiveError,
+                        pickle_archive.Archive, filename)
+
+
+if __name__ == "__main__":
+  unittest.main()
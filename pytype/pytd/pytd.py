@@ -22,6 +22,9 @@
 
 import collections
 import itertools
+import weakref
+
+from pytype import metrics
 from pytype.pytd.parse import node
 from pytype.pytd.parse import preconditions
 
@@ -39,6 +42,64 @@ class Type(object):
 preconditions.register(Type)
 
 
+class _NameIndex(object):
+  """An index of a tuple of nodes, by name.
+
+  Indices are shared between all the TypeDeclUnits and Classes that have the
+  same tuple of members, see _GetNameIndex.
+
+  Attributes:
+    members: The tuple of nodes. Keeps id(members) from being reused while the
+      index is in use.
+    names: A dictionary mapping names to members.
+  """
+
+  __slots__ = ("members", "names", "__weakref__")
+
+  def __init__(self, members, names):
+    self.members = members
+    self.names = names
+
+
+# (id(members), attribute) -> _NameIndex. Entries disappear along with the
+# last node using them.
+_name_indices = weakref.WeakValueDictionary()
+
+
+def _GetNameIndex(members, attr):
+  """Get the index of a tuple of members, by the given name attribute.
+
+  Visit() and Replace() create new nodes, but most of the member tuples of a
+  rebuilt TypeDeclUnit or Class are the ones of the node it replaces. So we
+  share the indices of member tuples, instead of building them again for
+  every new node.
+
+  Args:
+    members: A tuple of nodes.
+    attr: The attribute to index the nodes by, e.g. "name".
+
+  Returns:
+    A _NameIndex.
+  """
+  key = (id(members), attr)
+  index = _name_indices.get(key)
+  if index is not None and index.members is members:
+    metrics.get_metric("pytd_name_index", metrics.MapCounter).inc("reused")
+    return index
+  index = _NameIndex(members, {getattr(x, attr): x for x in members})
+  _name_indices[key] = index
+  metrics.get_metric("pytd_name_index", metrics.MapCounter).inc("built")
+  return index
+
+
+def _BuildLookupTable(*indices):
+  """Combine name indices, with later indices taking precedence."""
+  name2item = {}
+  for index in indices:
+    name2item.update(index.names)
+  return name2item
+
+
 class TypeDeclUnit(node.Node('name: str or None',
                              'is_package: bool',
                              'constants: tuple[Constant]',
@@ -59,6 +120,16 @@ class TypeDeclUnit(node.Node('name: str or None',
     aliases: Iterable of aliases (or imports) for types in other modules.
   """
 
+  # Modules are compared by identity, see below.
+  shareable = False
+
+  # The members we index by name, and the attribute we index them by.
+  _INDEXED_FIELDS = (("type_params", "full_name"),
+                     ("constants", "name"),
+                     ("functions", "name"),
+                     ("classes", "name"),
+                     ("aliases", "name"))
+
   def Lookup(self, name):
     """Convenience function: Look up a given name in the global namespace.
 
@@ -78,13 +149,41 @@ class TypeDeclUnit(node.Node('name: str or None',
     try:
       return self._name2item[name]
     except AttributeError:
-      self._name2item = {}
-      for x in self.type_params:
-        self._name2item[x.full_name] = x
-      for x in self.constants + self.functions + self.classes + self.aliases:
-        self._name2item[x.name] = x
+      # A concatenation of modules (see SetConcatenatedUnits) is indexed by
+      # the indices of its modules, in the same order as its members.
+      indices = [unit._GetNameIndices()  # pylint: disable=protected-access
+                 for unit in self.GetConcatenatedUnits()]
+      self._name2item = _BuildLookupTable(
+          *(unit_indices[i] for i in range(len(self._INDEXED_FIELDS))
+            for unit_indices in indices))
       return self._name2item[name]
 
+  def _GetNameIndices(self):
+    try:
+      return self._name_indices
+    except AttributeError:
+      # Keep the indices alive as long as this node is. See _GetNameIndex.
+      self._name_indices = tuple(
+          _GetNameIndex(getattr(self, field), attr)
+          for field, attr in self._INDEXED_FIELDS)
+      return self._name_indices
+
+  def SetConcatenatedUnits(self, units):
+    """Record that this unit is the concatenation of the given units.
+
+    Lookup() then reuses the name indices of the units (which are kept with
+    them), instead of indexing all of our members again. See pytd_utils.Concat.
+
+    Args:
+      units: A sequence of TypeDeclUnits. Our members need to be exactly the
+        members of these units, in the same order.
+    """
+    self._concatenated_units = tuple(units)
+
+  def GetConcatenatedUnits(self):
+    """The units this unit is the concatenation of. Just (self,) by default."""
+    return self.__dict__.get("_concatenated_units", (self,))
+
   # The hash/eq/ne values are used for caching and speed things up quite a bit.
 
   def __hash__(self):
@@ -169,9 +268,10 @@ class Class(node.Node('name: str',
     try:
       return self._name2item[name]
     except AttributeError:
-      self._name2item = {}
-      for x in self.methods + self.constants:
-        self._name2item[x.name] = x
+      # Keep the indices alive as long as this node is. See _GetNameIndex.
+      self._name_indices = (_GetNameIndex(self.methods, "name"),
+                            _GetNameIndex(self.constants, "name"))
+      self._name2item = _BuildLookupTable(*self._name_indices)
       return self._name2item[name]
 
 
@@ -370,6 +470,9 @@ class ClassType(node.Node('name: str'), Type):
   # (c) Visitors will not process the "children" of this node. Since we point
   #     to classes that are back at the top of the tree, that would generate
   #     cycles.
+  # (d) Because it's mutable, it can't be shared between trees.
+
+  shareable = False
 
   def __getnewargs__(self):
     # Due to a peculiarity of cPickle, the new args cannot have references back
@@ -411,6 +514,9 @@ class LateType(node.Node('name: str'), Type):
 class FunctionType(node.Node('name: str'), Type):
   """The type of a function. E.g. the type of 'x' in 'x = lambda y: y'."""
 
+  # Like ClassType, this is filled in in place.
+  shareable = False
+
   def __new__(cls, name, function=None):
     self = super(FunctionType, cls).__new__(cls, name)
     self.function = function
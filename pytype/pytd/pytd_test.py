@@ -4,6 +4,7 @@ import itertools
 import pickle
 import textwrap
 import unittest
+from pytype import metrics
 from pytype.pyi import parser
 from pytype.pytd import pytd
 from pytype.pytd import visitors
@@ -113,6 +114,52 @@ class TestPytd(unittest.TestCase):
     self.assertTrue(tree2.ASTeq(tree1))
     self.assertTrue(tree2.ASTeq(tree2))
 
+  def testLookup(self):
+    src = textwrap.dedent("""
+        T = TypeVar('T')
+        x = ...  # type: int
+        def f() -> int
+        class C(object):
+            y = ...  # type: int
+            def g(self) -> int
+        D = C
+        """)
+    tree = parser.parse_string(src, python_version=self.PYTHON_VERSION)
+    self.assertEqual("int", tree.Lookup("x").type.name)
+    self.assertIs(tree.functions[0], tree.Lookup("f"))
+    self.assertIs(tree.classes[0], tree.Lookup("C"))
+    self.assertIs(tree.aliases[0], tree.Lookup("D"))
+    self.assertIs(tree.type_params[0], tree.Lookup("T"))
+    self.assertIs(tree.classes[0].methods[0], tree.Lookup("C").Lookup("g"))
+    self.assertEqual("y", tree.Lookup("C").Lookup("y").name)
+    self.assertRaises(KeyError, tree.Lookup, "g")
+    self.assertRaises(KeyError, tree.Lookup("C").Lookup, "x")
+
+  def testLookupIndexIsShared(self):
+    src = textwrap.dedent("""
+        x = ...  # type: int
+        def f() -> int
+        class C(object):
+            def g(self) -> int
+        """)
+    tree = parser.parse_string(src, python_version=self.PYTHON_VERSION)
+    metrics._prepare_for_test()
+    tree.Lookup("x")
+    index = metrics.get_metric("pytd_name_index", metrics.MapCounter)
+    built = index._counts.get("built", 0)
+    reused = index._counts.get("reused", 0)
+    # One index each for type_params, constants, functions, classes, aliases.
+    self.assertEqual(5, built + reused)
+    new_tree = tree.Replace(
+        functions=(tree.functions[0].Replace(name="h"),))
+    self.assertIs(new_tree.functions[0], new_tree.Lookup("h"))
+    self.assertIs(new_tree.constants[0], new_tree.Lookup("x"))
+    self.assertRaises(KeyError, new_tree.Lookup, "f")
+    # Only the index of the functions was built again.
+    self.assertEqual(built + 1, index._counts["built"])
+    self.assertEqual(reused + 4, index._counts["reused"])
+    metrics._prepare_for_test(enabled=False)
+
   def testEmptyNodesAreTrue(self):
     self.assertTrue(pytd.AnythingType())
     self.assertTrue(pytd.NothingType())
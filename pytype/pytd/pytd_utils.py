@@ -71,7 +71,7 @@ def Concat(*args, **kwargs):
   assert all(isinstance(arg, pytd.TypeDeclUnit) for arg in args)
   name = kwargs.get("name")
   is_package = bool(kwargs.get("is_package"))
-  return pytd.TypeDeclUnit(
+  unit = pytd.TypeDeclUnit(
       name=name or " + ".join(arg.name for arg in args),
       is_package=is_package,
       constants=sum((arg.constants for arg in args), ()),
@@ -79,6 +79,10 @@ def Concat(*args, **kwargs):
       classes=sum((arg.classes for arg in args), ()),
       functions=sum((arg.functions for arg in args), ()),
       aliases=sum((arg.aliases for arg in args), ()))
+  # Concatenations of concatenations are concatenations of the original units.
+  unit.SetConcatenatedUnits(itertools.chain.from_iterable(
+      arg.GetConcatenatedUnits() for arg in args))
+  return unit
 
 
 JoinTypes = parser.join_types  # pylint: disable=invalid-name
@@ -96,6 +96,21 @@ class TestUtils(parser_test_base.ParserTest):
                      pytd.TypeParameter("T", scope="__builtin__"))
     self.assertEqual(combined.Lookup("T"), pytd.TypeParameter("T", scope=None))
 
+  def testConcatLookup(self):
+    """Test looking up names in nested concatenations."""
+    ast1 = self.Parse("""x = ...  # type: int""")
+    ast2 = self.Parse("""def x() -> int""")
+    ast3 = self.Parse("""class y(object): ...""")
+    combined = pytd_utils.Concat(pytd_utils.Concat(ast1, ast2), ast3)
+    self.assertEqual((ast1, ast2, ast3), combined.GetConcatenatedUnits())
+    # Functions take precedence over constants, as in a single module.
+    self.assertIs(ast2.functions[0], combined.Lookup("x"))
+    self.assertIs(ast3.classes[0], combined.Lookup("y"))
+    # Rewriting the concatenation makes it a module of its own.
+    renamed = combined.Replace(name="renamed")
+    self.assertEqual((renamed,), renamed.GetConcatenatedUnits())
+    self.assertIs(ast3.classes[0], renamed.Lookup("y"))
+
   def testJoinTypes(self):
     """Test that JoinTypes() does recursive flattening."""
     n1, n2, n3, n4, n5, n6 = [pytd.NamedType("n%d" % i) for i in range(6)]
@@ -1,17 +1,21 @@
-"""Converts pyi files to pickled asts and saves them to disk.
+"""Converts pyi files to serialized asts and saves them to disk.
 
 Used to speed up module importing. This is done by loading the ast and
 serializing it to disk. Further users only need to read the serialized data from
 disk, which is faster to digest than a pyi file.
+
+Asts are stored in the format of binary_ast. Pickled asts, as written by older
+versions, can still be loaded.
 """
 
 import collections
 
 from pytype import utils
 from pytype.pyi import parser
+from pytype.pytd import binary_ast
 from pytype.pytd import pytd
-from pytype.pytd import pytd_utils
 from pytype.pytd import visitors
+from six.moves import cPickle
 
 
 class UnrestorableDependencyError(Exception):
@@ -35,13 +39,31 @@ class FindClassAndFunctionTypesVisitor(visitors.Visitor):
     self.function_type_nodes.append(n)
 
 
+class _ShareTypesByName(visitors.Visitor):
+  """Use one ClassType (FunctionType) node per name.
+
+  Which of these nodes a tree shares otherwise depends on how it was built, and
+  binary_ast stores every one of them separately.
+  """
+
+  def __init__(self):
+    super(_ShareTypesByName, self).__init__()
+    self._nodes = {}
+
+  def VisitClassType(self, node):
+    return self._nodes.setdefault((pytd.ClassType, node.name), node)
+
+  def VisitFunctionType(self, node):
+    return self._nodes.setdefault((pytd.FunctionType, node.name), node)
+
+
 SerializableTupleClass = collections.namedtuple(
     "_", ["ast", "dependencies",
           "class_type_nodes", "function_type_nodes"])
 
 
 class SerializableAst(SerializableTupleClass):
-  """The data pickled to disk to save an ast.
+  """The data serialized to disk to save an ast.
 
   Attributes:
     ast: The TypeDeclUnit representing the serialized module.
@@ -61,7 +83,13 @@ class SerializableAst(SerializableTupleClass):
 
 
 class RenameModuleVisitor(visitors.Visitor):
-  """Renames a TypeDeclUnit."""
+  """Renames a TypeDeclUnit.
+
+  ClassType and FunctionType nodes whose name changes are replaced by new nodes,
+  all others stay the same. Use Remap() to translate a list of the original
+  nodes (e.g. SerializableAst.class_type_nodes) into the nodes of the renamed
+  tree.
+  """
 
   def __init__(self, old_module_name, new_module_name):
     """Constructor.
@@ -83,6 +111,9 @@ class RenameModuleVisitor(visitors.Visitor):
     self._module_name = new_module_name
     self._old = old_module_name + "." if old_module_name else ""
     self._new = new_module_name + "." if new_module_name else ""
+    # Maps the ids of renamed ClassType and FunctionType nodes to the original
+    # node (to keep the id valid) and its replacement.
+    self._replaced = {}
 
   def _MaybeNewName(self, name):
     """Decides if a name should be replaced.
@@ -110,10 +141,25 @@ class RenameModuleVisitor(visitors.Visitor):
     else:
       return node
 
+  def _ReplacePointer(self, node, new_node_factory):
+    # A node can occur several times in the tree, replace it by one new node.
+    if id(node) not in self._replaced:
+      self._replaced[id(node)] = (node, new_node_factory())
+    return self._replaced[id(node)][1]
+
   def VisitClassType(self, node):
     new_name = self._MaybeNewName(node.name)
     if new_name != node.name:
-      return pytd.ClassType(new_name, node.cls)
+      return self._ReplacePointer(
+          node, lambda: pytd.ClassType(new_name, node.cls))
+    else:
+      return node
+
+  def VisitFunctionType(self, node):
+    new_name = self._MaybeNewName(node.name)
+    if new_name != node.name:
+      return self._ReplacePointer(
+          node, lambda: pytd.FunctionType(new_name, node.function))
     else:
       return node
 
@@ -133,17 +179,32 @@ class RenameModuleVisitor(visitors.Visitor):
   VisitStrictType = _ReplaceModuleName  # pylint: disable=invalid-name
   VisitNamedType = _ReplaceModuleName  # pylint: disable=invalid-name
 
+  def Remap(self, nodes):
+    """Map ClassType or FunctionType nodes to the ones in the renamed tree.
+
+    Args:
+      nodes: A list of ClassType or FunctionType nodes of the tree this visitor
+        was applied to, or None.
+
+    Returns:
+      A list of the corresponding nodes in the renamed tree, or None.
+    """
+    if nodes is None:
+      return None
+    replaced = self._replaced
+    return [replaced[id(n)][1] if id(n) in replaced else n for n in nodes]
+
 
 def StoreAst(ast, filename=None):
   """Loads and stores an ast to disk.
 
   Args:
     ast: The pytd.TypeDeclUnit to save to disk.
-    filename: The filename for the pickled output. If this is None, this
-      function instead returns the pickled string.
+    filename: The filename for the serialized output. If this is None, this
+      function instead returns the serialized string.
 
   Returns:
-    The pickled string, if no filename was given. (None otherwise.)
+    The serialized string, if no filename was given. (None otherwise.)
   """
   if ast.name.endswith(".__init__"):
     ast = ast.Visit(RenameModuleVisitor(
@@ -155,12 +216,40 @@ def StoreAst(ast, filename=None):
 
   # Clean external references
   ast.Visit(visitors.ClearClassPointers())
+  ast = ast.Visit(_ShareTypesByName())
   indexer = FindClassAndFunctionTypesVisitor()
   ast.Visit(indexer)
-  return pytd_utils.SavePickle(SerializableAst(
-      ast, list(sorted(dependencies)),
-      list(sorted(indexer.class_type_nodes)),
-      list(sorted(indexer.function_type_nodes))), filename)
+  data = binary_ast.Dump((ast, tuple(sorted(dependencies)),
+                          tuple(sorted(indexer.class_type_nodes)),
+                          tuple(sorted(indexer.function_type_nodes))))
+  if filename is None:
+    return data
+  with open(filename, "wb") as fi:
+    fi.write(data)
+
+
+def LoadAst(data):
+  """Deserialize the output of StoreAst.
+
+  Args:
+    data: The serialized string, in the format of binary_ast, or a pickled
+      SerializableAst.
+
+  Returns:
+    A SerializableAst instance.
+  """
+  if not binary_ast.IsBinary(data):
+    return cPickle.loads(data)
+  ast, dependencies, class_type_nodes, function_type_nodes = (
+      binary_ast.Load(data))
+  return SerializableAst(ast, list(dependencies), list(class_type_nodes),
+                         list(function_type_nodes))
+
+
+def LoadAstFromFile(filename):
+  """Deserialize a file written by StoreAst. See LoadAst."""
+  with open(filename, "rb") as fi:
+    return LoadAst(fi.read())
 
 
 def EnsureAstName(ast, module_name, fix=False):
@@ -180,9 +269,14 @@ def EnsureAstName(ast, module_name, fix=False):
   # module_name is the name from this run, raw_ast.name is the guessed name from
   # when the ast has been pickled.
   if fix and module_name != raw_ast.name:
-    ast = ast.Replace(class_type_nodes=None, function_type_nodes=None)
+    # The renamed tree shares all ClassType and FunctionType nodes that kept
+    # their name with the original, so the node index can be carried over and
+    # ProcessAst doesn't have to visit the whole tree.
+    renamer = RenameModuleVisitor(raw_ast.name, module_name)
     ast = ast.Replace(
-        ast=raw_ast.Visit(RenameModuleVisitor(raw_ast.name, module_name)))
+        ast=raw_ast.Visit(renamer),
+        class_type_nodes=renamer.Remap(ast.class_type_nodes),
+        function_type_nodes=renamer.Remap(ast.function_type_nodes))
   else:
     assert module_name == raw_ast.name
   return ast
@@ -191,11 +285,9 @@ def EnsureAstName(ast, module_name, fix=False):
 def ProcessAst(serializable_ast, module_map):
   """Postprocess a pickled ast.
 
-  Postprocessing will either just fill the ClassType references from module_map
-  or if module_name changed between pickling and loading rename the module
-  internal references to the new module_name.
-  Renaming is more expensive than filling references, as the whole AST needs to
-  be rebuild.
+  Postprocessing fills the ClassType and FunctionType references, from
+  module_map for external ones and from the ast itself for local ones. A
+  different module name has to be applied before, with EnsureAstName.
 
   Args:
     serializable_ast: A SerializableAst instance.
@@ -306,28 +398,23 @@ def PrepareForExport(module_name, python_version, ast, loader):
     module_name: The module_name as a string for the returned ast.
     python_version: A tuple of (major, minor) python version as string
       (see config.python_version).
-    ast: pytd.TypeDeclUnit, is only used if src is None.
+    ast: pytd.TypeDeclUnit, as generated by the inference, with unqualified
+      local names.
     loader: A load_pytd.Loader instance.
 
   Returns:
     A pytd.TypeDeclUnit representing the supplied AST as it would look after
     being written to a file and parsed.
   """
-  # This is a workaround for functionality which crept into places it doesn't
-  # belong. Ideally this would call some transformation Visitors on ast to
-  # transform it into the same ast we get after parsing and loading (compare
-  # load_pytd.Loader.load_file). Unfortunately parsing has some special cases,
-  # e.g. '__init__' return type and '__new__' being a 'staticmethod', which
-  # need to be moved to visitors before we can do this. Printing an ast also
-  # applies transformations,
-  # e.g. visitors.PrintVisitor._FormatContainerContents, which need to move to
-  # their own visitors so they can be applied without printing.
-  src = pytd_utils.Print(ast)
-  ast = parser.parse_string(src=src, name=module_name,
-                            python_version=python_version)
-  ast = ast.Visit(visitors.LookupBuiltins(loader.builtins, full_names=False))
-  ast = ast.Visit(visitors.ExpandCompatibleBuiltins(loader.builtins,
-                                                    python_version))
+  # Apply the transformations printing and parsing would apply, without
+  # actually printing and parsing.
+  ast = ast.Visit(visitors.ApplyPrintTransformations())
+  ast = ast.Visit(parser.ApplyParseTransformations())
+  ast = parser.post_process_ast(ast, module_name)
+  ast = ast.Replace(is_package=False)
+  ast = visitors.ApplyVisitors(ast, [
+      visitors.LookupBuiltins(loader.builtins, full_names=False),
+      visitors.ExpandCompatibleBuiltins(loader.builtins, python_version)])
   ast = ast.Visit(visitors.LookupLocalTypes())
   ast = ast.Visit(visitors.AdjustTypeParameters())
   ast = ast.Visit(visitors.NamedTypeToClassType())
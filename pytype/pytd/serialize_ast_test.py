@@ -1,5 +1,4 @@
 import os
-import pickle
 
 from pytype import load_pytd
 from pytype import utils
@@ -77,7 +76,7 @@ class SerializeAstTest(unittest.TestCase):
       pickled_ast_filename = os.path.join(d.path, "module1.pyi.pickled")
       module_map = self._StoreAst(d, module_name, pickled_ast_filename)
       del module_map[module_name]
-      serialized_ast = pytd_utils.LoadPickle(pickled_ast_filename)
+      serialized_ast = serialize_ast.LoadAstFromFile(pickled_ast_filename)
 
       # The sorted makes the testcase more deterministic.
       serialized_ast = serialized_ast.Replace(class_type_nodes=sorted(
@@ -155,12 +154,23 @@ class SerializeAstTest(unittest.TestCase):
       result = serialize_ast.StoreAst(ast, pickled_ast_filename)
 
       self.assertIsNone(result)
-      with open(pickled_ast_filename, "rb") as fi:
-        serialized_ast = pickle.load(fi)
+      serialized_ast = serialize_ast.LoadAstFromFile(pickled_ast_filename)
       self.assertTrue(serialized_ast.ast)
       self.assertEqual(serialized_ast.dependencies,
                        ["__builtin__", "foo.bar.module1", "module2"])
 
+  def testLoadLegacyPickle(self):
+    with utils.Tempdir() as d:
+      ast, _ = self._GetAst(temp_dir=d, module_name="foo.bar.module1")
+      serialized_ast = serialize_ast.LoadAst(serialize_ast.StoreAst(ast))
+      pickled_ast_filename = os.path.join(d.path, "module1.pyi.pickled")
+      pytd_utils.SavePickle(serialized_ast, pickled_ast_filename)
+      loaded_ast = serialize_ast.LoadAstFromFile(pickled_ast_filename)
+      self.assertEqual(serialized_ast.dependencies, loaded_ast.dependencies)
+      self.assertTrue(serialized_ast.ast.ASTeq(loaded_ast.ast))
+      self.assertEqual(len(serialized_ast.class_type_nodes),
+                       len(loaded_ast.class_type_nodes))
+
   def testUnrestorableChild(self):
     # Assume .cls in a ClassType X in module1 was referencing something for
     # which, Visitors.LookupExternalTypes returned AnythingType.
@@ -217,7 +227,7 @@ class SerializeAstTest(unittest.TestCase):
           d, "module1", pickled_ast_filename, ast=ast, loader=loader)
       del module_map["module1"]
 
-      serialized_ast = pytd_utils.LoadPickle(pickled_ast_filename)
+      serialized_ast = serialize_ast.LoadAstFromFile(pickled_ast_filename)
       loaded_ast = serialize_ast.ProcessAst(
           serialized_ast, module_map)
       # Look up the "SomeClass" in "def func(a: SomeClass), then run
@@ -235,7 +245,7 @@ class SerializeAstTest(unittest.TestCase):
       original_ast = module_map[module_name]
       del module_map[module_name]
       loaded_ast = serialize_ast.ProcessAst(
-          pytd_utils.LoadPickle(pickled_ast_filename),
+          serialize_ast.LoadAstFromFile(pickled_ast_filename),
           module_map)
 
       self.assertTrue(loaded_ast)
@@ -258,7 +268,7 @@ class SerializeAstTest(unittest.TestCase):
       del module_map[module_name]
 
       loaded_ast = serialize_ast.ProcessAst(
-          pytd_utils.LoadPickle(pickled_ast_filename),
+          serialize_ast.LoadAstFromFile(pickled_ast_filename),
           module_map)
 
       self.assertTrue(loaded_ast)
@@ -276,7 +286,7 @@ class SerializeAstTest(unittest.TestCase):
 
       with self.assertRaises(serialize_ast.UnrestorableDependencyError):
         serialize_ast.ProcessAst(
-            pytd_utils.LoadPickle(pickled_ast_filename),
+            serialize_ast.LoadAstFromFile(pickled_ast_filename),
             module_map)
 
   def testUnrestorableDependencyErrorWithoutModuleIndex(self):
@@ -286,7 +296,7 @@ class SerializeAstTest(unittest.TestCase):
       module_map = self._StoreAst(d, module_name, pickled_ast_filename)
       module_map = {}  # Remove module2
 
-      loaded_ast = pytd_utils.LoadPickle(pickled_ast_filename)
+      loaded_ast = serialize_ast.LoadAstFromFile(pickled_ast_filename)
       loaded_ast.modified_class_types = None  # Remove the index
       with self.assertRaises(serialize_ast.UnrestorableDependencyError):
         serialize_ast.ProcessAst(loaded_ast, module_map)
@@ -300,7 +310,7 @@ class SerializeAstTest(unittest.TestCase):
       del module_map[original_module_name]
 
       new_module_name = "wurstbrot.module2"
-      serializable_ast = pytd_utils.LoadPickle(pickled_ast_filename)
+      serializable_ast = serialize_ast.LoadAstFromFile(pickled_ast_filename)
       serializable_ast = serialize_ast.EnsureAstName(
           serializable_ast, new_module_name, fix=True)
       loaded_ast = serialize_ast.ProcessAst(serializable_ast, module_map)
@@ -313,13 +323,59 @@ class SerializeAstTest(unittest.TestCase):
       ast_new_module, _ = self._GetAst(temp_dir=d, module_name=new_module_name)
       self.assertTrue(ast_new_module.ASTeq(loaded_ast))
 
+  def testLoadWithDifferentModuleNameKeepsIndex(self):
+    with utils.Tempdir() as d:
+      pickled_ast_filename = os.path.join(d.path, "module1.pyi.pickled")
+      module_map = self._StoreAst(d, "module1", pickled_ast_filename)
+      del module_map["module1"]
+
+      serializable_ast = serialize_ast.LoadAstFromFile(pickled_ast_filename)
+      serializable_ast = serialize_ast.EnsureAstName(
+          serializable_ast, "wurstbrot.module2", fix=True)
+      self.assertIsNotNone(serializable_ast.class_type_nodes)
+      self.assertIsNotNone(serializable_ast.function_type_nodes)
+      indexer = serialize_ast.FindClassAndFunctionTypesVisitor()
+      serializable_ast.ast.Visit(indexer)
+      self.assertItemsEqual(map(id, indexer.class_type_nodes),
+                            map(id, serializable_ast.class_type_nodes))
+      self.assertItemsEqual(map(id, indexer.function_type_nodes),
+                            map(id, serializable_ast.function_type_nodes))
+      self.assertFalse([n for n in indexer.class_type_nodes
+                        if n.name.startswith("module1.")])
+
+      loaded_ast = serialize_ast.ProcessAst(serializable_ast, module_map)
+      loaded_ast.Visit(visitors.VerifyLookup())
+
+  def testLoadWithDifferentModuleNameSharedNodes(self):
+    with utils.Tempdir() as d:
+      pickled_ast_filename = os.path.join(d.path, "module1.pyi.pickled")
+      ast, loader = self._GetAst(d, "module1", src="""
+        class A(object): ...
+        def f(x: A) -> A: ...
+        def g(x: A) -> A: ...
+      """)
+      module_map = self._StoreAst(d, "module1", pickled_ast_filename,
+                                  ast=ast, loader=loader)
+      del module_map["module1"]
+
+      serializable_ast = serialize_ast.LoadAstFromFile(pickled_ast_filename)
+      indexer = serialize_ast.FindClassAndFunctionTypesVisitor()
+      serializable_ast.ast.Visit(indexer)
+      # StoreAst uses one node per name.
+      self.assertEqual(len({id(n) for n in indexer.class_type_nodes
+                            if n.name == "module1.A"}), 1)
+      serializable_ast = serialize_ast.EnsureAstName(
+          serializable_ast, "module2", fix=True)
+      loaded_ast = serialize_ast.ProcessAst(serializable_ast, module_map)
+      loaded_ast.Visit(visitors.VerifyLookup())
+
   def testStoreRemovesInit(self):
     with utils.Tempdir() as d:
       original_module_name = "module1.__init__"
       pickled_ast_filename = os.path.join(d.path, "module1.pyi.pickled")
 
       module_map = self._StoreAst(d, original_module_name, pickled_ast_filename)
-      serializable_ast = pytd_utils.LoadPickle(pickled_ast_filename)
+      serializable_ast = serialize_ast.LoadAstFromFile(pickled_ast_filename)
 
       expected_name = "module1"
       # Check that the module had the expected name before.
@@ -333,7 +389,7 @@ class SerializeAstTest(unittest.TestCase):
     with utils.Tempdir() as d:
       foo = d.create_file("foo.pickle")
       module_map = self._StoreAst(d, "foo", foo, ast=self._GetAst(d, "foo"))
-      p = pytd_utils.LoadPickle(foo)
+      p = serialize_ast.LoadAstFromFile(foo)
       self.assertTrue(p.function_type_nodes)
       ast = serialize_ast.ProcessAst(p, module_map)
       f, = [a for a in ast.aliases if a.name == "foo.f"]
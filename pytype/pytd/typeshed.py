@@ -27,6 +27,7 @@ class Typeshed(object):
       pytype_base = os.path.split(os.path.dirname(__file__))[0]
       self._typeshed_path = os.path.join(pytype_base, "typeshed")
     self._missing = frozenset(self._load_missing())
+    self._blacklisted = {}  # major version -> list of module names
 
   def _load_file(self, path):
     if self._env_home:
@@ -149,6 +150,12 @@ class Typeshed(object):
 
   def blacklisted_modules(self, python_version):
     """Return the blacklist, as a list of module names. E.g. ["x", "y.z"]."""
+    major = python_version[0]
+    if major not in self._blacklisted:
+      self._blacklisted[major] = list(self._read_blacklisted_modules(major))
+    return self._blacklisted[major]
+
+  def _read_blacklisted_modules(self, major):
     for full_filename in self.read_blacklist():
       filename = os.path.splitext(full_filename)[0]
       path = filename.split("/")  # E.g. ["stdlib", "2", "html", "parser.pyi"]
@@ -156,8 +163,7 @@ class Typeshed(object):
       # specific version (e.g. stdlib/3.4/...). That usually just means
       # that this module didn't exist in earlier Python versions. So
       # we can still just use python_version[0].
-      if (path[1].startswith(str(python_version[0])) or
-          path[1] == "2and3"):
+      if path[1].startswith(str(major)) or path[1] == "2and3":
         yield utils.path_to_module_name("/".join(path[2:]))
 
 
@@ -178,8 +184,8 @@ def _get_typeshed():
   return _typeshed
 
 
-def parse_type_definition(pyi_subdir, module, python_version):
-  """Load and parse a *.pyi from typeshed.
+def get_type_definition_file(pyi_subdir, module, python_version):
+  """Find a *.pyi in typeshed.
 
   Args:
     pyi_subdir: the directory where the module should be found.
@@ -187,16 +193,36 @@ def parse_type_definition(pyi_subdir, module, python_version):
     python_version: sys.version_info[:2]
 
   Returns:
-    The AST of the module; None if the module doesn't have a definition.
+    A tuple of the filename and the source of the module; None if the module
+    doesn't have a definition.
   """
   assert python_version
   typeshed = _get_typeshed()
   try:
-    filename, src = typeshed.get_module_file(
-        pyi_subdir, module, python_version)
+    return typeshed.get_module_file(pyi_subdir, module, python_version)
   except IOError:
     return None
 
-  ast = parser.parse_string(src, filename=filename, name=module,
-                            python_version=python_version)
+
+def parse_type_definition(pyi_subdir, module, python_version, pyi_cache=None):
+  """Load and parse a *.pyi from typeshed.
+
+  Args:
+    pyi_subdir: the directory where the module should be found.
+    module: the module name (without any file extension)
+    python_version: sys.version_info[:2]
+    pyi_cache: Optionally, a parse_cache.ParseCache to parse with.
+
+  Returns:
+    The AST of the module; None if the module doesn't have a definition.
+  """
+  definition = get_type_definition_file(pyi_subdir, module, python_version)
+  if definition is None:
+    return None
+  filename, src = definition
+  if pyi_cache:
+    ast = pyi_cache.parse_string(src, filename, module, python_version)
+  else:
+    ast = parser.parse_string(src, filename=filename, name=module,
+                              python_version=python_version)
   return ast.Replace(is_package=utils.is_pyi_directory_init(filename))
@@ -4,6 +4,7 @@ import os
 
 
 from pytype import load_pytd
+from pytype import utils
 from pytype.pytd import typeshed
 from pytype.pytd.parse import builtins
 from pytype.pytd.parse import parser_test_base
@@ -29,6 +30,21 @@ class TestTypeshedLoading(parser_test_base.ParserTest):
     self.assertEqual("__init__.pyi", os.path.basename(filename))
     self.assertIn(b"LogRecord", data)
 
+  def test_get_typeshed_file_with_manifest(self):
+    # The manifest of an installation covers typeshed, and the typeshed paths
+    # are absolute. errno.pyi exists, but since it's missing from the manifest,
+    # it isn't looked for on disk.
+    filename, _ = self.ts.get_module_file("stdlib", "errno", (2, 7))
+    self.assertTrue(os.path.exists(filename))
+    pytype_files = utils._pytype_files  # pylint: disable=protected-access
+    utils._pytype_files = utils._PytypeFiles(  # pylint: disable=protected-access
+        [["typeshed", "*.pyi"]], ["typeshed/stdlib/2and3/foo.pyi"])
+    try:
+      self.assertRaises(IOError, self.ts.get_module_file,
+                        "stdlib", "errno", (2, 7))
+    finally:
+      utils._pytype_files = pytype_files  # pylint: disable=protected-access
+
   def test_parse_type_definition(self):
     ast = typeshed.parse_type_definition("stdlib", "_random", (2, 7))
     self.assertIn("_random.Random", [cls.name for cls in ast.classes])
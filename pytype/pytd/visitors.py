@@ -106,6 +106,19 @@ class Visitor(object):
 
   Attributes:
     visits_all_node_types: Whether the visitor can visit every node type.
+    fusable: Whether ApplyVisitors may run this visitor in the same traversal
+      as its neighbors. A fused traversal calls all the visitors' callbacks at
+      a node before moving on, so a visitor is only fusable if
+        (1) its Visit callbacks don't look at the children of their node
+            (these may already have been changed by visitors that come after
+            it), e.g. because they only transform leaves,
+        (2) its Enter and Leave callbacks only track where in the tree we are,
+            without looking at what earlier visitors might have changed,
+        (3) whatever it looks up elsewhere in the tree isn't changed by the
+            other fusable visitors, and
+        (4) the nodes it returns don't contain new subtrees that later
+            visitors would need to descend into. (Later visitors only get to
+            call their Visit callback on a returned node, not on its children.)
     unchecked_node_names: Contains the names of node classes that are unchecked
       when constructing a new node from visited children.  This is useful
       if a visitor returns data in part or all of its walk that would violate
@@ -122,6 +135,7 @@ class Visitor(object):
       nodes under which some actionable node can appear.
   """
   visits_all_node_types = False
+  fusable = False
   unchecked_node_names = set()
 
   _visitor_functions_cache = {}
@@ -195,6 +209,105 @@ class Visitor(object):
     self.leave_functions[node.__class__.__name__](self, node, *args, **kwargs)
 
 
+class _FusedVisitor(Visitor):
+  """Runs several fusable visitors in a single traversal.
+
+  At every node, the visitors' Enter callbacks are called in order, and after
+  the children have been processed, each visitor's Visit callback is called on
+  the result of the previous one, followed by the Leave callbacks. A visitor
+  whose Enter callback returns False is suspended until we leave that node
+  again, the same way a separate traversal wouldn't descend into the node.
+  """
+
+  def __init__(self, visitors):
+    super(_FusedVisitor, self).__init__()
+    assert all(v.fusable for v in visitors)
+    self._visitors = visitors
+    self.visits_all_node_types = any(v.visits_all_node_types for v in visitors)
+    self.unchecked_node_names = set().union(
+        *(v.unchecked_node_names for v in visitors))
+    self.visit_class_names = set().union(
+        *(v.visit_class_names for v in visitors))
+    self.enter_functions = set().union(*(v.enter_functions for v in visitors))
+    self.visit_functions = set().union(*(v.visit_functions for v in visitors))
+    # Leaving a node we entered might also end a suspension.
+    self.leave_functions = self.enter_functions.union(
+        *(v.leave_functions for v in visitors))
+    self._suspended = []  # Stack of (node, visitors suspended at that node).
+    self._inactive = set()
+
+  def Enter(self, node, *args, **kwargs):
+    name = node.__class__.__name__
+    stopped = []
+    descend = False
+    for v in self._visitors:
+      if v in self._inactive or name not in v.visit_class_names:
+        continue
+      if (name in v.enter_functions and
+          v.Enter(node, *args, **kwargs) is False):
+        stopped.append(v)
+      else:
+        descend = True
+    if not descend:
+      return False
+    if stopped:
+      self._suspended.append((node, stopped))
+      self._inactive.update(stopped)
+
+  def Visit(self, node, *args, **kwargs):
+    for v in self._visitors:
+      if v in self._inactive:
+        continue
+      if (v.visits_all_node_types or
+          node.__class__.__name__ in v.visit_functions):
+        v.old_node = self.old_node
+        node = v.Visit(node, *args, **kwargs)
+        del v.old_node
+    return node
+
+  def Leave(self, node, *args, **kwargs):
+    name = node.__class__.__name__
+    for v in self._visitors:
+      if v not in self._inactive and name in v.leave_functions:
+        v.Leave(node, *args, **kwargs)
+    if self._suspended and self._suspended[-1][0] is node:
+      _, stopped = self._suspended.pop()
+      self._inactive.difference_update(stopped)
+
+
+def ApplyVisitors(node, visitors):
+  """Apply a sequence of visitors to a node, fusing traversals if possible.
+
+  Consecutive visitors that are fusable (see Visitor.fusable) are run in a
+  single traversal of the tree. All others get a traversal of their own.
+
+  Args:
+    node: The node to transform, usually a TypeDeclUnit.
+    visitors: A sequence of Visitor instances, applied in order.
+
+  Returns:
+    The transformed node, the same as that of applying the visitors one by one.
+  """
+  group = []
+  for visitor in visitors:
+    if visitor.fusable:
+      group.append(visitor)
+      continue
+    node = _ApplyGroup(node, group)
+    group = []
+    node = node.Visit(visitor)
+  return _ApplyGroup(node, group)
+
+
+def _ApplyGroup(node, group):
+  if len(group) > 1:
+    return node.Visit(_FusedVisitor(group))
+  elif group:
+    return node.Visit(group[0])
+  else:
+    return node
+
+
 def InventStarArgParams(existing_names):
   """Try to find names for *args, **kwargs that aren't taken already."""
   names = {x if isinstance(x, str) else x.name
@@ -669,6 +782,167 @@ class PrintVisitor(Visitor):
       return " and ".join(type_list)
 
 
+class ApplyPrintTransformations(Visitor):
+  """Applies the transformations PrintVisitor implicitly does to a tree.
+
+  Printing a tree loses some information, e.g. the types of "self" and of
+  *args/**kwargs containers, or the scopes of type parameters. This visitor
+  drops the same information, so that the result, after also applying
+  parser.ApplyParseTransformations and parser.post_process_ast, is the tree we
+  would get by printing and parsing. It needs to be applied to an unresolved
+  tree with unqualified local names, like the output of the inference.
+  """
+
+  def __init__(self):
+    super(ApplyPrintTransformations, self).__init__()
+    self._local_names = set()
+    self._class_members = set()
+    self._classes = []
+    self._in_parameter = False
+
+  def _NameCollision(self, name):
+    return name in self._class_members or name in self._local_names
+
+  def EnterTypeDeclUnit(self, unit):
+    definitions = (unit.classes + unit.functions + unit.constants +
+                   unit.type_params + unit.aliases)
+    self._local_names = {c.name for c in definitions}
+
+  def LeaveTypeDeclUnit(self, _):
+    self._local_names = set()
+
+  def VisitTypeDeclUnit(self, node):
+    # PrintVisitor prints type parameter declarations with a new PrintVisitor,
+    # so there are no name collisions inside of them.
+    visitor = ApplyPrintTransformations()
+    type_params = tuple(
+        pytd.TypeParameter(
+            t.name, tuple(c.Visit(visitor) for c in t.constraints),
+            t.bound and t.bound.Visit(visitor))
+        for t in self.old_node.type_params)
+    return node.Replace(type_params=type_params)
+
+  def EnterClass(self, node):
+    for member in node.methods + node.constants:
+      self._class_members.add(member.name)
+    self._classes.append(node)
+
+  def LeaveClass(self, unused_node):
+    self._class_members.clear()
+    self._classes.pop()
+
+  def VisitClass(self, node):
+    return node.Replace(template=())
+
+  def _StarParam(self, param, container_name, key_types):
+    """Convert a *args or **kwargs parameter, see _FormatContainerContents."""
+    if (isinstance(param.type, pytd.GenericType) and
+        not isinstance(param.type.parameters[-1], pytd.AnythingType)):
+      value_type = param.Replace(type=param.type.parameters[-1]).Visit(
+          ApplyPrintTransformations()).type
+      t = pytd.GenericType(pytd.NamedType(container_name),
+                           key_types + (value_type,))
+    else:
+      t = pytd.NamedType(container_name)
+    return pytd.Parameter(param.name, t, False, True, None)
+
+  def VisitSignature(self, node):
+    starargs = self.old_node.starargs
+    if starargs is not None:
+      starargs = self._StarParam(starargs, "tuple", ())
+    starstarargs = self.old_node.starstarargs
+    if starstarargs is not None:
+      starstarargs = self._StarParam(
+          starstarargs, "dict", (pytd.NamedType("str"),))
+    if isinstance(node.return_type, pytd.NothingType):
+      node = node.Replace(return_type=pytd.NamedType("typing.NoReturn"))
+    return node.Replace(starargs=starargs, starstarargs=starstarargs,
+                        template=())
+
+  def EnterParameter(self, unused_node):
+    assert not self._in_parameter
+    self._in_parameter = True
+
+  def LeaveParameter(self, unused_node):
+    assert self._in_parameter
+    self._in_parameter = False
+
+  def _IsClassType(self, t, cls):
+    """Whether t is printed like the class name, see PrintVisitor.EnterClass."""
+    parameters = tuple(pytd.NamedType(item.name) for item in cls.template)
+    if parameters:
+      return (isinstance(t, pytd.GenericType) and
+              t.base_type == pytd.NamedType(cls.name) and
+              t.parameters == parameters)
+    else:
+      return t == pytd.NamedType(cls.name)
+
+  def VisitParameter(self, node):
+    if self.old_node.mutated_type is not None:
+      node = node.Replace(mutated_type=self.old_node.mutated_type.Visit(
+          ApplyPrintTransformations()))
+    if not self._classes:
+      return node
+    cls = self._classes[-1]
+    t = node.type
+    # The types of "self" and "cls" aren't printed, and are parsed as Any.
+    if node.name == "self" and self._IsClassType(t, cls):
+      return node.Replace(type=pytd.AnythingType())
+    elif (node.name == "cls" and not self._NameCollision("Type") and
+          isinstance(t, pytd.GenericType) and
+          t.base_type == pytd.NamedType("type") and
+          len(t.parameters) == 1 and self._IsClassType(t.parameters[0], cls)):
+      return node.Replace(type=pytd.AnythingType())
+    else:
+      return node
+
+  def VisitNamedType(self, node):
+    module, _, suffix = node.name.rpartition(".")
+    if module == "__builtin__" and not self._NameCollision(suffix):
+      return pytd.NamedType(suffix)
+    elif isinstance(node, pytd.NamedType):
+      return node
+    else:
+      return pytd.NamedType(node.name)
+
+  def VisitLateType(self, node):
+    return self.VisitNamedType(node)
+
+  def VisitClassType(self, node):
+    return self.VisitNamedType(node)
+
+  def VisitFunctionType(self, unused_node):
+    return pytd.NamedType("typing.Callable")
+
+  def VisitTypeParameter(self, node):
+    return pytd.NamedType(node.name)
+
+  def _VisitSetOfTypes(self, node):
+    """Simplify a union or intersection, see PrintVisitor._FormSetTypeList."""
+    type_list = node.type_list
+    if self._in_parameter:
+      # Import here due to circular import.
+      from pytype.pytd import pep484  # pylint: disable=g-import-not-at-top
+      for compat, name in pep484.COMPAT_ITEMS:
+        printed_names = [
+            ("None" if t.name == "NoneType" else t.name)
+            if isinstance(t, pytd.NamedType) else None for t in type_list]
+        if compat in printed_names and name in printed_names:
+          type_list = tuple(t for t, printed_name in zip(type_list,
+                                                         printed_names)
+                            if printed_name != compat)
+    if len(type_list) == 1:
+      return type_list[0]
+    else:
+      return node.__class__(type_list)
+
+  def VisitUnionType(self, node):
+    return self._VisitSetOfTypes(node)
+
+  def VisitIntersectionType(self, node):
+    return self._VisitSetOfTypes(node)
+
+
 class StripSelf(Visitor):
   """Transforms the tree into one where methods don't have the "self" parameter.
 
@@ -882,6 +1156,9 @@ class DropBuiltinPrefix(Visitor):
 class RenameBuiltinsPrefix(Visitor):
   """Rename 'builtins' to '__builtin__' at import time."""
 
+  # Only transforms leaves.
+  fusable = True
+
   def VisitClassType(self, node):
     if node.name.startswith("builtins."):
       name = "__builtin__." + node.name[len("builtins."):]
@@ -890,7 +1167,10 @@ class RenameBuiltinsPrefix(Visitor):
     return pytd.NamedType(name)
 
   def VisitNamedType(self, node):
-    return self.VisitClassType(node)
+    if node.name.startswith("builtins."):
+      return self.VisitClassType(node)
+    else:
+      return node
 
 
 def LookupClasses(target, global_module=None, ignore_late_types=False):
@@ -943,6 +1223,9 @@ class VerifyLookup(Visitor):
 class LookupBuiltins(Visitor):
   """Look up built-in NamedTypes and give them fully-qualified names."""
 
+  # Only transforms leaves, and only looks up definition names in the unit.
+  fusable = True
+
   def __init__(self, builtins, full_names=True):
     """Create this visitor.
 
@@ -1712,10 +1995,15 @@ class StripExternalNamePrefix(Visitor):
   The prefix needs to be present for AddNamePrefix, and stripped off afterwards.
   """
 
+  # Only transforms leaves.
+  fusable = True
+
   def VisitNamedType(self, node):
-    new_name = utils.strip_prefix(node.name,
-                                  parser_constants.EXTERNAL_NAME_PREFIX)
-    return node.Replace(name=new_name)
+    if node.name.startswith(parser_constants.EXTERNAL_NAME_PREFIX):
+      return node.Replace(name=utils.strip_prefix(
+          node.name, parser_constants.EXTERNAL_NAME_PREFIX))
+    else:
+      return node
 
 
 class AddNamePrefix(Visitor):
@@ -1804,17 +2092,23 @@ class CollectDependencies(Visitor):
   """Visitor for retrieving module names from external types.
 
   Needs to be called on a TypeDeclUnit.
+
+  Attributes:
+    modules: The names of the referenced modules.
+    names: The referenced qualified names, like "foo.Bar".
   """
 
   def __init__(self):
     super(CollectDependencies, self).__init__()
     self.modules = set()
+    self.names = set()
 
   def _ProcessName(self, name):
     module_name, dot, unused_name = name.rpartition(".")
     if dot:
       if module_name:
         self.modules.add(module_name)
+        self.names.add(name)
       else:
         # If we have a relative import that did not get qualified (usually due
         # to an empty package_name), don't insert module_name='' into the
@@ -1848,6 +2142,8 @@ class CollectLateDependencies(Visitor):
 class QualifyRelativeNames(Visitor):
   """Resolve package-relative imports (e.g. from .foo import ...)."""
 
+  fusable = True  # Only renames leaves.
+
   def __init__(self, package_name):
     super(QualifyRelativeNames, self).__init__()
     assert (package_name is not None and
@@ -2053,7 +2349,10 @@ class AdjustTypeParameters(Visitor):
     self.function_typeparams = None
 
   def VisitSignature(self, node):
-    return node.Replace(template=tuple(self.function_typeparams))
+    # Sorted, so that the template doesn't depend on the order of a set.
+    template = sorted(self.function_typeparams,
+                      key=lambda t: (t.name, t.type_param.scope or ""))
+    return node.Replace(template=tuple(template))
 
   def EnterFunction(self, node):
     self.function_name = node.name
@@ -2233,6 +2532,9 @@ class ExpandCompatibleBuiltins(Visitor):
   See https://www.python.org/dev/peps/pep-0484/#the-numeric-tower
   """
 
+  # Only transforms leaves, into unions of builtins that are already resolved.
+  fusable = True
+
   def __init__(self, builtins, python_version):
     super(ExpandCompatibleBuiltins, self).__init__()
     self.in_parameter = False
@@ -2286,6 +2588,13 @@ class ClearClassPointers(Visitor):
     node.cls = None
 
 
+class ClearFunctionPointers(Visitor):
+  """Set .function pointers to 'None'."""
+
+  def EnterFunctionType(self, node):
+    node.function = None
+
+
 class ReplaceWithAnyReferenceVisitor(RemoveTypeParametersFromGenericAny):
   """Replace all references to modules in a list with AnythingType."""
 
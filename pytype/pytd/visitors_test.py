@@ -17,6 +17,7 @@
 import textwrap
 
 
+from pytype.pyi import parser
 from pytype.pytd import pytd
 from pytype.pytd import pytd_utils
 from pytype.pytd import visitors
@@ -1012,6 +1013,35 @@ class TestVisitors(parser_test_base.ParserTest):
 
       def f() -> NoReturn: ..."""))
 
+  def testApplyPrintTransformations(self):
+    ast = self.Parse("""
+      from typing import Any, List, Type, TypeVar
+      T = TypeVar("T", int, float)
+      bytes = ...  # type: __builtin__.bytes
+      class A(List[T]):
+        x = ...  # type: int or float
+        def f(self, x: int or float, y: T, *args: int, **kwargs: Any) -> nothing:
+          x := List[int or float]
+        @classmethod
+        def g(cls: Type[A[T]], *args: int or float) -> __builtin__.bytes: ...
+        @property
+        def h(self) -> T: ...
+        @property
+        def i(self) -> str or unicode: ...
+      class B:
+        def __new__(cls: Type[B]) -> B: ...
+        def __init__(self) -> Any: ...
+    """)
+    ast = ast.Visit(visitors.LookupBuiltins(self.loader.builtins,
+                                            full_names=False))
+    expected = parser.parse_string(pytd.Print(ast), name="foo",
+                                   python_version=self.PYTHON_VERSION)
+    actual = ast.Visit(visitors.ApplyPrintTransformations())
+    actual = actual.Visit(parser.ApplyParseTransformations())
+    actual = parser.post_process_ast(actual, "foo")
+    self.assertMultiLineEqual(pytd.Print(expected), pytd.Print(actual))
+    self.assertTrue(expected.ASTeq(actual))
+
   def testPrintMultilineSignature(self):
     src = textwrap.dedent("""
       def f(x: int, y: str, z: bool) -> list[str]:
@@ -1046,6 +1076,104 @@ class TestVisitors(parser_test_base.ParserTest):
     self.assertEqual(module.module_name, "package.foo")
 
 
+class _Counter(visitors.Visitor):
+  """Records the NamedTypes it sees. Doesn't descend into functions."""
+
+  fusable = True
+
+  def __init__(self, log):
+    super(_Counter, self).__init__()
+    self.log = log
+
+  def EnterFunction(self, _):
+    return False
+
+  def VisitNamedType(self, node):
+    self.log.append(node.name)
+    return node
+
+
+class _Rename(visitors.Visitor):
+  """Appends a suffix to every NamedType."""
+
+  fusable = True
+
+  def __init__(self, suffix):
+    super(_Rename, self).__init__()
+    self.suffix = suffix
+
+  def VisitNamedType(self, node):
+    return node.Replace(name=node.name + self.suffix)
+
+
+class _Tracer(visitors.Visitor):
+  """Records when it enters and visits the TypeDeclUnit."""
+
+  def __init__(self, log, tag, fusable=True):
+    super(_Tracer, self).__init__()
+    self.log = log
+    self.tag = tag
+    self.fusable = fusable
+
+  def EnterTypeDeclUnit(self, _):
+    self.log.append("enter " + self.tag)
+
+  def VisitTypeDeclUnit(self, node):
+    self.log.append("visit " + self.tag)
+    return node
+
+
+class ApplyVisitorsTest(parser_test_base.ParserTest):
+  """Tests for visitors.ApplyVisitors."""
+
+  def _Transforms(self, builtins):
+    return [visitors.QualifyRelativeNames("pkg"),
+            visitors.LookupBuiltins(builtins, full_names=False),
+            visitors.ExpandCompatibleBuiltins(builtins, self.PYTHON_VERSION)]
+
+  def testSameAsSeparatePasses(self):
+    src = textwrap.dedent("""
+      from . import foo
+      from .bar import X
+      x = ...  # type: X
+      def f(x: float, y: foo.Y) -> int: ...
+      class A(object):
+        def g(self, z: bool or str) -> list[float]: ...
+    """)
+    ast = self.Parse(src)
+    expected = ast
+    for visitor in self._Transforms(self.loader.builtins):
+      expected = expected.Visit(visitor)
+    actual = visitors.ApplyVisitors(ast, self._Transforms(self.loader.builtins))
+    self.assertMultiLineEqual(pytd.Print(expected), pytd.Print(actual))
+    self.assertTrue(expected.ASTeq(actual))
+
+  def testOrderAtEachNode(self):
+    ast = self.Parse("x = ...  # type: foo")
+    ast = visitors.ApplyVisitors(ast, [_Rename("1"), _Rename("2")])
+    self.assertEqual("foo12", ast.Lookup("x").type.name)
+
+  def testEnterReturnsFalse(self):
+    src = textwrap.dedent("""
+      x = ...  # type: foo
+      def f(x: bar) -> baz: ...
+    """)
+    log = []
+    ast = visitors.ApplyVisitors(self.Parse(src), [_Counter(log), _Rename("1")])
+    # _Counter skipped the function, but _Rename didn't.
+    self.assertEqual(["foo"], log)
+    self.assertEqual("bar1", ast.Lookup("f").signatures[0].params[0].type.name)
+
+  def testUnfusableVisitor(self):
+    log = []
+    ast = self.Parse("x = ...  # type: foo")
+    visitors.ApplyVisitors(ast, [_Tracer(log, "a"), _Tracer(log, "b"),
+                                 _Tracer(log, "c", fusable=False),
+                                 _Tracer(log, "d")])
+    self.assertEqual(["enter a", "enter b", "visit a", "visit b",
+                      "enter c", "visit c", "enter d", "visit d"], log)
+
+
 class TestAncestorMap(unittest.TestCase):
 
   def testGetAncestorMap(self):
@@ -0,0 +1,372 @@
+"""Run pytype as a long-running server, for thin clients.
+
+Starting pytype, importing its modules and loading the builtins often takes
+longer than analyzing a small file. "pytype --server=SOCKET" pays these costs
+once, and then analyzes files on behalf of "pytype-client", which accepts the
+same arguments as pytype itself.
+
+A request consists of the client's command line and working directory. By
+default, requests are processed one at a time, in the server process. With
+"--workers=N", the server instead forks a worker per request, running up to N
+of them in parallel. Workers start from a copy-on-write snapshot of the warm
+server, including a VM that only needs to be rebound to the request (see
+analyze.prepare_tracer), and the server itself never runs a request, so it stays
+pristine. The response contains whatever the request wrote to stdout and stderr
+(including logging), and its exit status. A negative exit status -N means that
+pytype would have been killed by signal N.
+"""
+
+import contextlib
+import errno
+import logging
+import marshal
+import os
+import select
+import signal
+import socket
+import struct
+import sys
+import traceback
+
+from six import moves
+
+
+log = logging.getLogger(__name__)
+
+
+_LENGTH = struct.Struct("<Q")
+
+
+class RequestTimeout(BaseException):
+  """Raised in the server when a request runs into its --timeout.
+
+  This is a BaseException so that pytype's error recovery doesn't catch it.
+  """
+
+
+def _raise_timeout(unused_signum, unused_frame):
+  raise RequestTimeout()
+
+
+def _send(sock, data):
+  payload = marshal.dumps(data)
+  sock.sendall(_LENGTH.pack(len(payload)) + payload)
+
+
+def _recv_exactly(sock, size):
+  chunks = []
+  while size:
+    chunk = sock.recv(min(size, 1 << 20))
+    if not chunk:
+      raise EOFError("Connection closed")
+    chunks.append(chunk)
+    size -= len(chunk)
+  return b"".join(chunks)
+
+
+def _recv(sock):
+  size, = _LENGTH.unpack(_recv_exactly(sock, _LENGTH.size))
+  return marshal.loads(_recv_exactly(sock, size))
+
+
+@contextlib.contextmanager
+def _captured_output():
+  """Redirect stdout, stderr and logging to stderr into buffers."""
+  stdout, stderr = moves.StringIO(), moves.StringIO()
+  old_stdout, old_stderr = sys.stdout, sys.stderr
+  handlers = [h for h in logging.root.handlers
+              if isinstance(h, logging.StreamHandler)
+              and h.stream is old_stderr]
+  sys.stdout, sys.stderr = stdout, stderr
+  for handler in handlers:
+    handler.stream = stderr
+  try:
+    yield stdout, stderr
+  finally:
+    sys.stdout, sys.stderr = old_stdout, old_stderr
+    for handler in handlers:
+      handler.stream = old_stderr
+
+
+def _exit_status(e):
+  """Convert a SystemExit into an exit status, like the interpreter does."""
+  if e.code is None:
+    return 0
+  elif isinstance(e.code, int):
+    return e.code
+  else:
+    sys.stderr.write("%s\n" % e.code)
+    return 1
+
+
+def process(handler, argv, cwd):
+  """Run the handler for one request.
+
+  Args:
+    handler: The function that processes a request. Called with the request's
+      argv, returns an exit status.
+    argv: The command line of the request.
+    cwd: The working directory of the request.
+
+  Returns:
+    A tuple of stdout, stderr and the exit status.
+  """
+  old_cwd = os.getcwd()
+  old_level = logging.root.level  # pytype sets this from --verbosity
+  old_alarm = signal.signal(signal.SIGALRM, _raise_timeout)
+  try:
+    os.chdir(cwd)
+    with _captured_output() as (stdout, stderr):
+      try:
+        returncode = handler(argv) or 0
+      except SystemExit as e:
+        returncode = _exit_status(e)
+      except RequestTimeout:
+        returncode = -signal.SIGALRM
+      except Exception:  # pylint: disable=broad-except
+        traceback.print_exc()
+        returncode = 1
+  finally:
+    signal.alarm(0)
+    signal.signal(signal.SIGALRM, old_alarm)
+    logging.root.setLevel(old_level)
+    os.chdir(old_cwd)
+  return stdout.getvalue(), stderr.getvalue(), returncode
+
+
+class _Worker(object):
+  """A forked child processing one request."""
+
+  def __init__(self, key, pid, fd):
+    self.key = key
+    self.pid = pid
+    self.fd = fd
+    self.chunks = []
+
+  def result(self, status):
+    """Decode the result the child sent us, given its wait() status."""
+    try:
+      return marshal.loads(b"".join(self.chunks))
+    except (EOFError, ValueError, TypeError):
+      # The child died before it could send a complete result.
+      if os.WIFSIGNALED(status):
+        returncode = -os.WTERMSIG(status)
+        reason = "killed by signal %d" % os.WTERMSIG(status)
+      else:
+        returncode = os.WEXITSTATUS(status) or 1
+        reason = "exit status %d" % os.WEXITSTATUS(status)
+      return "", "pytype worker died (%s)\n" % reason, returncode
+
+
+class WorkerPool(object):
+  """Processes requests in forked children of the current process.
+
+  Every request gets a fresh child, so whatever state the current process has
+  warmed up (loaded modules, parsed builtins) is available to the request
+  without being copied, and nothing a request does can leak into the next one.
+  The child sends its result back over a pipe.
+
+  Attributes:
+    handler: The function that processes a request, see process().
+    max_workers: The maximum number of children running at the same time.
+  """
+
+  def __init__(self, handler, max_workers):
+    assert max_workers > 0
+    self.handler = handler
+    self.max_workers = max_workers
+    self._workers = {}  # Maps pipe fds to _Worker instances.
+
+  def __len__(self):
+    return len(self._workers)
+
+  def full(self):
+    return len(self._workers) >= self.max_workers
+
+  def fds(self):
+    """The file descriptors that become readable as workers make progress."""
+    return list(self._workers)
+
+  def start(self, key, argv, cwd):
+    """Start processing a request in a new child.
+
+    Args:
+      key: Identifies this request in the results of wait().
+      argv: The command line of the request.
+      cwd: The working directory of the request.
+    """
+    assert not self.full()
+    r, w = os.pipe()
+    pid = os.fork()
+    if not pid:
+      # Never return from here: the stack above us belongs to the parent.
+      try:
+        os.close(r)
+        data = marshal.dumps(process(self.handler, argv, cwd))
+        with os.fdopen(w, "wb") as f:
+          f.write(data)
+      finally:
+        os._exit(0)  # pylint: disable=protected-access
+    os.close(w)
+    self._workers[r] = _Worker(key, pid, r)
+
+  def wait(self, timeout=None, fds=()):
+    """Wait for workers to finish.
+
+    Args:
+      timeout: How long to wait, in seconds. None means until at least one
+        worker finishes, or one of "fds" becomes readable.
+      fds: Additional file descriptors that should interrupt the wait.
+
+    Returns:
+      A tuple of a list of (key, (stdout, stderr, exit status)) tuples for the
+      finished workers, and the list of readable fds from "fds".
+    """
+    finished = []
+    while True:
+      try:
+        readable, _, _ = select.select(self.fds() + list(fds), [], [], timeout)
+      except select.error as e:
+        if e.args[0] == errno.EINTR:
+          continue
+        raise
+      ready = []
+      for fd in readable:
+        worker = self._workers.get(fd)
+        if worker is None:
+          ready.append(fd)
+          continue
+        chunk = os.read(fd, 1 << 16)
+        if chunk:
+          worker.chunks.append(chunk)
+        else:
+          os.close(fd)
+          del self._workers[fd]
+          _, status = os.waitpid(worker.pid, 0)
+          finished.append((worker.key, worker.result(status)))
+      if finished or ready or timeout is not None or not self._workers:
+        return finished, ready
+
+  def join(self):
+    """Wait for all workers. Returns a list of (key, result) tuples."""
+    results = []
+    while self._workers:
+      finished, _ = self.wait()
+      results.extend(finished)
+    return results
+
+
+class Server(object):
+  """Serves requests on a Unix socket.
+
+  Attributes:
+    socket_path: The filename of the socket.
+    handler: The function that processes a request. Called with the request's
+      argv, returns an exit status.
+    workers: If nonzero, process up to this many requests in parallel, each in
+      a forked child. Otherwise, process requests one by one, in-process.
+  """
+
+  def __init__(self, socket_path, handler, workers=0):
+    self.socket_path = socket_path
+    self.handler = handler
+    self.workers = workers
+
+  def process(self, argv, cwd):
+    """Run the handler for one request, in-process. See process()."""
+    return process(self.handler, argv, cwd)
+
+  def serve_forever(self):
+    """Accept and process requests until killed."""
+    if not logging.root.handlers:
+      # Make sure logging is bound to our real stderr, so that _captured_output
+      # can redirect it.
+      logging.basicConfig()
+    if os.path.exists(self.socket_path):
+      os.unlink(self.socket_path)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    old_umask = os.umask(0o077)  # Only we may connect.
+    try:
+      sock.bind(self.socket_path)
+    finally:
+      os.umask(old_umask)
+    sock.listen(16)
+    log.info("Listening on %s", self.socket_path)
+    try:
+      if self.workers:
+        self._serve_forked(sock)
+      else:
+        self._serve_inline(sock)
+    finally:
+      sock.close()
+      os.unlink(self.socket_path)
+
+  def _serve_inline(self, sock):
+    while True:
+      conn, _ = sock.accept()
+      try:
+        request = _recv(conn)
+        _respond(conn, self.process(request["argv"], request["cwd"]))
+      except (EOFError, socket.error) as e:
+        log.error("Dropped request: %s", e)
+      finally:
+        conn.close()
+
+  def _serve_forked(self, sock):
+    pool = WorkerPool(self.handler, self.workers)
+    while True:
+      finished, ready = pool.wait(fds=[] if pool.full() else [sock.fileno()])
+      for conn, result in finished:
+        try:
+          _respond(conn, result)
+        except socket.error as e:
+          log.error("Dropped response: %s", e)
+        finally:
+          conn.close()
+      if ready:
+        conn, _ = sock.accept()
+        try:
+          request = _recv(conn)
+        except (EOFError, socket.error) as e:
+          log.error("Dropped request: %s", e)
+          conn.close()
+        else:
+          pool.start(conn, request["argv"], request["cwd"])
+
+
+def _respond(conn, result):
+  stdout, stderr, returncode = result
+  _send(conn, {"stdout": stdout, "stderr": stderr, "returncode": returncode})
+
+
+def request(socket_path, argv, cwd=None):
+  """Send a request to a server.
+
+  Args:
+    socket_path: The filename of the server's socket.
+    argv: The pytype command line to run.
+    cwd: The working directory for the request. Defaults to ours.
+
+  Returns:
+    A tuple of stdout, stderr and the exit status.
+  """
+  sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+  try:
+    sock.connect(socket_path)
+    _send(sock, {"argv": list(argv), "cwd": cwd or os.getcwd()})
+    response = _recv(sock)
+  finally:
+    sock.close()
+  return response["stdout"], response["stderr"], response["returncode"]
+
+
+def run_client(socket_path, argv):
+  """Run a request, behaving as if we were pytype. Returns the exit status."""
+  stdout, stderr, returncode = request(socket_path, argv)
+  sys.stdout.write(stdout)
+  sys.stderr.write(stderr)
+  if returncode < 0:
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os.kill(os.getpid(), -returncode)
+  return returncode
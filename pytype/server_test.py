@@ -0,0 +1,146 @@
+"""Tests for server.py."""
+
+from __future__ import print_function
+
+import os
+import signal
+import sys
+import time
+
+from pytype import server
+from pytype import utils
+
+import unittest
+
+
+def _Echo(argv):
+  print("out: " + " ".join(argv[1:]))
+  print("err: " + os.getcwd(), file=sys.stderr)
+  return len(argv) - 1
+
+
+class ServerTest(unittest.TestCase):
+  """Tests for server.Server."""
+
+  def _Process(self, handler, argv=("pytype",), cwd=None):
+    return server.Server(None, handler).process(list(argv),
+                                                cwd or os.getcwd())
+
+  def testProcess(self):
+    with utils.Tempdir() as d:
+      stdout, stderr, returncode = self._Process(
+          _Echo, ["pytype", "a", "b"], cwd=d.path)
+      self.assertEqual("out: a b\n", stdout)
+      self.assertEqual("err: %s\n" % os.path.realpath(d.path), stderr)
+      self.assertEqual(2, returncode)
+
+  def testSystemExit(self):
+    def Exit(unused_argv):
+      sys.exit("bad usage")
+    self.assertEqual(("", "bad usage\n", 1), self._Process(Exit))
+
+  def testException(self):
+    def Raise(unused_argv):
+      raise ValueError("crash")
+    _, stderr, returncode = self._Process(Raise)
+    self.assertIn("ValueError: crash", stderr)
+    self.assertEqual(1, returncode)
+
+  def testTimeout(self):
+    def Sleep(unused_argv):
+      signal.alarm(1)
+      time.sleep(10)
+    _, _, returncode = self._Process(Sleep)
+    self.assertEqual(-signal.SIGALRM, returncode)
+
+  def testRequest(self):
+    self._TestRequest(workers=0)
+
+  def testRequestWithWorkers(self):
+    self._TestRequest(workers=2)
+
+  def _TestRequest(self, workers):
+    with utils.Tempdir() as d:
+      socket_path = os.path.join(d.path, "socket")
+      pid = os.fork()
+      if not pid:
+        try:
+          server.Server(socket_path, _Echo, workers).serve_forever()
+        finally:
+          os._exit(1)
+      try:
+        for _ in range(100):
+          if os.path.exists(socket_path):
+            break
+          time.sleep(0.05)
+        for args in (["x"], ["y", "z"]):
+          stdout, stderr, returncode = server.request(
+              socket_path, ["pytype"] + args, cwd=d.path)
+          self.assertEqual("out: %s\n" % " ".join(args), stdout)
+          self.assertEqual("err: %s\n" % os.path.realpath(d.path), stderr)
+          self.assertEqual(len(args), returncode)
+      finally:
+        os.kill(pid, signal.SIGKILL)
+        os.waitpid(pid, 0)
+
+
+_state = []
+
+
+def _Mutate(argv):
+  _state.extend(argv[1:])
+  print(len(_state))
+
+
+class WorkerPoolTest(unittest.TestCase):
+  """Tests for server.WorkerPool."""
+
+  def testResults(self):
+    pool = server.WorkerPool(_Echo, max_workers=2)
+    cwd = os.path.realpath(os.getcwd())
+    for i in range(2):
+      pool.start(i, ["pytype"] + ["x"] * i, cwd)
+    self.assertTrue(pool.full())
+    results = dict(pool.join())
+    self.assertEqual({0: ("out: \n", "err: %s\n" % cwd, 0),
+                      1: ("out: x\n", "err: %s\n" % cwd, 1)}, results)
+    self.assertEqual(0, len(pool))
+
+  def testIsolation(self):
+    pool = server.WorkerPool(_Mutate, max_workers=1)
+    for key in ("a", "b"):
+      pool.start(key, ["pytype", key], os.getcwd())
+      self.assertEqual([(key, ("1\n", "", 0))], pool.join())
+    self.assertEqual([], _state)
+
+  def testWorkerDied(self):
+    def Die(unused_argv):
+      os.kill(os.getpid(), signal.SIGKILL)
+    pool = server.WorkerPool(Die, max_workers=1)
+    pool.start(None, ["pytype"], os.getcwd())
+    [(_, (stdout, stderr, returncode))] = pool.join()
+    self.assertEqual("", stdout)
+    self.assertIn("killed by signal", stderr)
+    self.assertEqual(-signal.SIGKILL, returncode)
+
+  def testLargeOutput(self):
+    def Print(unused_argv):
+      sys.stdout.write("x" * 1000000)
+    pool = server.WorkerPool(Print, max_workers=1)
+    pool.start(None, ["pytype"], os.getcwd())
+    [(_, (stdout, _, _))] = pool.join()
+    self.assertEqual(1000000, len(stdout))
+
+  def testWaitTimeout(self):
+    pool = server.WorkerPool(lambda argv: time.sleep(10), max_workers=1)
+    pool.start(None, ["pytype"], os.getcwd())
+    try:
+      self.assertEqual(([], []), pool.wait(timeout=0.01))
+    finally:
+      for pid in [w.pid for w in pool._workers.values()]:
+        os.kill(pid, signal.SIGKILL)
+    pool.join()
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,119 @@
+"""Startup benchmark for the pytype entry point (scripts/pytype).
+
+Every pytype run pays for starting the interpreter and importing the modules
+its mode needs, which in a build with many small actions adds up. These tests
+run every mode in a fresh interpreter until it first uses its loader, i.e.
+until the actual analysis (or parsing) starts, and check which modules it
+imported by then, and how much CPU time it used.
+"""
+
+import json
+import os
+import subprocess
+import sys
+import textwrap
+
+from pytype import utils
+
+import unittest
+
+
+_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(__file__)),
+                       "scripts", "pytype")
+
+# Runs scripts/pytype, and stops it as soon as it uses the loader it created.
+_DRIVER = textwrap.dedent("""\
+    import imp, json, os, sys
+    from pytype import load_pytd
+
+    class Loader(object):
+
+      def __getattr__(self, name):
+        user, system = os.times()[:2]
+        sys.stdout.write(json.dumps({"time": user + system,
+                                     "modules": sorted(sys.modules)}))
+        sys.stdout.flush()
+        os._exit(0)
+
+    load_pytd.create_loader = lambda options: Loader()
+    main = imp.load_source("pytype_main", sys.argv[1])
+    main.main(sys.argv[1:])
+""")
+
+# Modules that only the modes analyzing Python code need.
+_ANALYSIS_MODULES = ["pytype.analyze", "pytype.vm", "pytype.abstract",
+                     "pytype.convert", "pytype.errors"]
+
+# For every mode: its arguments, the modules it must not import, and the budget
+# of CPU time in seconds. We measure CPU time rather than wall time so that the
+# tests don't depend on the load of the machine. The budgets are about three
+# times what the modes take on a typical machine (0.15s to start parsing a pyi
+# file, 0.35s to start analyzing a file), so that they catch a mode that starts
+# importing much more than it needs.
+_MODES = {
+    "parse_pyi": (["--parse-pyi", "{pyi}"],
+                  _ANALYSIS_MODULES + ["pytype.pytd.optimize", "yaml"], 0.5),
+    "generate_builtins": (["--generate-builtins", "{out}"],
+                          _ANALYSIS_MODULES + ["pytype.pytd.optimize", "yaml"],
+                          0.5),
+    "check": (["--check", "{py}"], ["pytype.batch", "pytype.server", "yaml"],
+              1.0),
+    "infer": (["{py}", "--output", "{out}"],
+              ["pytype.batch", "pytype.server", "yaml"], 1.0),
+}
+
+
+def _startup(mode, tempdir):
+  """Run a mode until its analysis starts.
+
+  Args:
+    mode: A key of _MODES.
+    tempdir: A utils.Tempdir for the input and output files.
+
+  Returns:
+    A tuple of the CPU time in seconds and the list of the imported modules.
+  """
+  args, _, _ = _MODES[mode]
+  files = {"py": tempdir.create_file("foo.py", "x = 42\n"),
+           "pyi": tempdir.create_file("foo.pyi", "x = ...  # type: int\n"),
+           "out": os.path.join(tempdir.path, "out")}
+  args = [arg.format(**files) for arg in args]
+  output = subprocess.check_output(
+      [sys.executable, "-c", _DRIVER, _SCRIPT,
+       "--python_version=%d.%d" % sys.version_info[:2]] + args)
+  result = json.loads(output)
+  return result["time"], result["modules"]
+
+
+@unittest.skipUnless(os.path.exists(_SCRIPT), "scripts/pytype not found")
+class StartupTest(unittest.TestCase):
+  """Test the imports and startup times of the pytype modes."""
+
+  def _check(self, mode):
+    _, forbidden, budget = _MODES[mode]
+    with utils.Tempdir() as d:
+      seconds, modules = _startup(mode, d)
+    self.assertFalse(set(forbidden) & set(modules))
+    self.assertLess(seconds, budget)
+    return modules
+
+  def test_parse_pyi(self):
+    self._check("parse_pyi")
+
+  @unittest.skipUnless(
+      os.path.exists(os.path.join(os.path.dirname(__file__), "typeshed",
+                                  "tests", "pytype_blacklist.txt")),
+      "typeshed not found")
+  def test_generate_builtins(self):
+    self._check("generate_builtins")
+
+  def test_check(self):
+    modules = self._check("check")
+    self.assertIn("pytype.analyze", modules)
+
+  def test_infer(self):
+    self._check("infer")
+
+
+if __name__ == "__main__":
+  unittest.main()
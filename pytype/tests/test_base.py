@@ -157,8 +157,11 @@ class BaseTest(unittest.TestCase):
     unit, builtins_pytd = analyze.infer_types(
         deep=deep, analyze_annotated=True, **kwargs)
     unit.Visit(visitors.VerifyVisitor())
-    unit = optimize.Optimize(unit, builtins_pytd, lossy=False, use_abcs=False,
-                             max_union=7, remove_mutable=False)
+    unit = optimize.Optimize(
+        unit, builtins_pytd, lossy=False, use_abcs=False, max_union=7,
+        remove_mutable=False,
+        builtins_hierarchy=kwargs["loader"].get_superclass_hierarchy(),
+        incremental=True)
     return pytd_utils.CanonicalOrdering(unit), kwargs["errorlog"]
 
   def CheckWithErrors(self, code, deep=True, pythonpath=(), python_version=None,
@@ -334,8 +337,11 @@ class BaseTest(unittest.TestCase):
         textwrap.dedent(srccode), pythonpath=pythonpath, deep=deep,
         analyze_annotated=analyze_annotated, module_name=module_name,
         report_errors=report_errors, python_version=python_version, **kwargs)
-    types = optimize.Optimize(types, builtins_pytd, lossy=False, use_abcs=False,
-                              max_union=7, remove_mutable=False)
+    types = optimize.Optimize(
+        types, builtins_pytd, lossy=False, use_abcs=False, max_union=7,
+        remove_mutable=False,
+        builtins_hierarchy=self.loader.get_superclass_hierarchy(),
+        incremental=True)
     types = pytd_utils.CanonicalOrdering(types)
     if pickle:
       return self._Pickle(types, module_name)
@@ -1,5 +1,6 @@
 """Tests for --check."""
 
+from pytype import analyze
 from pytype.tests import test_base
 
 
@@ -182,6 +183,24 @@ class CheckerTest(test_base.BaseTest):
     self.assertErrorLogIs(errorlog, [(4, "not-indexable", r"Generic"),
                                      (6, "not-indexable", r"Generic")])
 
+  def testCheckAndInfer(self):
+    code = """\
+      def f(x):
+        # type: (int) -> str
+        return x.upper()
+      def g():
+        return 42
+    """
+    kwargs = self._SetUpErrorHandling(code, (), None)
+    ty, _ = analyze.check_and_infer_types(**kwargs)
+    expected_errors = [(3, "attribute-error", r"upper.*int")]
+    self.assertErrorLogIs(kwargs["errorlog"], expected_errors)
+    self.assertErrorLogIs(self.CheckWithErrors(code), expected_errors)
+    self.assertTypesMatchPytd(ty, """
+      def f(x: int) -> str
+      def g() -> int
+    """)
+
 
 if __name__ == "__main__":
   test_base.main()
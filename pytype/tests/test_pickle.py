@@ -3,9 +3,11 @@
 
 from pytype import load_pytd
 from pytype import utils
+from pytype.pyi import parser
+from pytype.pytd import pytd_utils
+from pytype.pytd import serialize_ast
 from pytype.pytd import visitors
 from pytype.tests import test_base
-from six.moves import cPickle
 
 
 class PickleTest(test_base.BaseTest):
@@ -13,7 +15,7 @@ class PickleTest(test_base.BaseTest):
 
   def _verifyDeps(self, module, immediate_deps, late_deps):
     if isinstance(module, bytes):
-      data = cPickle.loads(module)
+      data = serialize_ast.LoadAst(module)
       self.assertItemsEqual(data.dependencies, immediate_deps)
       ast = data.ast
     else:
@@ -205,6 +207,43 @@ class PickleTest(test_base.BaseTest):
         bar.f(42)
       """, imports_map={"foo": foo, "bar": bar}, module_name="baz")
 
+  def testExportMatchesPrintAndParse(self):
+    # PrepareForExport used to print the inferred ast and parse the result.
+    # Check that applying the transformations directly gives the same ast.
+    ty = self.Infer("""
+      import collections
+      class A:
+        def __init__(self, x):
+          self.x = x
+        @property
+        def y(self):
+          return [self.x]
+        @classmethod
+        def make(cls, *args, **kwargs):
+          return cls(args)
+        def f(self, x, *args, **kwargs):
+          return x, args, kwargs
+      class B(object):
+        def __new__(cls):
+          return object.__new__(cls)
+        def g(self, x):
+          return x
+      def h(x=None):
+        return x or 3.0
+      def fail():
+        raise ValueError()
+      def str():
+        return collections.OrderedDict()
+    """, deep=True)
+    expected = parser.parse_string(pytd_utils.Print(ty), name="foo",
+                                   python_version=self.PYTHON_VERSION)
+    actual = ty.Visit(visitors.ApplyPrintTransformations())
+    actual = actual.Visit(parser.ApplyParseTransformations())
+    actual = parser.post_process_ast(actual, "foo")
+    self.assertMultiLineEqual(pytd_utils.Print(expected),
+                              pytd_utils.Print(actual))
+    self.assertTrue(expected.ASTeq(actual))
+
 
 if __name__ == "__main__":
   test_base.main()
@@ -4,7 +4,9 @@ import atexit
 import collections
 import contextlib
 import errno
+import fnmatch
 import itertools
+import json
 import os
 import re
 import shutil
@@ -424,6 +426,60 @@ def topological_sort(nodes):
   assert not stack
 
 
+def strongly_connected_components(nodes):
+  """Group the nodes of a dependency graph into cycles, dependencies first.
+
+  Args:
+    nodes: A list of nodes. Each node has an attribute "deps", the set of nodes
+      it depends on, and an attribute "name", which orders the output.
+
+  Returns:
+    A list of lists of nodes. Every list is either a single node, or a set of
+    nodes that depend on each other. No list contains a dependency of an
+    earlier list. E.g. for modules and their imports, the import cycles.
+  """
+  # Tarjan's algorithm, with an explicit stack so that long dependency chains
+  # don't run into the recursion limit.
+  index = {}
+  lowlink = {}
+  stack = []
+  on_stack = set()
+  components = []
+  for root in nodes:
+    if root in index:
+      continue
+    work = [(root, iter(sorted(root.deps, key=lambda n: n.name)))]
+    index[root] = lowlink[root] = len(index)
+    stack.append(root)
+    on_stack.add(root)
+    while work:
+      node, deps = work[-1]
+      for dep in deps:
+        if dep not in index:
+          index[dep] = lowlink[dep] = len(index)
+          stack.append(dep)
+          on_stack.add(dep)
+          work.append((dep, iter(sorted(dep.deps, key=lambda n: n.name))))
+          break
+        elif dep in on_stack:
+          lowlink[node] = min(lowlink[node], index[dep])
+      else:
+        work.pop()
+        if work:
+          parent = work[-1][0]
+          lowlink[parent] = min(lowlink[parent], lowlink[node])
+        if lowlink[node] == index[node]:
+          component = []
+          while True:
+            n = stack.pop()
+            on_stack.remove(n)
+            component.append(n)
+            if n is node:
+              break
+          components.append(sorted(component, key=lambda n: n.name))
+  return components
+
+
 class HashableDict(dict):
   """A dict subclass that can be hashed.
 
@@ -545,17 +601,72 @@ class NoSuchDirectory(Exception):
   pass
 
 
+# The manifest of the data files of a pytype installation, written by setup.py.
+# It has the directories it covers, relative to "pytype/", each with the pattern
+# of the data files in it, and every such data file. Without it, e.g. in a
+# source tree, the file system is searched.
+PYTYPE_FILES_MANIFEST = "pytype_files.json"
+
+
+class _PytypeFiles(object):
+  """The contents of the manifest, see PYTYPE_FILES_MANIFEST."""
+
+  def __init__(self, directories, files):
+    self.directories = tuple((d + "/", pattern) for d, pattern in directories)
+    self.files = frozenset(files)
+
+  def covers(self, path):
+    """Whether the manifest lists the file at path, if there is one."""
+    return any(path.startswith(d) and
+               fnmatch.fnmatch(os.path.basename(path), pattern)
+               for d, pattern in self.directories)
+
+  def covers_directory(self, path):
+    """Whether the manifest lists the data files in a directory ending in /."""
+    return any(path.startswith(d) for d, _ in self.directories)
+
+
+_pytype_files = None
+
+
+def _get_pytype_files():
+  """Load the manifest of pytype's data files.
+
+  Returns:
+    A _PytypeFiles instance, or None if there is no manifest.
+  """
+  global _pytype_files
+  if _pytype_files is None:
+    path = os.path.join(os.path.dirname(__file__), PYTYPE_FILES_MANIFEST)
+    try:
+      with open(path, "r") as fi:
+        manifest = json.load(fi)
+    except IOError:
+      _pytype_files = False
+    else:
+      _pytype_files = _PytypeFiles(manifest["directories"], manifest["files"])
+  return _pytype_files or None
+
+
 def load_pytype_file(filename):
   """Get the contents of a data file from the pytype installation.
 
   Arguments:
-    filename: the path, relative to "pytype/"
+    filename: the path, relative to "pytype/", or absolute
   Returns:
     The contents of the file as a bytestring
   Raises:
     IOError: if file not found
   """
-  path = os.path.join(os.path.dirname(__file__), filename)
+  pytype_dir = os.path.dirname(__file__)
+  path = os.path.join(pytype_dir, filename)
+  pytype_files = _get_pytype_files()
+  if pytype_files:
+    # The manifest has paths relative to "pytype/". An absolute path outside of
+    # it becomes "../...", which the manifest doesn't cover.
+    filename = os.path.relpath(path, pytype_dir)
+    if pytype_files.covers(filename) and filename not in pytype_files.files:
+      raise IOError(errno.ENOENT, os.strerror(errno.ENOENT), path)
   with open(path, "rb") as fi:
     return fi.read()
 
@@ -574,6 +685,16 @@ def list_pytype_files(suffix):
   """
   basedir = os.path.join(os.path.dirname(__file__), suffix)
   assert not suffix.endswith("/")
+  pytype_files = _get_pytype_files()
+  if pytype_files and pytype_files.covers_directory(suffix + "/"):
+    prefix = suffix + "/"
+    filenames = [f[len(prefix):] for f in pytype_files.files
+                 if f.startswith(prefix)]
+    if not filenames:
+      raise NoSuchDirectory(basedir)
+    for filename in sorted(filenames):
+      yield filename
+    return
   loader = globals().get("__loader__", None)
   try:
     # List directory using __loader__.
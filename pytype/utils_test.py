@@ -52,6 +52,14 @@ class Node(object):
     return "Node(%s)" % self.name
 
 
+class GraphNode(object):
+  """A node of a dependency graph, for testing strongly_connected_components."""
+
+  def __init__(self, name):
+    self.name = name
+    self.deps = set()
+
+
 class UtilsTest(unittest.TestCase):
 
   def setUp(self):
@@ -354,6 +362,28 @@ class UtilsTest(unittest.TestCase):
   def testTopologicalSortGetattr(self):
     self.assertEqual(list(utils.topological_sort([1])), [1])
 
+  def testStronglyConnectedComponents(self):
+    nodes = {name: GraphNode(name) for name in "abcxyz"}
+    for name, deps in [("a", "bc"), ("b", "c"), ("x", "y"), ("y", "z"),
+                       ("z", "xc")]:
+      nodes[name].deps = {nodes[d] for d in deps}
+    components = [[n.name for n in c] for c in
+                  utils.strongly_connected_components(
+                      [nodes[name] for name in sorted(nodes)])]
+    self.assertItemsEqual([["a"], ["b"], ["c"], ["x", "y", "z"]], components)
+    order = {c[0]: i for i, c in enumerate(components)}
+    self.assertLess(order["c"], order["b"])
+    self.assertLess(order["b"], order["a"])
+    self.assertLess(order["c"], order["x"])
+
+  def testStronglyConnectedComponentsDeep(self):
+    # Long chains don't run into the recursion limit.
+    nodes = [GraphNode(str(i)) for i in range(5000)]
+    for node, dep in zip(nodes, nodes[1:]):
+      node.deps = {dep}
+    components = utils.strongly_connected_components(nodes)
+    self.assertEqual([[node] for node in reversed(nodes)], components)
+
   def testTempdir(self):
     with utils.Tempdir() as d:
       filename1 = d.create_file("foo.txt")
@@ -669,6 +699,33 @@ class UtilsTest(unittest.TestCase):
     self.assertIn("ctypes.pytd", l)
     self.assertIn("collections.pytd", l)
 
+  def testPytypeFilesManifest(self):
+    pytype_files = utils._pytype_files
+    utils._pytype_files = utils._PytypeFiles(
+        [["pytd/stdlib", "*.pytd"], ["pytd/parse", "*.pytd"]],
+        ["pytd/stdlib/2/ctypes.pytd", "pytd/stdlib/2/x.pytd"])
+    try:
+      self.assertEqual(list(utils.list_pytype_files("pytd/stdlib/2")),
+                       ["ctypes.pytd", "x.pytd"])
+      self.assertRaises(utils.NoSuchDirectory, list,
+                        utils.list_pytype_files("pytd/stdlib/4"))
+      self.assertTrue(utils.load_pytype_file("pytd/stdlib/2/ctypes.pytd"))
+      # Not in the manifest, so the file system isn't asked.
+      self.assertRaises(IOError, utils.load_pytype_file,
+                        "pytd/stdlib/2/collections.pytd")
+      # Not covered by the manifest.
+      self.assertTrue(utils.load_pytype_file("pytd/builtins/2/array.pytd"))
+      # Not covered by the pattern of the directory.
+      self.assertTrue(utils.load_pytype_file("pytd/parse/node.py"))
+      # Absolute paths are checked, too.
+      pytype_dir = os.path.dirname(utils.__file__)
+      self.assertTrue(utils.load_pytype_file(
+          os.path.join(pytype_dir, "pytd/stdlib/2/ctypes.pytd")))
+      self.assertRaises(IOError, utils.load_pytype_file, os.path.join(
+          pytype_dir, "pytd/stdlib/2/collections.pytd"))
+    finally:
+      utils._pytype_files = pytype_files
+
   def testPathToModuleName(self):
     self.assertEqual("x.y.z", utils.path_to_module_name("x/y/z.pyi"))
     self.assertEqual("x.y.z", utils.path_to_module_name("x/y/z.pytd"))
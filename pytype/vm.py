@@ -30,6 +30,7 @@ from pytype import directors
 from pytype import function
 from pytype import load_pytd
 from pytype import matcher
+from pytype import memory_limit as memory_limit_lib
 from pytype import metrics
 from pytype import six_overlay
 from pytype import special_builtins
@@ -129,17 +130,19 @@ class VirtualMachine(object):
                module_name=None,
                generate_unknowns=False,
                analyze_annotated=False,
-               store_all_calls=False):
+               store_all_calls=False,
+               memory_limit=None):
     """Construct a TypegraphVirtualMachine."""
     self.maximum_depth = sys.maxsize
-    self.errorlog = errorlog
-    self.options = options
     self.python_version = options.python_version
-    self.generate_unknowns = generate_unknowns
-    self.analyze_annotated = analyze_annotated
-    self.store_all_calls = store_all_calls
-    self.loader = loader
     self.frames = []  # The call stack of frames.
+    # Memoize which overlays are loaded.
+    self.loaded_overlays = {}
+    self.rebind(errorlog, options, loader,
+                generate_unknowns=generate_unknowns,
+                analyze_annotated=analyze_annotated,
+                store_all_calls=store_all_calls,
+                memory_limit=memory_limit)
     self.functions_with_late_annotations = []
     self.concrete_classes = []
     self.frame = None  # The current frame.
@@ -181,8 +184,29 @@ class VirtualMachine(object):
         "classmethod": special_builtins.ClassMethod(self),
     }
 
-    # Memoize which overlays are loaded.
-    self.loaded_overlays = {}
+  def rebind(self, errorlog, options, loader, generate_unknowns=False,
+             analyze_annotated=False, store_all_calls=False,
+             memory_limit=None):
+    """Set the per-run settings. The arguments are those of the constructor.
+
+    A VM that hasn't run any code yet can be rebound to another run, to reuse
+    its converted builtins. The new loader has to share the builtins and typing
+    ASTs of the old one, and the Python version can't change.
+    """
+    assert options.python_version == self.python_version
+    assert not self.frames
+    self.memory_limit = memory_limit  # A memory_limit.MemoryLimit, or None
+    self.errorlog = errorlog
+    self.options = options
+    self.generate_unknowns = generate_unknowns
+    self.analyze_annotated = analyze_annotated
+    self.store_all_calls = store_all_calls
+    self.loader = loader
+    # Overlays can report errors about their module when they're created, so
+    # only keep the ones the new loader can see, too.
+    self.loaded_overlays = {name: overlay for name, overlay
+                            in self.loaded_overlays.items()
+                            if loader.can_see(name)}
 
   def lookup_builtin(self, name):
     try:
@@ -196,6 +220,27 @@ class VirtualMachine(object):
   def is_at_maximum_depth(self):
     return len(self.frames) > self.maximum_depth
 
+  def set_maximum_depth(self, maximum_depth):
+    """Set the maximum depth (None for unlimited), within the memory limit."""
+    self.maximum_depth = sys.maxsize if maximum_depth is None else maximum_depth
+    if self.memory_limit:
+      self.maximum_depth = self.memory_limit.cap_depth(self.maximum_depth)
+
+  def memory_level_reached(self, level):
+    return bool(self.memory_limit and self.memory_limit.reached(level))
+
+  def degrade(self, level):
+    """Use less memory, after reaching a level of the memory limit.
+
+    See memory_limit.py. Subclasses that keep more state can release some of it
+    here.
+
+    Args:
+      level: The level, e.g. memory_limit.REDUCE_DEPTH.
+    """
+    if level in (memory_limit_lib.REDUCE_DEPTH, memory_limit_lib.STOP_ANALYSIS):
+      self.maximum_depth = self.memory_limit.cap_depth(self.maximum_depth)
+
   def run_instruction(self, op, state):
     """Run a single bytecode instruction.
 
@@ -210,6 +255,9 @@ class VirtualMachine(object):
       subsequent instruction.
     """
     _opcode_counter.inc(op.name)
+    if self.memory_limit:
+      for level in self.memory_limit.check():
+        self.degrade(level)
     self.frame.current_opcode = op
     if log.isEnabledFor(logging.INFO):
       self.log_opcode(op, state)
@@ -656,7 +704,7 @@ class VirtualMachine(object):
     self.director = director
     self.filename = filename
 
-    self.maximum_depth = sys.maxsize if maximum_depth is None else maximum_depth
+    self.set_maximum_depth(maximum_depth)
 
     code = self.compile_src(src, filename=filename)
     visitor = _FindIgnoredTypeComments(self.director.type_comments)
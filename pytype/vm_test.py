@@ -4,6 +4,7 @@ import dis
 import textwrap
 
 
+from pytype import analyze
 from pytype import blocks
 from pytype import compat
 from pytype import config
@@ -11,6 +12,7 @@ from pytype import errors
 from pytype import load_pytd
 from pytype import vm
 from pytype.pyc import pyc
+from pytype.pytd import pytd_utils
 from pytype.tests import test_base
 
 
@@ -175,5 +177,56 @@ class BytecodeTest(test_base.BaseTest):
     self.assertItemsEqual(self.trace_vm.instructions_executed, [0, 1, 5, 6])
 
 
+class PrepareTracerTest(test_base.BaseTest):
+  """Tests for reusing a VM with analyze.prepare_tracer."""
+
+  def setUp(self):
+    self.options = config.Options.create(python_version=self.PYTHON_VERSION,
+                                         python_exe=self.PYTHON_EXE)
+    analyze.prepare_tracer(self.options,
+                           load_pytd.Loader(None, self.PYTHON_VERSION))
+    self.template = analyze._template_tracer  # pylint: disable=protected-access
+
+  def tearDown(self):
+    analyze._template_tracer = None  # pylint: disable=protected-access
+
+  def test_check_types(self):
+    errorlog = errors.ErrorLog()
+    loader = load_pytd.Loader(None, self.PYTHON_VERSION)
+    analyze.check_types(textwrap.dedent("""\
+      from typing import List
+      def f(x):
+        # type: (List[int]) -> str
+        return x
+    """), None, errorlog, self.options, loader)
+    self.assertIs(self.template.errorlog, errorlog)
+    self.assertIs(self.template.loader, loader)
+    self.assertIsNone(analyze._template_tracer)  # pylint: disable=protected-access
+    self.assertEqual([error.name for error in errorlog], ["bad-return-type"])
+
+  def test_infer_types(self):
+    src = textwrap.dedent("""\
+      import typing
+      def f():
+        # type: () -> typing.List[int]
+        return [42]
+      x = f()
+    """)
+    loader = load_pytd.Loader(None, self.PYTHON_VERSION)
+    ast, _ = analyze.infer_types(src, errors.ErrorLog(), self.options, loader)
+    self.assertIs(self.template.loader, loader)
+    expected, _ = analyze.infer_types(
+        src, errors.ErrorLog(), self.options,
+        load_pytd.Loader(None, self.PYTHON_VERSION))
+    self.assertEqual(pytd_utils.Print(ast), pytd_utils.Print(expected))
+
+  def test_other_builtins(self):
+    loader = load_pytd.Loader(None, self.PYTHON_VERSION)
+    loader.builtins = loader.builtins.Replace()  # a copy
+    analyze.infer_types("x = 42", errors.ErrorLog(), self.options, loader,
+                        deep=False)
+    self.assertIsNot(self.template.loader, loader)
+    self.assertIsNone(analyze._template_tracer)  # pylint: disable=protected-access
+
 if __name__ == "__main__":
   test_base.main()
@@ -2,9 +2,11 @@
 
 # pylint: disable=bad-indentation
 
+from distutils.command.build_py import build_py
 from distutils.core import setup, Extension
 
 import glob
+import json
 import os
 
 
@@ -25,14 +27,38 @@ def scan_package_data(path, pattern, check):
     return result
 
 
+# The data files: a directory, the pattern of the files in it, and a pattern
+# that has to match some of them, as a sanity check.
+DATA_FILES = [
+    (['pytd', 'builtins'], '*.py*', ['3', '*.py*']),
+    (['pytd', 'stdlib'], '*.pytd', ['3', 'asyncio', '*.pytd']),
+    (['typeshed'], '*.pyi', ['stdlib', '2', '*.pyi']),
+]
+
+
 def get_builtin_files():
-    builtins = scan_package_data(['pytd', 'builtins'], '*.py*',
-                                 check=['3', '*.py*'])
-    stdlib = scan_package_data(['pytd', 'stdlib'], '*.pytd',
-                               check=['3', 'asyncio', '*.pytd'])
-    typeshed = scan_package_data(['typeshed'], '*.pyi',
-                                 check=['stdlib', '2', '*.pyi'])
-    return builtins + stdlib + typeshed
+    return [f for path, pattern, check in DATA_FILES
+            for f in scan_package_data(path, pattern, check=check)]
+
+
+class build_py_with_manifest(build_py):
+    """Also write the manifest of the data files, see pytype/utils.py."""
+
+    def run(self):
+        build_py.run(self)
+        files = sorted(
+            os.path.relpath(f, 'pytype')
+            for pattern in get_builtin_files()
+            for f in glob.glob(os.path.join('pytype', pattern)))
+        # Only the data files are covered: e.g. typeshed/tests isn't.
+        manifest = {'directories': [['/'.join(path), pattern]
+                                    for path, pattern, _ in DATA_FILES],
+                    'files': files}
+        filename = os.path.join(self.build_lib, 'pytype', 'pytype_files.json')
+        self.announce('writing %s' % filename)
+        if not self.dry_run:
+            with open(filename, 'w') as fi:
+                json.dump(manifest, fi)
 
 
 parser_ext = Extension(
@@ -60,7 +86,8 @@ setup(
               'pytype/pytd/parse',
               'pytype/typegraph',
              ],
-    scripts=['scripts/pytype', 'scripts/pytd'],
+    scripts=['scripts/pytype', 'scripts/pytype-client',
+             'scripts/pytype-imports-map', 'scripts/pytd'],
     package_data={'pytype': get_builtin_files()},
     requires=['pyyaml (>=3.11)', 'six'],
     install_requires=['pyyaml (>=3.11)', 'six'],
@@ -69,4 +96,5 @@ setup(
         'Programming Language :: Python :: 3.6',
     ],
     ext_modules = [parser_ext],
+    cmdclass={'build_py': build_py_with_manifest},
 )